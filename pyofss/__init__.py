@@ -22,18 +22,31 @@
 import numpy as np
 
 # Import simulation modules
-from system import System
+from system import System, build_system
+from network import Network
+from distributed import Coordinator, Worker
+from store import ResultStore
+from ensemble import Ensemble
 from domain import Domain
 
 # Import system modules
 from modules.generator import Generator
 from modules.gaussian import Gaussian
 from modules.sech import Sech
+from modules.noise import QuantumNoise
 from modules.amplifier import Amplifier
 from modules.bit import Bit, Bit_stream
 from modules.fibre import Fibre
 from modules.storage import reduce_to_range
 from modules.filter import Filter
+from modules.condition import PeakPower, SpectralWidth, PeakCount
+from modules.piecewise import Piecewise
+from modules.linear_block import LinearBlock
+from modules.dispersion import TabulatedDispersion, Sellmeier
+from modules.loss import LossSpectrum
+from modules.nonlinearity import TabulatedRaman, GammaSpectrum
+from modules.coupler import Splitter, Combiner, Coupler
+from modules.compensator import DispersionCompensator
 from modules.plotter import *
 
 # Import helper functions
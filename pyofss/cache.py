@@ -0,0 +1,96 @@
+
+"""
+    Copyright (C) 2012  David Bolt
+
+    This file is part of pyofss.
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+
+def make_key(value):
+    """
+    :param object value: Parameter value, such as a list of beta values
+    :return: Hashable equivalent of value
+    :rtype: object
+
+    Lists, tuples and arrays are converted to (nested) tuples. Other objects
+    are returned unchanged, so they are compared by their own hash (identity
+    for most classes).
+    """
+    if isinstance(value, (list, tuple)):
+        return tuple(make_key(element) for element in value)
+    elif isinstance(value, np.ndarray):
+        return ("ndarray", value.shape, value.tostring())
+    else:
+        return value
+
+
+class LRUCache(object):
+    """
+    :param Uint size: Maximum number of stored values
+
+    A dictionary-like cache holding at most size values. Once full, storing
+    a new value discards the least recently used value.
+
+    Access is serialised by a lock, so a cache may be shared by modules
+    running on several threads (see Network).
+    """
+    def __init__(self, size=16):
+        self.size = size
+        self.values = OrderedDict()
+        self.lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        with self.lock:
+            return len(self.values)
+
+    def __contains__(self, key):
+        with self.lock:
+            return key in self.values
+
+    def get(self, key, default=None):
+        """ Return value for key (marking it as recently used), or default. """
+        with self.lock:
+            try:
+                value = self.values.pop(key)
+            except KeyError:
+                self.misses += 1
+                return default
+
+            self.hits += 1
+            self.values[key] = value
+
+            return value
+
+    def __setitem__(self, key, value):
+        with self.lock:
+            self.values.pop(key, None)
+            self.values[key] = value
+
+            while len(self.values) > self.size:
+                self.values.popitem(last=False)
+
+    def clear(self):
+        """ Remove all values. """
+        with self.lock:
+            self.values.clear()
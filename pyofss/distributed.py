@@ -0,0 +1,407 @@
+
+"""
+    Copyright (C) 2012  David Bolt
+
+    This file is part of pyofss.
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import os
+import time
+import socket
+import threading
+import traceback
+import Queue
+import multiprocessing
+from multiprocessing.managers import BaseManager
+
+from cache import LRUCache
+from domain import Domain
+from system import build_system
+
+
+# Define exceptions
+class DistributedError(Exception):
+    pass
+
+
+class JobFailedError(DistributedError):
+    pass
+
+
+# Domains constructed by this process, keyed by Domain.fingerprint. Avoids
+# constructing the grids of a domain again for each job:
+domain_cache = {}
+
+# Systems built by this process, keyed by description (see
+# pyofss.store.description_key). Rerunning a built system reuses the
+# operators cached by its modules (such as linear exponential factors):
+system_cache = LRUCache(8)
+
+
+def cached_domain(parameters):
+    """
+    :param dict parameters: Keyword arguments used to construct a Domain
+    :return: A domain
+    :rtype: object
+
+    Return a previously constructed domain with identical parameters if
+    available, otherwise construct (and store) a new domain.
+    """
+    domain = Domain(**parameters)
+    key = domain.fingerprint()
+
+    if key not in domain_cache:
+        domain_cache[key] = domain
+
+    return domain_cache[key]
+
+
+def run_system(description):
+    """
+    :param dict description: Description of the system (see build_system)
+    :return: Final field, fields at each module exit, and stopped_by
+    :rtype: dict
+
+    Build and run a system from a description. Used as the job function for
+    Coordinator.submit_system.
+
+    A system built for an identical description is run again rather than
+    rebuilt (see system_cache), so repeated jobs start with warm operator
+    caches. Descriptions which cannot be keyed (such as those containing a
+    function) are built for each call. Cached systems are not locked, so
+    run_system must not be called concurrently by threads of one process.
+    """
+    # Imported here, since pyofss.store itself uses run_system:
+    from store import description_key, DescriptionError
+
+    try:
+        key = description_key(description)
+    except DescriptionError:
+        key = None
+
+    system = None if key is None else system_cache.get(key)
+    if system is None:
+        domain = cached_domain(description.get("domain", {}))
+        system = build_system(description, domain)
+        if key is not None:
+            system_cache[key] = system
+
+    system.clear()
+    system.run()
+
+    return {"field": system.field, "fields": system.fields,
+            "stopped_by": system.stopped_by}
+
+
+class JobBoard(object):
+    """
+    Shared state of a Coordinator. Held by the manager server process and
+    accessed by the coordinator and workers through proxies.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pending = Queue.Queue()
+        self.results = Queue.Queue()
+
+        # Map job_id -> (worker_id, job) for jobs taken by a worker:
+        self.assigned = {}
+        # Map worker_id -> time of last contact (server clock):
+        self.last_seen = {}
+        # Map job_id -> number of attempts:
+        self.attempts = {}
+
+        self.closed = False
+
+    def put(self, job):
+        """ Add a job, which is a tuple (job_id, function, args, kwargs). """
+        with self.lock:
+            self.attempts.setdefault(job[0], 0)
+        self.pending.put(job)
+
+    def take(self, worker_id, timeout=1.0):
+        """ Return a job for worker_id, or None if none becomes available. """
+        self.heartbeat(worker_id)
+
+        try:
+            job = self.pending.get(True, timeout)
+        except Queue.Empty:
+            return None
+
+        with self.lock:
+            self.assigned[job[0]] = (worker_id, job)
+            self.attempts[job[0]] += 1
+
+        return job
+
+    def heartbeat(self, worker_id):
+        """ Record that worker_id is alive. """
+        with self.lock:
+            self.last_seen[worker_id] = time.time()
+
+    def complete(self, worker_id, job_id, result, error=None):
+        """ Store the result (or error description) of a finished job. """
+        self.heartbeat(worker_id)
+
+        with self.lock:
+            if self.assigned.pop(job_id, (None,))[0] != worker_id:
+                # Job was already resubmitted after worker was presumed dead:
+                return
+
+        self.results.put((job_id, result, error))
+
+    def reap(self, timeout, retries):
+        """
+        Resubmit jobs held by workers not seen for longer than timeout.
+        Jobs which have already been attempted more than retries times are
+        reported as failed. Return the list of workers presumed dead.
+        """
+        now = time.time()
+        resubmit = []
+
+        with self.lock:
+            dead = [worker_id for (worker_id, seen) in self.last_seen.items()
+                    if now - seen > timeout]
+
+            for worker_id in dead:
+                del self.last_seen[worker_id]
+
+            for (job_id, (worker_id, job)) in self.assigned.items():
+                if worker_id in dead:
+                    del self.assigned[job_id]
+                    resubmit.append(job)
+
+        for job in resubmit:
+            if self.attempts[job[0]] > retries:
+                self.results.put((job[0], None, "Worker died during job"))
+            else:
+                self.pending.put(job)
+
+        return dead
+
+    def get_result(self, timeout=1.0):
+        """ Return a (job_id, result, error) tuple, or None on timeout. """
+        try:
+            return self.results.get(True, timeout)
+        except Queue.Empty:
+            return None
+
+    def close(self):
+        """ Tell workers to finish. """
+        self.closed = True
+
+    def is_closed(self):
+        return self.closed
+
+
+# The JobBoard instance lives in the manager server process:
+job_board = None
+
+
+def get_job_board():
+    """ Return the JobBoard of the current (manager server) process. """
+    global job_board
+    if job_board is None:
+        job_board = JobBoard()
+    return job_board
+
+
+class CoordinatorManager(BaseManager):
+    pass
+
+CoordinatorManager.register("get_job_board", callable=get_job_board)
+
+
+class WorkerManager(BaseManager):
+    pass
+
+WorkerManager.register("get_job_board")
+
+
+def run_worker(address, authkey="pyofss", heartbeat=1.0, max_jobs=None):
+    """ Construct and run a Worker. Suitable as a Process target. """
+    Worker(address, authkey, heartbeat).run(max_jobs)
+
+
+class Coordinator(object):
+    """
+    :param tuple address: (host, port) to listen on. Port 0 uses a free port
+    :param string authkey: Key which workers must use to connect
+    :param double timeout: Time without contact before a worker is presumed
+                           dead. *Unit: s*
+    :param Uint retries: Number of times to resubmit a job whose worker died
+
+    A coordinator serves jobs to workers, which may run on other machines,
+    over TCP. Workers pull jobs, run them, and return results as each job
+    finishes. Jobs held by a worker which stops responding are resubmitted.
+
+    A job consists of a picklable function (defined at module level) with
+    its arguments. Systems themselves cannot be pickled, so systems are
+    submitted as descriptions (see pyofss.system.build_system).
+    """
+    def __init__(self, address=("127.0.0.1", 0), authkey="pyofss",
+                 timeout=30.0, retries=2):
+        self.address = address
+        self.authkey = authkey
+        self.timeout = timeout
+        self.retries = retries
+
+        self.manager = None
+        self.board = None
+        self.processes = []
+
+        self.next_id = 0
+        self.outstanding = set()
+
+    def start(self):
+        """ Start serving jobs. The address is updated with the port used. """
+        self.manager = CoordinatorManager(self.address, self.authkey)
+        self.manager.start()
+        self.address = self.manager.address
+        self.board = self.manager.get_job_board()
+
+    def submit(self, function, *args, **kwargs):
+        """
+        :param object function: Picklable function to call on a worker
+        :return: Job identifier
+        :rtype: Uint
+        """
+        job_id = self.next_id
+        self.next_id += 1
+
+        self.board.put((job_id, function, args, kwargs))
+        self.outstanding.add(job_id)
+
+        return job_id
+
+    def submit_system(self, description):
+        """
+        :param dict description: Description of a system to run
+        :return: Job identifier
+        :rtype: Uint
+        """
+        return self.submit(run_system, description)
+
+    def spawn_workers(self, total_workers=1, heartbeat=1.0):
+        """ Start workers as local processes. """
+        for w in range(total_workers):
+            process = multiprocessing.Process(
+                target=run_worker, args=(self.address, self.authkey,
+                                         heartbeat))
+            process.daemon = True
+            process.start()
+            self.processes.append(process)
+
+    def results(self, poll=1.0):
+        """
+        Generate (job_id, result) tuples as jobs finish, until all submitted
+        jobs are accounted for. For a job which failed (raised an exception,
+        or lost its worker more than retries times) the result is a
+        JobFailedError instance.
+        """
+        while self.outstanding:
+            self.board.reap(self.timeout, self.retries)
+
+            item = self.board.get_result(poll)
+            if item is None:
+                continue
+
+            (job_id, result, error) = item
+            if job_id not in self.outstanding:
+                continue
+            self.outstanding.discard(job_id)
+
+            if error is not None:
+                yield (job_id, JobFailedError(error))
+            else:
+                yield (job_id, result)
+
+    def shutdown(self):
+        """ Stop workers and the server. """
+        if self.board is not None:
+            self.board.close()
+
+        for process in self.processes:
+            process.join(5.0)
+            if process.is_alive():
+                process.terminate()
+        self.processes = []
+
+        if self.manager is not None:
+            self.manager.shutdown()
+            self.manager = None
+            self.board = None
+
+
+class Worker(object):
+    """
+    :param tuple address: (host, port) of the coordinator
+    :param string authkey: Key used by the coordinator
+    :param double heartbeat: Interval between signs of life. *Unit: s*
+
+    A worker pulls jobs from a coordinator and returns their results. A
+    worker is a long-lived process, so systems built for system jobs are
+    kept (see run_system): a job repeating an earlier description reuses
+    the modules, and so the operators cached by them. Module-level caches
+    (Raman responses, Sellmeier models) are shared by all jobs of a worker.
+    """
+    def __init__(self, address, authkey="pyofss", heartbeat=1.0):
+        self.address = address
+        self.authkey = authkey
+        self.heartbeat = heartbeat
+        self.worker_id = "%s:%d" % (socket.gethostname(), os.getpid())
+
+        self.jobs_done = 0
+
+    def run(self, max_jobs=None):
+        """ Run jobs until the coordinator closes (or max_jobs are done). """
+        manager = WorkerManager(self.address, self.authkey)
+        manager.connect()
+        board = manager.get_job_board()
+
+        running = threading.Event()
+        running.set()
+
+        def send_heartbeats():
+            """ Keep the worker alive while a long job is running. """
+            while running.is_set():
+                board.heartbeat(self.worker_id)
+                time.sleep(self.heartbeat)
+
+        thread = threading.Thread(target=send_heartbeats)
+        thread.daemon = True
+        thread.start()
+
+        try:
+            while not board.is_closed():
+                if max_jobs is not None and self.jobs_done >= max_jobs:
+                    break
+
+                job = board.take(self.worker_id, self.heartbeat)
+                if job is None:
+                    continue
+
+                (job_id, function, args, kwargs) = job
+                try:
+                    result = function(*args, **kwargs)
+                except Exception:
+                    board.complete(self.worker_id, job_id, None,
+                                   traceback.format_exc())
+                else:
+                    board.complete(self.worker_id, job_id, result)
+
+                self.jobs_done += 1
+        finally:
+            running.clear()
@@ -241,6 +241,17 @@ class Domain(object):
 
         self.channels = channels
 
+    def fingerprint(self):
+        """
+        :return: Parameters which determine the generated arrays
+        :rtype: tuple
+
+        Domains with equal fingerprints generate identical arrays, so the
+        fingerprint may be used as a key when caching domain-dependent data.
+        """
+        return (self.total_bits, self.samples_per_bit, self.bit_width,
+                self.centre_nu, self.channels)
+
     def __str__(self):
         """
         :return: Information string
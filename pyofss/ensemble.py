@@ -0,0 +1,141 @@
+
+"""
+    Copyright (C) 2012  David Bolt
+
+    This file is part of pyofss.
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import numpy as np
+
+from field import fft
+from modules.noise import QuantumNoise
+
+
+# Define exceptions
+class EnsembleError(Exception):
+    pass
+
+
+class Ensemble(object):
+    """
+    :param object system: System to run for each member of the ensemble
+    :param Uint runs: Number of runs
+    :param string module_name: Module whose output field is used. Uses the
+                               final field if None
+
+    Run a system repeatedly, with each QuantumNoise module of the system
+    using a different run number (so an independent, reproducible noise
+    stream), and accumulate statistics of the output spectra.
+
+    Only running sums are stored: the sum of the spectral amplitudes, and
+    the sum of their squared magnitudes. Memory use is independent of the
+    number of runs. The first-order coherence,
+
+    .. math:: |g_{12}(\omega)| = \\frac{|\langle \\tilde{A}_i^*(\omega)
+              \\tilde{A}_j(\omega) \\rangle_{i \\neq j}|}
+              {\langle |\\tilde{A}(\omega)|^2 \\rangle}
+
+    follows from these sums, since the sum over all pairs i != j of
+    conj(A_i) A_j is |sum A_i|^2 - sum |A_i|^2.
+
+    Arrays are in the same (natural) order as domain.nu.
+    """
+    def __init__(self, system, runs=10, module_name=None):
+        self.system = system
+        self.runs = runs
+        self.module_name = module_name
+
+        self.total = 0
+        self.sum_field = None
+        self.sum_power = None
+
+    def reset(self):
+        """ Discard accumulated statistics. """
+        self.total = 0
+        self.sum_field = None
+        self.sum_power = None
+
+    def run(self, first_run=0):
+        """
+        :param Uint first_run: Run number of the first member
+
+        Run the system runs times, accumulating the output spectra. Members
+        use run numbers first_run, first_run + 1, ..., so further calls may
+        extend the ensemble with new members.
+        """
+        noise_modules = [module for module in self.system.modules
+                         if isinstance(module, QuantumNoise)]
+
+        for run in range(first_run, first_run + self.runs):
+            for module in noise_modules:
+                module.run = run
+
+            self.system.clear()
+            self.system.run()
+
+            if self.module_name is None:
+                field = self.system.field
+            else:
+                field = self.system.fields[self.module_name]
+
+            self.add(field)
+
+    def add(self, field):
+        """
+        :param array_like field: Field in the temporal domain
+
+        Accumulate the spectrum of one member of the ensemble.
+        """
+        # Shift to natural order along the last axis only (as ifftshift for
+        # a single field), allowing a field for each channel:
+        A_nu = np.fft.fftshift(fft(np.asarray(field)), axes=-1)
+        power = np.abs(A_nu) ** 2
+
+        if self.sum_field is None:
+            self.sum_field = A_nu
+            self.sum_power = power
+        else:
+            self.sum_field += A_nu
+            self.sum_power += power
+
+        self.total += 1
+
+    def mean_spectrum(self):
+        """
+        :return: Mean spectral power
+        :rtype: double array
+        """
+        return self.sum_power / self.total
+
+    def coherence(self):
+        """
+        :return: Modulus of the first-order coherence, :math:`|g_{12}|`
+        :rtype: double array
+
+        Requires at least two members. Coherence is zero where there is no
+        spectral power.
+        """
+        if self.total < 2:
+            raise EnsembleError("Require at least two runs for coherence")
+
+        pairs = np.abs(self.sum_field) ** 2 - self.sum_power
+        denominator = (self.total - 1) * self.sum_power
+
+        g_12 = np.zeros(np.shape(self.sum_power))
+        nonzero = denominator > 0.0
+        g_12[nonzero] = np.abs(pairs[nonzero]) / denominator[nonzero]
+
+        return g_12
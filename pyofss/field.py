@@ -122,6 +122,37 @@ def ifft(A_nu):
     return scipy.fftpack.fft(A_nu)
 
 
+def rfft(x_t):
+    """
+    :param array_like x_t: Real-valued array in the temporal domain
+    :return: Non-negative frequency half of the spectrum
+    :rtype: array_like
+
+    Real-to-complex transform, for real arrays such as the intensity.
+    *Note: Uses the numpy sign convention, so is intended for convolutions
+    (paired with irfft), where the sign convention cancels.*
+    """
+    global fft_counter
+    fft_counter += 1
+
+    return np.fft.rfft(x_t)
+
+
+def irfft(x_nu, n):
+    """
+    :param array_like x_nu: Non-negative frequency half of a spectrum
+    :param Uint n: Length of the (real) output array
+    :return: Real-valued array in the temporal domain
+    :rtype: array_like
+
+    Complex-to-real inverse of rfft.
+    """
+    global fft_counter
+    fft_counter += 1
+
+    return np.fft.irfft(x_nu, n)
+
+
 def ifftshift(A_nu):
     """
     :param array_like A_nu: Input field array in the spectral domain
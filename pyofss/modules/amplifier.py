@@ -50,9 +50,7 @@ class Amplifier(object):
         self.field = fft(field)
 
         if self.gain is not None:
-            # Calculate linear gain from logarithmic gain (G_dB -> G_linear)
-            G = power(10, 0.1 * self.gain)
-            sqrt_G = sqrt(G)
+            sqrt_G = self.linear_transfer(domain)
 
             if domain.channels > 1:
                 self.field[0] *= sqrt_G
@@ -65,3 +63,24 @@ class Amplifier(object):
 
         # convert field back to temporal domain:
         return ifft(self.field)
+
+    def transfer_key(self):
+        """ Return a key of the parameters determining linear_transfer. """
+        return self.gain
+
+    def linear_transfer(self, domain):
+        """
+        :param object domain: A domain
+        :return: Field gain factor
+        :rtype: double
+
+        Return the (frequency-independent) field transfer function of the
+        amplifier. This is the square root of the linear power gain.
+        """
+        if self.gain is None:
+            return 1.0
+
+        # Calculate linear gain from logarithmic gain (G_dB -> G_linear)
+        G = power(10, 0.1 * self.gain)
+
+        return sqrt(G)
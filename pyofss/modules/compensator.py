@@ -0,0 +1,172 @@
+
+"""
+    Copyright (C) 2012  David Bolt
+
+    This file is part of pyofss.
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import numpy as np
+
+from pyofss.field import fft, ifft, fftshift
+from pyofss.cache import LRUCache, make_key
+
+from linearity import Linearity
+from piecewise import Piecewise
+
+
+# Define exceptions
+class CompensatorError(Exception):
+    pass
+
+
+class UnsupportedFibreError(CompensatorError):
+    pass
+
+
+def fibre_segments(fibre):
+    """
+    :param object fibre: A fibre module
+    :return: List of (length, beta, centre_omega) tuples, one per segment
+    :rtype: array_like
+
+    A fibre with constant dispersion has a single segment. A fibre with
+    Piecewise dispersion has one segment per piece within its length.
+    """
+    beta = fibre.profiles.get("beta", fibre.linearity.beta)
+    centre_omega = fibre.linearity.centre_omega
+
+    if not callable(beta) or hasattr(beta, "generate"):
+        return [(fibre.length, beta, centre_omega)]
+
+    if not isinstance(beta, Piecewise):
+        raise UnsupportedFibreError(
+            "Cannot compensate %s: dispersion varies continuously with z"
+            % fibre.name)
+
+    edges = [0.0] + [b for b in beta.boundaries if 0.0 < b < fibre.length] + \
+        [fibre.length]
+
+    return [(z_2 - z_1, beta(0.5 * (z_1 + z_2)), centre_omega)
+            for (z_1, z_2) in zip(edges[:-1], edges[1:])]
+
+
+class DispersionCompensator(object):
+    """
+    :param string name: Name of this module
+    :param object beta: Spectral phase coefficients, or tabulated data
+    :param array_like fibres: Fibres whose dispersion should be compensated
+    :param double fraction: Fraction of fibre dispersion to compensate
+    :param double centre_omega: Angular frequency used for dispersion
+
+    An ideal (lossless, nonlinearity-free) element which applies the spectral
+    phase
+
+    .. math:: \phi(\Delta\omega) = \sum_n \\beta_n \Delta\omega^n / n! -
+              f \sum_i L_i \\beta_i(\Delta\omega)
+
+    in a single multiplication. beta takes the same form as for Linearity,
+    but each term is accumulated rather than per unit length
+    (*Unit:* :math:`ps^n`). The second term compensates fraction f of the
+    dispersion accumulated by fibres, each of length L_i. It is recalculated
+    if the fibre parameters change.
+
+    The transfer function is cached for each domain, so repeated calls (for
+    example within a loop) need no further exponentials.
+    """
+    def __init__(self, name="compensator", beta=None, fibres=None,
+                 fraction=1.0, centre_omega=None):
+        self.name = name
+        self.beta = beta
+        self.fibres = fibres if (fibres is not None) else []
+        self.fraction = fraction
+        self.centre_omega = centre_omega
+
+        self.cache = LRUCache(4)
+        self.field = None
+
+    def __call__(self, domain, field):
+        """
+        :param object domain: A domain
+        :param object field: Current field
+        :return: Field after applying the spectral phase
+        :rtype: Object
+        """
+        self.field = fft(field)
+        self.field *= self.linear_transfer(domain)
+
+        return ifft(self.field)
+
+    def segments(self):
+        """ Return segments (see fibre_segments) of all fibres. """
+        segments = []
+        for fibre in self.fibres:
+            segments.extend(fibre_segments(fibre))
+
+        return segments
+
+    def transfer_key(self):
+        """ Return a key of the parameters determining linear_transfer. """
+        return (make_key(self.beta), make_key(self.segments()),
+                self.fraction, self.centre_omega)
+
+    def linear_transfer(self, domain):
+        """
+        :param object domain: A domain
+        :return: Spectral transfer function in fft order
+        :rtype: Cvector
+        """
+        key = (domain.fingerprint(), self.transfer_key())
+
+        transfer = self.cache.get(key)
+        if transfer is None:
+            segments = self.segments()
+            transfer = np.exp(1j * fftshift(self.phase(domain, segments)))
+            self.cache[key] = transfer
+
+        return transfer
+
+    def phase(self, domain, segments):
+        """
+        :param object domain: A domain
+        :param array_like segments: List of fibre segments to compensate
+        :return: Spectral phase (in natural order)
+        :rtype: double array
+        """
+        if self.centre_omega is None:
+            centre_omega = domain.centre_omega
+        else:
+            centre_omega = self.centre_omega
+        Domega = domain.omega - centre_omega
+
+        phase = np.zeros(domain.total_samples)
+
+        if self.beta is not None:
+            phase += Linearity.dispersion_terms(self.beta, domain,
+                                                centre_omega, Domega)
+
+        for (length, beta, fibre_centre_omega) in segments:
+            if beta is None:
+                continue
+
+            # Use the same frequency offset as the fibre itself:
+            if fibre_centre_omega is None:
+                fibre_centre_omega = domain.centre_omega
+
+            phase -= self.fraction * length * Linearity.dispersion_terms(
+                beta, domain, fibre_centre_omega,
+                domain.omega - fibre_centre_omega)
+
+        return phase
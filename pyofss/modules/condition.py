@@ -0,0 +1,104 @@
+
+"""
+    Copyright (C) 2012  David Bolt
+
+    This file is part of pyofss.
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import numpy as np
+
+from pyofss.field import temporal_power, spectral_power
+
+
+class PeakPower(object):
+    """
+    :param double threshold: Peak power at which to stop. *Unit: W*
+
+    Stop condition met once the temporal peak power reaches threshold.
+    """
+    def __init__(self, threshold):
+        self.threshold = threshold
+
+    def key(self):
+        """ Return the parameters identifying the condition. """
+        return (self.__class__.__name__, self.threshold)
+
+    def __call__(self, z, A):
+        return np.max(temporal_power(A)) >= self.threshold
+
+    def __str__(self):
+        return "peak power >= {0:f} W".format(self.threshold)
+
+
+class SpectralWidth(object):
+    """
+    :param object domain: A domain, providing the spectral array
+    :param double threshold: RMS spectral width at which to stop. *Unit: THz*
+
+    Stop condition met once the RMS spectral width reaches threshold.
+    """
+    def __init__(self, domain, threshold):
+        self.nu = domain.nu
+        self.threshold = threshold
+
+    def key(self):
+        """ Return the parameters identifying the condition. """
+        return (self.__class__.__name__, self.nu, self.threshold)
+
+    def __call__(self, z, A):
+        P_nu = spectral_power(A)
+        energy = np.sum(P_nu)
+
+        if energy == 0.0:
+            return False
+
+        mean_nu = np.sum(self.nu * P_nu) / energy
+        variance = np.sum((self.nu - mean_nu) ** 2 * P_nu) / energy
+
+        return np.sqrt(variance) >= self.threshold
+
+    def __str__(self):
+        return "spectral width >= {0:f} THz".format(self.threshold)
+
+
+class PeakCount(object):
+    """
+    :param Uint count: Number of temporal peaks at which to stop
+    :param double fraction: Minimum peak power, relative to the maximum
+
+    Stop condition met once the temporal power contains at least count local
+    maxima above fraction of the maximum power. Useful to detect the splitting
+    of a pulse, such as soliton fission.
+    """
+    def __init__(self, count=2, fraction=0.1):
+        self.count = count
+        self.fraction = fraction
+
+    def key(self):
+        """ Return the parameters identifying the condition. """
+        return (self.__class__.__name__, self.count, self.fraction)
+
+    def __call__(self, z, A):
+        P = temporal_power(A)
+        threshold = self.fraction * np.max(P)
+
+        peaks = (P[1:-1] > P[:-2]) & (P[1:-1] >= P[2:]) & \
+            (P[1:-1] > threshold)
+
+        return np.sum(peaks) >= self.count
+
+    def __str__(self):
+        return "peak count >= {0:d}".format(self.count)
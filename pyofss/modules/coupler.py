@@ -0,0 +1,119 @@
+
+"""
+    Copyright (C) 2012  David Bolt
+
+    This file is part of pyofss.
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import numpy as np
+from scipy import sqrt
+
+
+# Define exceptions
+class CouplerError(Exception):
+    pass
+
+
+class OutOfRangeError(CouplerError):
+    pass
+
+
+class Splitter(object):
+    """
+    :param string name: Name of this module
+    :param array_like ratios: Fraction of input power sent to each output
+
+    Split one field into several fields. Intended for use within a Network,
+    where each output port may feed a separate branch.
+    """
+    def __init__(self, name="splitter", ratios=(0.5, 0.5)):
+
+        if len(ratios) < 2:
+            raise OutOfRangeError("Require at least two output ratios")
+
+        if min(ratios) < 0.0:
+            raise OutOfRangeError("ratios must not be negative")
+
+        if not (sum(ratios) <= 1.0 + 1e-12):
+            raise OutOfRangeError("ratios must not sum to more than 1.0")
+
+        self.name = name
+        self.ratios = ratios
+
+    def __call__(self, domain, field):
+        """
+        :param object domain: A domain
+        :param object field: Current field
+        :return: One field per output port
+        :rtype: Tuple
+        """
+        field = np.asarray(field)
+
+        return tuple(sqrt(ratio) * field for ratio in self.ratios)
+
+
+class Combiner(object):
+    """
+    :param string name: Name of this module
+
+    Combine several fields into one by adding their complex amplitudes.
+    """
+    def __init__(self, name="combiner"):
+        self.name = name
+
+    def __call__(self, domain, *fields):
+        """
+        :param object domain: A domain
+        :param object fields: Fields arriving at each input port
+        :return: Sum of all input fields
+        :rtype: Object
+        """
+        return sum(np.asarray(field) for field in fields)
+
+
+class Coupler(object):
+    """
+    :param string name: Name of this module
+    :param double kappa: Fraction of power coupled across to the other port
+
+    Ideal lossless 2x2 directional coupler. The cross-coupled field acquires
+    a phase shift of pi / 2.
+    """
+    def __init__(self, name="coupler", kappa=0.5):
+
+        if not (0.0 <= kappa <= 1.0):
+            raise OutOfRangeError(
+                "kappa is out of range. Must be in [0.0, 1.0]")
+
+        self.name = name
+        self.kappa = kappa
+
+    def __call__(self, domain, field_1, field_2):
+        """
+        :param object domain: A domain
+        :param object field_1: Field at first input port
+        :param object field_2: Field at second input port
+        :return: Fields at the two output ports
+        :rtype: Tuple
+        """
+        through = sqrt(1.0 - self.kappa)
+        cross = 1j * sqrt(self.kappa)
+
+        field_1 = np.asarray(field_1)
+        field_2 = np.asarray(field_2)
+
+        return (through * field_1 + cross * field_2,
+                cross * field_1 + through * field_2)
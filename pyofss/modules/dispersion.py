@@ -0,0 +1,352 @@
+
+"""
+    Copyright (C) 2012  David Bolt
+
+    This file is part of pyofss.
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import numpy as np
+from scipy.interpolate import InterpolatedUnivariateSpline
+from scipy.integrate import cumtrapz
+
+from pyofss.domain import Domain, nu_to_omega, lambda_to_omega
+from pyofss.cache import LRUCache
+
+
+# Define exceptions
+class DispersionError(Exception):
+    pass
+
+
+class UnknownTypeError(DispersionError):
+    pass
+
+
+# Dispersion generated by material models, keyed by model, domain, and centre
+# frequency. Shared by all fibres, so sweeps reuse the same arrays:
+model_cache = LRUCache(32)
+
+
+class TabulatedDispersion(object):
+    """
+    :param array_like x: Tabulated spectral values
+    :param array_like y: Tabulated dispersion values
+    :param string x_type: Type of x values: "omega", "nu", or "lambda"
+    :param string y_type: Type of y values: "beta", "beta_2", or "D"
+
+    Units of x: omega -- *rad / ps*; nu -- *THz*; lambda -- *nm*.
+
+    Units of y: beta -- *rad / km*; beta_2 -- :math:`ps^2 / km`;
+    D -- :math:`ps / (nm \cdot km)`.
+
+    Measured dispersion may be passed to Linearity (or Fibre) in place of a
+    list of beta values. The table is interpolated onto the spectral grid of
+    a domain and cached, so interpolation is repeated only if the domain (or
+    centre frequency) changes.
+
+    The generated dispersion is relative to the centre frequency: both the
+    propagation constant and the group delay at the centre frequency are
+    removed, in the same way as a list of beta values starting [0.0, 0.0].
+    Outside the table, beta_2 is held at its end values; a tabulated beta is
+    extrapolated by its interpolating spline.
+    """
+    x_types = ("omega", "nu", "lambda")
+    y_types = ("beta", "beta_2", "D")
+
+    def __init__(self, x, y, x_type="omega", y_type="beta_2"):
+        if x_type not in self.x_types:
+            raise UnknownTypeError(
+                "x_type must be one of %s" % ", ".join(self.x_types))
+
+        if y_type not in self.y_types:
+            raise UnknownTypeError(
+                "y_type must be one of %s" % ", ".join(self.y_types))
+
+        x = np.asarray(x, dtype=float)
+        y = np.asarray(y, dtype=float)
+
+        if x_type == "nu":
+            omega = nu_to_omega(x)
+        elif x_type == "lambda":
+            omega = lambda_to_omega(x)
+        else:
+            omega = x
+
+        if y_type == "D":
+            # Convert D(lambda) to beta_2, using the same relation as
+            # convert_dispersion_to_physical:
+            Lambda = 2.0 * np.pi * Domain.vacuum_light_speed / omega
+            y = -y * Lambda ** 2 / (2.0 * np.pi * Domain.vacuum_light_speed)
+            y_type = "beta_2"
+
+        # Splines require increasing x values:
+        order = np.argsort(omega)
+        self.omega = omega[order]
+        self.values = y[order]
+        self.order = 0 if (y_type == "beta") else 2
+
+        if self.order == 0:
+            self.spline = InterpolatedUnivariateSpline(self.omega,
+                                                       self.values, ext=0)
+        else:
+            self.spline = InterpolatedUnivariateSpline(self.omega,
+                                                       self.values, ext=3)
+
+        self.cache = LRUCache(4)
+
+    def key(self):
+        """ Return the tabulated values identifying the dispersion. """
+        return (self.__class__.__name__, self.omega, self.values, self.order)
+
+    @classmethod
+    def from_file(cls, filename, x_type="lambda", y_type="D", **kwargs):
+        """
+        :param string filename: Text file with x values then y values columns
+        :param string x_type: Type of x values: "omega", "nu", or "lambda"
+        :param string y_type: Type of y values: "beta", "beta_2", or "D"
+        :return: Tabulated dispersion
+        :rtype: object
+
+        Remaining keyword arguments are passed to numpy.loadtxt.
+        """
+        data = np.loadtxt(filename, unpack=True, **kwargs)
+
+        return cls(data[0], data[1], x_type, y_type)
+
+    def generate(self, domain, centre_omega=None):
+        """
+        :param object domain: A domain
+        :param double centre_omega: Angular frequency of the frame. Uses the
+                                    domain centre_omega if None
+        :return: Dispersion, beta(omega), on the spectral grid of domain
+        :rtype: double array
+
+        The array is in the same (natural) order as domain.omega.
+        """
+        if centre_omega is None:
+            centre_omega = domain.centre_omega
+
+        key = (domain.fingerprint(), centre_omega)
+        terms = self.cache.get(key)
+
+        if terms is None:
+            terms = self.calculate(domain.omega, centre_omega)
+            self.cache[key] = terms
+
+        return terms
+
+    def calculate(self, omega, centre_omega):
+        """ Interpolate dispersion onto (increasing) values of omega. """
+        Domega = omega - centre_omega
+
+        if self.order == 0:
+            beta = self.spline(omega)
+            beta_0 = self.spline(centre_omega)
+            beta_1 = self.spline.derivative()(centre_omega)
+        else:
+            # Integrate beta_2 twice on the grid, then remove the value and
+            # slope at the centre frequency:
+            beta_2 = self.spline(omega)
+            beta_1_grid = cumtrapz(beta_2, omega, initial=0.0)
+            beta = cumtrapz(beta_1_grid, omega, initial=0.0)
+
+            beta_0 = np.interp(centre_omega, omega, beta)
+            beta_1 = np.interp(centre_omega, omega, beta_1_grid)
+
+        return beta - beta_0 - beta_1 * Domega
+
+
+class Sellmeier(object):
+    """
+    :param array_like B: Sellmeier oscillator strengths
+    :param array_like C: Sellmeier resonance wavelengths. *Unit:* :math:`\mu m`
+    :param object waveguide: Effective index change due to the waveguide
+
+    Material dispersion given by the Sellmeier equation,
+
+    .. math:: n^2(\lambda) = 1 + \sum_i B_i \lambda^2 / (\lambda^2 - C_i^2)
+
+    with default coefficients for fused silica (Malitson, 1965). The
+    propagation constant is calculated exactly on the spectral grid as
+    :math:`\\beta(\omega) = n_{eff}(\omega) \omega / c`, where
+    :math:`n_{eff} = n + \Delta n`. waveguide is either a constant, or a
+    function of wavelength (*Unit: nm*) returning :math:`\Delta n`.
+
+    May be passed to Linearity (or Fibre) in place of a list of beta values.
+    As with TabulatedDispersion, beta(omega_0) and the group delay at the
+    centre frequency are removed. The group delay uses the analytic
+    derivative of the Sellmeier sum. Generated arrays are cached for each
+    (model, domain) pair in model_cache.
+
+    The model is valid over the band of frequencies around the centre
+    frequency where :math:`n^2 > 0` (and omega > 0). A wide grid may extend
+    beyond this band, for example past the infrared resonance of silica
+    near 9.9 :math:`\mu m`, where :math:`n^2 < 0`. Outside the band, beta
+    is held at its value on the edge of the band. A centre frequency
+    outside the band raises DispersionError.
+    """
+    fused_silica_B = (0.6961663, 0.4079426, 0.8974794)
+    fused_silica_C = (0.0684043, 0.1162414, 9.896161)
+
+    def __init__(self, B=fused_silica_B, C=fused_silica_C, waveguide=None):
+        if len(B) != len(C):
+            raise DispersionError("Require the same number of B and C values")
+
+        self.B = tuple(B)
+        self.C = tuple(C)
+        self.waveguide = waveguide
+
+    def key(self):
+        """ Return a hashable key identifying the model. """
+        return (self.__class__.__name__, self.B, self.C, self.waveguide)
+
+    def index_square(self, omega):
+        """
+        :param double omega: Angular frequency. *Unit: rad / ps*
+        :return: Square of the material refractive index, :math:`n^2`
+        :rtype: double
+        """
+        Lambda = lambda_to_omega(omega)  # nm (conversion is an involution)
+        Lambda_square = (1.0e-3 * Lambda) ** 2  # um^2
+
+        n_square = 1.0
+        for (B, C) in zip(self.B, self.C):
+            n_square += B * Lambda_square / (Lambda_square - C ** 2)
+
+        return n_square
+
+    def waveguide_index(self, Lambda):
+        """ Return the waveguide index change at wavelength Lambda (nm). """
+        if self.waveguide is None:
+            return 0.0
+        elif callable(self.waveguide):
+            return self.waveguide(Lambda)
+        else:
+            return self.waveguide
+
+    def refractive_index(self, omega):
+        """
+        :param double omega: Angular frequency. *Unit: rad / ps*
+        :return: Effective refractive index
+        :rtype: double
+        """
+        Lambda = lambda_to_omega(omega)  # nm (conversion is an involution)
+
+        return np.sqrt(self.index_square(omega)) + \
+            self.waveguide_index(Lambda)
+
+    def group_index(self, omega):
+        """
+        :param double omega: Angular frequency. *Unit: rad / ps*
+        :return: Effective group index, :math:`n - \lambda dn / d\lambda`
+        :rtype: double
+        """
+        Lambda = lambda_to_omega(omega)  # nm
+        Lambda_square = (1.0e-3 * Lambda) ** 2  # um^2
+        n = np.sqrt(self.index_square(omega))
+
+        # Analytic derivative of the Sellmeier sum,
+        # lambda d(n^2) / dlambda = -2 sum B C^2 lambda^2 / (lambda^2 - C^2)^2:
+        Lambda_dn_square = 0.0
+        for (B, C) in zip(self.B, self.C):
+            Lambda_dn_square -= 2.0 * B * C ** 2 * Lambda_square / \
+                (Lambda_square - C ** 2) ** 2
+        n_group = n - Lambda_dn_square / (2.0 * n)
+
+        if callable(self.waveguide):
+            # Central difference of the (smooth) waveguide contribution:
+            delta = 1.0e-6 * Lambda
+            dn_dLambda = (self.waveguide(Lambda + delta) -
+                          self.waveguide(Lambda - delta)) / (2.0 * delta)
+            return n_group + self.waveguide(Lambda) - Lambda * dn_dLambda
+        else:
+            return n_group + self.waveguide_index(Lambda)
+
+    def propagation_constant(self, omega):
+        """
+        :param double omega: Angular frequency. *Unit: rad / ps*
+        :return: Propagation constant. *Unit: rad / km*
+        :rtype: double
+        """
+        # Factor 1.0e12 converts from rad / nm to rad / km:
+        return 1.0e12 * self.refractive_index(omega) * omega / \
+            Domain.vacuum_light_speed
+
+    def generate(self, domain, centre_omega=None):
+        """
+        :param object domain: A domain
+        :param double centre_omega: Angular frequency of the frame. Uses the
+                                    domain centre_omega if None
+        :return: Dispersion, beta(omega), on the spectral grid of domain
+        :rtype: double array
+        """
+        if centre_omega is None:
+            centre_omega = domain.centre_omega
+
+        key = (self.key(), domain.fingerprint(), centre_omega)
+        terms = model_cache.get(key)
+
+        if terms is None:
+            terms = self.calculate(domain.omega, centre_omega)
+            model_cache[key] = terms
+
+        return terms
+
+    def valid_band(self, omega, centre_omega):
+        """
+        :param double array omega: Increasing angular frequencies
+        :param double centre_omega: Angular frequency of the frame
+        :return: Indices (first, last + 1) of the band containing centre_omega
+        :rtype: tuple
+
+        The band is the run of frequencies around centre_omega for which the
+        model is valid (omega > 0 and n^2 > 0).
+        """
+        if not (centre_omega > 0.0 and self.index_square(centre_omega) > 0.0):
+            raise DispersionError(
+                "Sellmeier model is not valid at the centre frequency")
+
+        valid = np.zeros(len(omega), dtype=bool)
+        positive = omega > 0.0
+        valid[positive] = self.index_square(omega[positive]) > 0.0
+
+        centre = np.searchsorted(omega, centre_omega)
+        invalid = np.flatnonzero(~valid)
+
+        first = invalid[invalid < centre]
+        last = invalid[invalid >= centre]
+        first = first[-1] + 1 if len(first) else 0
+        last = last[0] if len(last) else len(omega)
+
+        return (first, last)
+
+    def calculate(self, omega, centre_omega):
+        """ Calculate dispersion relative to (increasing) values of omega. """
+        (first, last) = self.valid_band(omega, centre_omega)
+
+        Domega = omega - centre_omega
+        beta_0 = self.propagation_constant(centre_omega)
+        beta_1 = 1.0e12 * self.group_index(centre_omega) / \
+            Domain.vacuum_light_speed
+
+        # Evaluate within the valid band only, holding end values outside:
+        beta = np.empty(len(omega))
+        beta[first:last] = self.propagation_constant(omega[first:last]) - \
+            beta_0 - beta_1 * Domega[first:last]
+        beta[:first] = beta[first]
+        beta[last:] = beta[last - 1]
+
+        return beta
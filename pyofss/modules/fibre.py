@@ -18,9 +18,15 @@
     along with this program.  If not, see <http://www.gnu.org/licenses/>.
 """
 
+import numpy as np
+
+from pyofss.field import fft, ifft, fftshift
+from pyofss.cache import make_key
+
 from linearity import Linearity
 from nonlinearity import Nonlinearity
 from stepper import Stepper
+from piecewise import Piecewise
 
 
 class Fibre(object):
@@ -29,7 +35,7 @@ class Fibre(object):
     :param double length: Length of fibre
     :param object alpha: Attenuation of fibre
     :param object beta: Dispersion of fibre
-    :param double gamma: Nonlinearity of fibre
+    :param object gamma: Nonlinearity of fibre, or gamma spectrum
     :param string sim_type: Type of simulation
     :param Uint traces: Number of field traces required
     :param double local_error: Relative local error used in adaptive stepper
@@ -43,8 +49,27 @@ class Fibre(object):
     :param double tau_1: Constant used in Raman scattering calculation
     :param double tau_2: Constant used in Raman scattering calculation
     :param double f_R: Constant setting the fraction of Raman scattering used
+    :param object raman_model: Tabulated Raman response (replaces tau_1, tau_2)
+    :param array_like stop_conditions: Functions of (z, A) ending propagation
+    :param Uint stop_interval: Number of steps between stop condition checks
+    :param Uint cache_size: Number of linear exponential factors to cache
+    :param double step_ratio: Ratio of geometric step-size ladder (adaptive)
+    :param bool fuse_half_steps: Merge adjacent linear half-steps (standard)
+    :param string kernels: Implementation of elementwise nonlinear terms
+    :param bool manakov: Use the Manakov equation (vector simulation)
+    :param double nonlinear_tolerance: Nonlinear phase per step below which
+                                       steps are linear
+    :param bool use_workspace: Hold solver stages in reused arrays
+    :param string error_control: Error estimate of the adaptive stepper
 
-    sim_type is either default or wdm.
+    sim_type is either default, wdm, or vector.
+
+    vector: propagate two polarisations, held in one (2, N) array, so that
+    both share each transform. Use a domain with two channels, with channel
+    0 (1) the x (y) polarisation. alpha and beta may be pairs of values for
+    the x and y axes (see Linearity). The coupled nonlinear terms are those
+    of a linearly birefringent fibre, or of the Manakov equation if manakov
+    is True (see Nonlinearity).
 
     traces: If greater than 1, will save the field at uniformly-spaced points
     during fibre propagation. If zero, will output all saved points used.
@@ -57,23 +82,100 @@ class Fibre(object):
     to set the step-size between successive points along the fibre.
 
     local_error: Relative local error to aim for between propagtion points.
+
+    stop_conditions: Propagation ends early once any condition returns True
+    (see pyofss.modules.condition). The distance reached is stored in
+    stepper.stop_z.
+
+    step_ratio: If set (for example 2.0), adaptive step-sizes are rounded
+    down to the ladder h0 * step_ratio**k, where h0 is the initial step-size
+    and k is an integer. Step-sizes then repeat, so the cached linear
+    exponential factors are reused. Without step_ratio, an adaptive method
+    does not cache these factors.
+
+    fuse_half_steps: For ss_reduced, ss_sym_midpoint, and ss_sym_rk4 with a
+    fixed step-size, merge the trailing linear half-step of each step with
+    the leading half-step of the next (see Stepper).
+
+    kernels: "numpy" (default), "fused", or "numexpr" (see Nonlinearity).
+
+    alpha, beta, and gamma may vary along the fibre. Pass either a Piecewise
+    profile (see pyofss.modules.piecewise), or a general function of z. For
+    each step, parameters are evaluated at the centre of the step. Steps end
+    on each Piecewise boundary, and the linear factors of each segment are
+    cached, so a dispersion-managed fibre may be simulated using one module.
+
+    nonlinear_tolerance: If set (for example 1.0e-4 rad), steps whose
+    estimated nonlinear phase (see nonlinear_phase) is below this tolerance
+    use exact linear propagation only, skipping all nonlinear evaluations.
+    This suits long, low-power spans; nonlinear steps resume if the power
+    recovers (see Stepper).
+
+    use_workspace: rk4ip, ss_sym_rk4, and ss_sym_midpoint (and rk4 and
+    midpoint) hold their stages in arrays allocated once per stepper and
+    updated in place, avoiding repeated allocation for large domains (see
+    Solver).
+
+    error_control: "local" (default) or "conservation". With conservation,
+    an adaptive method (such as ARK4IP) controls the step-size using the
+    relative change in photon number over each step (see photon_error)
+    instead of step-doubling, so each attempt is a single step.
+
+    A purely linear fibre (see is_linear) without stop conditions or varying
+    parameters is propagated exactly, using a single spectral multiplication
+    rather than the stepper. Multiple traces are generated together, using
+    one broadcast operation over all z-values.
     """
     def __init__(self, name="fibre", length=1.0, alpha=None,
                  beta=None, gamma=0.0, sim_type=None, traces=1,
                  local_error=1.0e-6, method="RK4IP", total_steps=100,
                  self_steepening=False, raman_scattering=False,
                  rs_factor=0.003, use_all=False, centre_omega=None,
-                 tau_1=12.2e-3, tau_2=32.0e-3, f_R=0.18):
-
-        use_cache = not(method.upper().startswith('A'))
+                 tau_1=12.2e-3, tau_2=32.0e-3, f_R=0.18,
+                 stop_conditions=None, stop_interval=1,
+                 cache_size=16, step_ratio=None, fuse_half_steps=False,
+                 raman_model=None, kernels=None, manakov=False,
+                 nonlinear_tolerance=None, use_workspace=False,
+                 error_control="local"):
 
         self.name = name
         self.length = length
-        self.linearity = Linearity(alpha, beta, sim_type,
-                                   use_cache, centre_omega)
+        self.sim_type = sim_type
+        self.domain = None
+
+        # Store parameters which vary with z, using initial values for setup:
+        self.profiles = {}
+        boundaries = set()
+        for (parameter, value) in [("alpha", alpha), ("beta", beta),
+                                   ("gamma", gamma)]:
+            if callable(value) and not hasattr(value, "generate"):
+                self.profiles[parameter] = value
+                if isinstance(value, Piecewise):
+                    boundaries.update(value.boundaries)
+
+        if "alpha" in self.profiles:
+            alpha = alpha(0.0)
+        if "beta" in self.profiles:
+            beta = beta(0.0)
+        if "gamma" in self.profiles:
+            gamma = gamma(0.0)
+
+        if self.profiles:
+            update = self.update_parameters
+        else:
+            update = None
+
+        # Adaptive step-sizes rarely repeat unless rounded to a ladder, so
+        # only then is caching the linear exponential factor worthwhile:
+        adaptive = method.upper().startswith('A')
+        use_cache = (not adaptive) or (step_ratio is not None)
+
+        self.linearity = Linearity(alpha, beta, sim_type, use_cache,
+                                   centre_omega, cache_size)
         self.nonlinearity = Nonlinearity(gamma, sim_type, self_steepening,
                                          raman_scattering, rs_factor,
-                                         use_all, tau_1, tau_2, f_R)
+                                         use_all, tau_1, tau_2, f_R,
+                                         raman_model, kernels, manakov)
 
         class Function():
             """ Class to hold linear and nonlinear functions. """
@@ -84,23 +186,223 @@ class Fibre(object):
                 self.nonlinear = nonlinear
 
             def __call__(self, A, z):
-                return self.l(A, z) + self.n(A, z)
+                # Add in place, avoiding a further array:
+                result = self.l(A, z)
+                result += self.n(A, z)
+                return result
 
         self.function = Function(self.l, self.n, self.linear, self.nonlinear)
 
         self.stepper = Stepper(traces, local_error, method, self.function,
-                               self.length, total_steps)
+                               self.length, total_steps,
+                               stop_conditions, stop_interval, step_ratio,
+                               sorted(boundaries), update, fuse_half_steps,
+                               nonlinear_tolerance, self.nonlinear_phase,
+                               use_workspace, error_control,
+                               self.photon_error)
+
+        # Spectral power of fields recently used by photon_error:
+        self.spectra = []
 
     def __call__(self, domain, field):
+        self.domain = domain
         self.linearity(domain)
         self.nonlinearity(domain)
+        self.spectra = []
 
         # Set temporal and spectral arrays for storage:
         self.stepper.storage.t = domain.t
         self.stepper.storage.nu = domain.nu
 
+        if self.sim_type == "vector":
+            # Stack polarisations so that both are transformed together:
+            field = np.asarray(field, dtype=complex)
+
         # Propagate field through fibre:
-        return self.stepper(field)
+        if self.is_linear() and not self.stepper.stop_conditions and \
+                not self.profiles and domain.channels == 1:
+            return self.propagate_linear(field)
+        else:
+            return self.stepper(field)
+
+    def propagate_linear(self, A):
+        """
+        :param array_like A: Input field
+        :return: Output field
+        :rtype: Cvector
+
+        Propagate exactly through a purely linear fibre. If traces are
+        required, the field at each trace is calculated in one operation
+        and stored as if by the stepper (traces of zero uses the mesh of the
+        standard stepper).
+        """
+        stepper = self.stepper
+        stepper.storage.reset()
+        stepper.storage.reset_fft_counter()
+        stepper.stop_z = None
+        stepper.stopped_by = None
+
+        if stepper.traces == 1:
+            stepper.A_out = ifft(self.linearity.exp_factor(self.length) *
+                                 fft(A))
+        else:
+            if stepper.traces > 1:
+                zs = np.linspace(0.0, self.length, stepper.traces + 1)
+            else:
+                zs = np.linspace(0.0, self.length, stepper.total_steps + 1)
+
+            # Field array of shape (len(zs), total_samples), one row per z:
+            As = ifft(np.exp(np.outer(zs, self.linearity.factor)) * fft(A))
+            for (z, A_z) in zip(zs, As):
+                stepper.storage.append(z, A_z)
+
+            stepper.A_out = As[-1]
+
+        stepper.storage.store_current_fft_count()
+
+        return stepper.A_out
+
+    def is_linear(self):
+        """
+        :return: Whether the fibre has no nonlinear contribution
+        :rtype: bool
+
+        A single-field fibre with gamma of None or zero is purely linear.
+        """
+        gamma = self.nonlinearity.gamma
+
+        if self.sim_type is not None or "gamma" in self.profiles:
+            return False
+
+        return (gamma is None) or (np.isscalar(gamma) and gamma == 0.0)
+
+    def transfer_key(self):
+        """ Return a key of the parameters determining linear_transfer. """
+        return (self.length, self.linearity.parameter_key(), self.is_linear(),
+                self.stepper.traces, bool(self.stepper.stop_conditions))
+
+    def linear_transfer(self, domain):
+        """
+        :param object domain: A domain
+        :return: Spectral transfer function in fft order, or None
+        :rtype: Cvector
+
+        Return the exact field transfer function of a purely linear fibre.
+        Return None for a nonlinear fibre, or if multiple traces or stop
+        conditions are required (replacing propagation would discard them).
+        """
+        if not self.is_linear() or self.stepper.traces != 1 or \
+                self.stepper.stop_conditions or self.profiles:
+            return None
+
+        self.linearity(domain)
+
+        return self.linearity.exp_factor(self.length)
+
+    def update_parameters(self, z, h):
+        """
+        :param double z: Start of the step
+        :param double h: Step-size
+        :return: Whether any parameter changed
+        :rtype: bool
+
+        Set parameters which vary with z to their values at the centre of
+        the step. Linear factors are cached, so returning to a previous set
+        of parameters (such as a repeated segment) is cheap. Factors are
+        only regenerated if their parameters change.
+        """
+        z_centre = z + 0.5 * h
+
+        def changed(old, new):
+            """ Compare parameter values, which may be sequences. """
+            return make_key(old) != make_key(new)
+
+        linear = False
+        for parameter in ["alpha", "beta"]:
+            if parameter in self.profiles:
+                value = self.profiles[parameter](z_centre)
+                if changed(getattr(self.linearity, parameter), value):
+                    setattr(self.linearity, parameter, value)
+                    linear = True
+        if linear:
+            self.linearity(self.domain)
+
+        nonlinear = False
+        if "gamma" in self.profiles:
+            value = self.profiles["gamma"](z_centre)
+            if changed(self.nonlinearity.gamma, value):
+                self.nonlinearity.gamma = value
+                self.nonlinearity.generate_nonlinearity()
+                nonlinear = True
+
+        return linear or nonlinear
+
+    def nonlinear_phase(self, A, h):
+        """
+        :param array_like A: Field at the start of the step
+        :param double h: Step-size
+        :return: Estimate of the maximum nonlinear phase of the step
+        :rtype: double
+
+        Use max(|gamma|) max(|A|^2) h. For multiple fields (wdm or vector),
+        |A|^2 is replaced by twice the total power, bounding cross-phase
+        modulation.
+        """
+        factor = self.nonlinearity.factor
+        if factor is None:
+            return 0.0
+
+        P = np.abs(A) ** 2
+        if np.ndim(P) > 1:
+            P = 2.0 * np.sum(P, axis=0)
+
+        return np.max(np.abs(factor)) * np.max(P) * h
+
+    def photon_spectrum(self, A):
+        """
+        :param array_like A: Field in the temporal domain
+        :return: Spectral power, reusing that of a recent field if possible
+        :rtype: double array
+        """
+        for (A_saved, P_saved) in self.spectra:
+            if A_saved is A:
+                return P_saved
+
+        P = np.abs(fft(A)) ** 2
+        # Keep the fields at the start and end of the last step:
+        self.spectra = (self.spectra + [(A, P)])[-2:]
+
+        return P
+
+    def photon_error(self, A_in, A_out, h):
+        """
+        :param array_like A_in: Field at the start of the step
+        :param array_like A_out: Field at the end of the step
+        :param double h: Step-size
+        :return: Relative change in photon number over the step
+        :rtype: double
+
+        Photon number is the sum of spectral power divided by angular
+        frequency. Linear gain or loss changes the photon number, so the
+        photon number at the start is corrected by the attenuation of each
+        mode over the step, :math:`\\exp(2 h \\mathrm{Re}(\\hat{L}))`.
+        Self-steepening and Raman scattering conserve this corrected photon
+        number, unlike the energy.
+
+        The spectrum at the end of an accepted step is kept and used for the
+        start of the next step, so only one transform is required per step.
+        """
+        omega = fftshift(self.domain.omega)
+        attenuation = np.exp(2.0 * h * np.real(self.linearity.factor))
+
+        N_in = np.sum(attenuation * self.photon_spectrum(A_in) / omega)
+        N_out = np.sum(self.photon_spectrum(A_out) / omega)
+
+        # Avoid possible divide by zero:
+        if N_in != 0.0:
+            return np.abs(N_out - N_in) / N_in
+        else:
+            return np.abs(N_out - N_in)
 
     def l(self, A, z):
         """ Linear term. """
@@ -109,10 +109,7 @@ class Filter(object):
         # Convert field to spectral domain:
         self.field = fft(field)
 
-        delta_nu = domain.nu - domain.centre_nu - self.offset_nu
-        factor = power(delta_nu / self.width_nu, (2 * self.m))
-        # Frequency values are in order, inverse shift to put in fft order:
-        self.shape = exp(-0.5 * ifftshift(factor))
+        self.shape = self.generate_shape(domain)
 
         if domain.channels > 1:
             # Filter is applied only to one channel:
@@ -123,6 +120,37 @@ class Filter(object):
         # convert field back to temporal domain:
         return ifft(self.field)
 
+    def generate_shape(self, domain):
+        """
+        :param object domain: A domain
+        :return: Filter shape in fft order
+        :rtype: Cvector
+
+        Generate the spectral shape which multiplies the field.
+        """
+        delta_nu = domain.nu - domain.centre_nu - self.offset_nu
+        factor = power(delta_nu / self.width_nu, (2 * self.m))
+        # Frequency values are in order, inverse shift to put in fft order:
+        return exp(-0.5 * ifftshift(factor))
+
+    def transfer_key(self):
+        """ Return a key of the parameters determining linear_transfer. """
+        return (self.width_nu, self.offset_nu, self.m)
+
+    def linear_transfer(self, domain):
+        """
+        :param object domain: A domain
+        :return: Spectral transfer function in fft order, or None
+        :rtype: Cvector
+
+        Return the field transfer function applied by the filter. For a
+        multi-channel domain only one channel is filtered, so return None.
+        """
+        if domain.channels > 1:
+            return None
+
+        return self.generate_shape(domain)
+
     def transfer_function(self, nu, centre_nu):
         """
         :param Dvector nu: Spectral domain array.
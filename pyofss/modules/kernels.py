@@ -0,0 +1,189 @@
+
+"""
+    Copyright (C) 2012  David Bolt
+
+    This file is part of pyofss.
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import numpy as np
+
+# numexpr is optional; without it the ufunc kernels are available:
+try:
+    import numexpr
+except ImportError:
+    numexpr = None
+
+
+# Define exceptions
+class KernelError(Exception):
+    pass
+
+
+class UnknownKernelError(KernelError):
+    pass
+
+
+class Workspace(object):
+    """
+    Named scratch arrays, allocated on first use and then reused for every
+    call with the same shape and type.
+    """
+    def __init__(self):
+        self.buffers = {}
+
+    def __len__(self):
+        return len(self.buffers)
+
+    def get(self, name, shape, dtype=float):
+        """ Return the (uninitialised) array called name. """
+        key = (name, shape, np.dtype(dtype))
+        buffer = self.buffers.get(key)
+
+        if buffer is None:
+            buffer = np.empty(shape, dtype)
+            self.buffers[key] = buffer
+
+        return buffer
+
+    def clear(self):
+        """ Release all arrays. """
+        self.buffers.clear()
+
+
+class UfuncKernels(object):
+    """
+    Elementwise nonlinear operations as chains of numpy ufuncs writing into
+    workspace arrays (using out=), rather than creating a temporary array for
+    each operation.
+
+    Each kernel allocates only its returned array, which the caller may keep
+    (solvers hold several stages at once). Operations are applied in the same
+    order as the corresponding numpy expressions in Nonlinearity, so results
+    are identical.
+    """
+    name = "fused"
+
+    def __init__(self):
+        self.workspace = Workspace()
+
+    def intensity(self, A, name="intensity"):
+        """ Return |A|^2 in a workspace array. """
+        I = self.workspace.get(name, A.shape)
+        np.abs(A, out=I)
+        np.square(I, out=I)
+
+        return I
+
+    def cross_intensity(self, As):
+        """ Return |A_0|^2 + 2 |A_1|^2 and |A_1|^2 + 2 |A_0|^2. """
+        I_0 = self.intensity(As[0], "intensity_0")
+        I_1 = self.intensity(As[1], "intensity_1")
+
+        S_0 = self.workspace.get("cross_0", I_0.shape)
+        S_1 = self.workspace.get("cross_1", I_1.shape)
+        np.multiply(I_1, 2.0, out=S_0)
+        S_0 += I_0
+        np.multiply(I_0, 2.0, out=S_1)
+        S_1 += I_1
+
+        return S_0, S_1
+
+    def multiply(self, factor, I, A, out=None):
+        """ Return factor * I * A, for real I and complex scalar factor. """
+        if out is None:
+            out = np.empty(A.shape, complex)
+        np.multiply(I, factor, out=out)
+        out *= A
+
+        return out
+
+    def exp_multiply(self, factor, I, B, out=None):
+        """ Return exp(factor * I) * B, for real I and complex factor. """
+        if out is None:
+            out = np.empty(B.shape, complex)
+        np.multiply(I, factor, out=out)
+        np.exp(out, out=out)
+        out *= B
+
+        return out
+
+
+class NumexprKernels(UfuncKernels):
+    """
+    Elementwise nonlinear operations evaluated by numexpr, which completes
+    each expression in a single (blocked, multi-threaded) pass over memory.
+    Results agree with the numpy expressions to rounding error.
+    """
+    name = "numexpr"
+
+    def __init__(self):
+        if numexpr is None:
+            raise KernelError("numexpr kernels require the numexpr package")
+
+        super(NumexprKernels, self).__init__()
+
+    def intensity(self, A, name="intensity"):
+        I = self.workspace.get(name, A.shape)
+
+        return numexpr.evaluate("real(A) ** 2 + imag(A) ** 2", out=I,
+                                local_dict={"A": A})
+
+    def cross_intensity(self, As):
+        S_0 = self.workspace.get("cross_0", As[0].shape)
+        S_1 = self.workspace.get("cross_1", As[1].shape)
+        local_dict = {"A_0": As[0], "A_1": As[1]}
+
+        numexpr.evaluate("real(A_0) ** 2 + imag(A_0) ** 2 + "
+                         "2.0 * (real(A_1) ** 2 + imag(A_1) ** 2)",
+                         out=S_0, local_dict=local_dict)
+        numexpr.evaluate("real(A_1) ** 2 + imag(A_1) ** 2 + "
+                         "2.0 * (real(A_0) ** 2 + imag(A_0) ** 2)",
+                         out=S_1, local_dict=local_dict)
+
+        return S_0, S_1
+
+    def multiply(self, factor, I, A, out=None):
+        if out is None:
+            out = np.empty(A.shape, complex)
+
+        return numexpr.evaluate("factor * I * A", out=out, local_dict={
+            "factor": complex(factor), "I": I, "A": A})
+
+    def exp_multiply(self, factor, I, B, out=None):
+        if out is None:
+            out = np.empty(B.shape, complex)
+
+        return numexpr.evaluate("exp(factor * I) * B", out=out, local_dict={
+            "factor": complex(factor), "I": I, "B": B})
+
+
+kernel_types = {"fused": UfuncKernels, "numexpr": NumexprKernels}
+
+
+def make_kernels(name=None):
+    """
+    :param string name: Kernel type: "numpy" (or None), "fused", or "numexpr"
+    :return: Kernels, or None for plain numpy expressions
+    :rtype: object
+    """
+    if name is None or name == "numpy":
+        return None
+
+    if name not in kernel_types:
+        raise UnknownKernelError("kernels must be one of numpy, %s" %
+                                 ", ".join(sorted(kernel_types)))
+
+    return kernel_types[name]()
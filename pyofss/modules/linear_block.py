@@ -0,0 +1,186 @@
+
+"""
+    Copyright (C) 2012  David Bolt
+
+    This file is part of pyofss.
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+from pyofss.field import fft, ifft
+from pyofss.cache import LRUCache
+
+
+# Define exceptions
+class LinearBlockError(Exception):
+    pass
+
+
+class NotLinearError(LinearBlockError):
+    pass
+
+
+def fuse_linear_modules(domain, modules):
+    """
+    :param object domain: A domain
+    :param array_like modules: List of modules, in system order
+    :return: List of modules with linear runs replaced by LinearBlocks
+    :rtype: array_like
+
+    Replace each run of two or more consecutive purely linear modules with a
+    single LinearBlock. A module is purely linear if its linear_transfer
+    method returns a transfer function for the domain. Multi-channel domains
+    are returned unchanged.
+    """
+    if domain.channels > 1:
+        return list(modules)
+
+    fused = []
+    run = []
+
+    def close_run():
+        """ Move the current run of linear modules into the fused list. """
+        if len(run) > 1:
+            fused.append(LinearBlock(list(run)))
+        else:
+            fused.extend(run)
+        del run[:]
+
+    for module in modules:
+        if hasattr(module, "linear_transfer") and \
+                module.linear_transfer(domain) is not None:
+            run.append(module)
+        else:
+            close_run()
+            fused.append(module)
+
+    close_run()
+
+    return fused
+
+
+class LinearBlock(object):
+    """
+    :param array_like modules: Purely linear modules, in propagation order
+    :param string name: Name of this module. Defaults to the last module name
+    :param Uint repeats: Number of times the modules are repeated
+
+    A linear block applies the product of the transfer functions of its
+    modules using a single fft and ifft, rather than one pair per module.
+
+    repeats allows a chain of identical spans (such as fibre, amplifier, and
+    filter) to be applied at once: the transfer function of one span is
+    raised to the power repeats. The combined transfer function is cached
+    for each domain, keyed also on the parameters of each module (see
+    transfer_key), so changing a module (such as the width of a filter)
+    recalculates the transfer function. If a module has no transfer_key
+    method, the transfer function is recalculated for every call.
+    """
+    def __init__(self, modules, name=None, repeats=1):
+        if len(modules) == 0:
+            raise LinearBlockError("Require at least one module")
+
+        if repeats < 1 or int(repeats) != repeats:
+            raise LinearBlockError("repeats must be a positive integer")
+
+        self.modules = modules
+        self.repeats = repeats
+        self.cache = LRUCache(4)
+
+        if name is None:
+            self.name = modules[-1].name
+        else:
+            self.name = name
+
+        self.field = None
+
+    def linear_transfer(self, domain):
+        """
+        :param object domain: A domain
+        :return: Combined spectral transfer function in fft order, or None
+        :rtype: Cvector
+
+        Multiply together the transfer functions of each module, then raise
+        to the power repeats. Return None if any module is not purely linear
+        for this domain.
+        """
+        module_key = self.transfer_key()
+        if module_key is None:
+            transfer = None
+        else:
+            key = (domain.fingerprint(), module_key)
+            transfer = self.cache.get(key)
+
+        if transfer is None:
+            transfer = self.span_transfer(domain)
+            if transfer is None:
+                return None
+
+            if self.repeats > 1:
+                transfer = transfer ** self.repeats
+            if module_key is not None:
+                self.cache[key] = transfer
+
+        return transfer
+
+    def transfer_key(self):
+        """
+        :return: Key of the parameters of all modules, or None
+        :rtype: tuple
+
+        Return None if any module has no transfer_key method, since changes
+        to that module could not be detected.
+        """
+        keys = []
+        for module in self.modules:
+            if not hasattr(module, "transfer_key"):
+                return None
+            keys.append(module.transfer_key())
+
+        return (self.repeats, tuple(keys))
+
+    def span_transfer(self, domain):
+        """
+        :param object domain: A domain
+        :return: Transfer function of a single span, or None
+        :rtype: Cvector
+        """
+        transfer = 1.0
+        for module in self.modules:
+            module_transfer = module.linear_transfer(domain)
+            if module_transfer is None:
+                return None
+            transfer = transfer * module_transfer
+
+        return transfer
+
+    def clear_cache(self):
+        """ Discard cached transfer functions, after a module has changed. """
+        self.cache.clear()
+
+    def __call__(self, domain, field):
+        """
+        :param object domain: A domain
+        :param object field: Current field
+        :return: Field after modification by all modules in the block
+        :rtype: Object
+        """
+        transfer = self.linear_transfer(domain)
+        if transfer is None:
+            raise NotLinearError(
+                "LinearBlock contains a module which is not purely linear")
+
+        self.field = ifft(transfer * fft(field))
+
+        return self.field
@@ -24,6 +24,7 @@ from scipy import log10, exp
 import numpy as np
 
 from pyofss.field import fft, ifft, fftshift
+from pyofss.cache import LRUCache, make_key
 
 
 def convert_dispersion_to_physical(D=0.0, S=0.0, Lambda=1550.0):
@@ -99,16 +100,38 @@ def convert_alpha_to_dB(alpha_linear=0.0):
 
 class Linearity(object):
     """
-    :param double alpha: Attenuation factor
-    :param array_like beta: Array of dispersion parameters
-    :param string sim_type: Type of simulation, "default" or "wdm"
-    :param bool use_cache: Cache calculated values if using fixed step-size
+    :param object alpha: Attenuation factor, or loss spectrum
+    :param object beta: Array of dispersion parameters, or tabulated data
+    :param string sim_type: Type of simulation, "default", "wdm", or "vector"
+    :param bool use_cache: Cache calculated exponential factors
     :param double centre_omega: Angular frequency to use for dispersion array
+    :param Uint cache_size: Maximum number of cached exponential factors
 
     Dispersion is used by fibre to generate a fairly general dispersion array.
+
+    beta is either a list of dispersion coefficients [beta_0, beta_1, ...],
+    evaluated as a polynomial in Domega using Horner's method, or an object
+    with a generate(domain, centre_omega) method returning the dispersion on
+    the spectral grid (see pyofss.modules.dispersion.TabulatedDispersion).
+
+    Similarly, alpha is either a scalar or an object with a generate(domain)
+    method returning attenuation on the spectral grid (see
+    pyofss.modules.loss.LossSpectrum). Both are folded into factor.
+
+    For a vector (two-polarisation) simulation, alpha and beta apply to both
+    polarisations, or are given as a pair (x, y) of values. A pair of beta
+    lists with different beta_0 (or beta_1) values models linear
+    birefringence (or differential group delay). factor is then a
+    (2, N) array, so both polarisations share each transform.
+
+    If use_cache is True, the exponential factor exp(h * factor) is stored
+    for each step-size h, keyed also on the domain and parameters used to
+    generate factor. At most cache_size factors are kept; the least recently
+    used factor is discarded first. This suits both fixed step-sizes and
+    adaptive steppers which restrict step-sizes to a ladder of values.
     """
     def __init__(self, alpha=None, beta=None, sim_type=None,
-                 use_cache=False, centre_omega=None):
+                 use_cache=False, centre_omega=None, cache_size=16):
 
         self.alpha = alpha
         self.beta = beta
@@ -126,38 +149,126 @@ class Linearity(object):
                                    self.default_exp_f)
 
         # Allows storing of calculation involving an exponential. Provides a
-        # significant speed increase if using a fixed step-size.
+        # significant speed increase if step-sizes are repeated.
+        # cached_factor holds the most recently used exponential factor:
+        self.cache = LRUCache(cache_size)
         self.cached_factor = None
 
+        # Linear factors, keyed on domain and parameters. Allows parameters
+        # to be switched (for example between fibre segments) cheaply:
+        self.factors = LRUCache(cache_size)
+
         self.factor = None
+        self.factor_key = None
         self.Domega = None
 
     def __call__(self, domain):
-
-        return self.generate_linearity(domain)
-
-    def default_linearity(self, domain):
+        # Cached exponential factors are only valid for the same domain and
+        # parameters used to generate factor:
+        self.factor_key = (domain.fingerprint(), self.parameter_key())
+
+        factor = self.factors.get(self.factor_key)
+        if factor is None:
+            factor = self.generate_linearity(domain)
+            self.factors[self.factor_key] = factor
+        else:
+            self.factor = factor
+
+        return factor
+
+    def parameter_key(self):
+        """
+        :return: Hashable representation of parameters determining factor
+        :rtype: tuple
+        """
+        return (make_key(self.alpha), make_key(self.beta),
+                make_key(self.centre_omega))
+
+    def exp_factor(self, h):
+        """
+        :param double h: Step-size
+        :return: Exponential factor, exp(h * factor)
+        :rtype: Cvector
+
+        Return the cached exponential factor for h, calculating and caching
+        the factor if required.
+        """
+        key = (self.factor_key, h)
+
+        self.cached_factor = self.cache.get(key)
+        if self.cached_factor is None:
+            if isinstance(self.factor, tuple):
+                self.cached_factor = (np.exp(h * self.factor[0]),
+                                      np.exp(h * self.factor[1]))
+            else:
+                self.cached_factor = np.exp(h * self.factor)
+            self.cache[key] = self.cached_factor
+
+        return self.cached_factor
+
+    @staticmethod
+    def dispersion_terms(beta, domain, centre_omega, Domega):
+        """
+        :param object beta: List of dispersion parameters, or tabulated data
+        :param object domain: A domain
+        :param double centre_omega: Angular frequency used for dispersion
+        :param double array Domega: Angular frequency relative to centre_omega
+        :return: Dispersion array (in natural order)
+        :rtype: double array
+        """
+        if hasattr(beta, "generate"):
+            return beta.generate(domain, centre_omega)
+
+        # Horner's method, using coefficients beta_n / n! (highest first):
+        coefficients = [b / factorial(n) for n, b in enumerate(beta)]
+
+        return np.polyval(coefficients[::-1], Domega)
+
+    @staticmethod
+    def attenuation_terms(alpha, domain):
+        """
+        :param object alpha: Attenuation factor, or loss spectrum
+        :param object domain: A domain
+        :return: Attenuation (in fft order if spectral)
+        :rtype: double
+        """
+        if hasattr(alpha, "generate"):
+            return fftshift(alpha.generate(domain))
+
+        return alpha
+
+    def linear_factor(self, alpha, beta, domain):
+        """
+        :param object alpha: Attenuation factor, or loss spectrum
+        :param object beta: Array of dispersion parameters, or tabulated data
+        :param object domain: A domain
+        :return: Linear factor (in fft order)
+        :rtype: Cvector
+        """
         # Calculate dispersive terms:
-        if self.beta is None:
-            self.factor = 0.0
+        if beta is None:
+            factor = 0.0
         else:
             if self.centre_omega is None:
-                self.Domega = domain.omega - domain.centre_omega
+                centre_omega = domain.centre_omega
             else:
-                self.Domega = domain.omega - self.centre_omega
+                centre_omega = self.centre_omega
+            self.Domega = domain.omega - centre_omega
 
             # Allow general dispersion:
-            terms = 0.0
-            for n, beta in enumerate(self.beta):
-                terms += beta * np.power(self.Domega, n) / factorial(n)
-            self.factor = 1j * fftshift(terms)
+            terms = self.dispersion_terms(beta, domain, centre_omega,
+                                          self.Domega)
+            factor = 1j * fftshift(terms)
 
         # Include attenuation term if available:
-        if self.alpha is None:
-            return self.factor
+        if alpha is None:
+            return factor
         else:
-            self.factor -= 0.5 * self.alpha
-            return self.factor
+            return factor - 0.5 * self.attenuation_terms(alpha, domain)
+
+    def default_linearity(self, domain):
+        self.factor = self.linear_factor(self.alpha, self.beta, domain)
+        return self.factor
 
     def wdm_linearity(self, domain):
         # Calculate dispersive terms:
@@ -165,26 +276,49 @@ class Linearity(object):
             self.factor = (0.0, 0.0)
         else:
             if self.centre_omega is None:
-                self.Domega = (domain.omega - domain.centre_omega,
-                               domain.omega - domain.centre_omega)
+                centre_omega = (domain.centre_omega, domain.centre_omega)
             else:
-                self.Domega = (domain.omega - self.centre_omega[0],
-                               domain.omega - self.centre_omega[1])
-
-            terms = [0.0, 0.0]
-            for n, beta in enumerate(self.beta[0]):
-                terms[0] += beta * np.power(self.Domega[0], n) / factorial(n)
-            for n, beta in enumerate(self.beta[1]):
-                terms[1] += beta * np.power(self.Domega[1], n) / factorial(n)
+                centre_omega = self.centre_omega
+            self.Domega = (domain.omega - centre_omega[0],
+                           domain.omega - centre_omega[1])
+
+            terms = [self.dispersion_terms(self.beta[i], domain,
+                                           centre_omega[i], self.Domega[i])
+                     for i in range(2)]
             self.factor = (1j * fftshift(terms[0]), 1j * fftshift(terms[1]))
 
         # Include attenuation terms if available:
         if self.alpha is None:
             return self.factor
         else:
-            self.factor[0] -= 0.5 * self.alpha[0]
-            self.factor[1] -= 0.5 * self.alpha[1]
-            return factor
+            self.factor = tuple(
+                self.factor[i] -
+                0.5 * self.attenuation_terms(self.alpha[i], domain)
+                for i in range(2))
+            return self.factor
+
+    def vector_linearity(self, domain):
+        """ Set the factor for both polarisations, stacked if different. """
+        alpha_pair = isinstance(self.alpha, (list, tuple))
+        beta_pair = isinstance(self.beta, (list, tuple)) and \
+            len(self.beta) == 2 and \
+            all(isinstance(b, (list, tuple, np.ndarray)) or
+                hasattr(b, "generate") for b in self.beta)
+
+        if not (alpha_pair or beta_pair):
+            # A shared factor broadcasts over the (2, N) field array:
+            self.factor = self.linear_factor(self.alpha, self.beta, domain)
+            return self.factor
+
+        alphas = self.alpha if alpha_pair else (self.alpha, self.alpha)
+        betas = self.beta if beta_pair else (self.beta, self.beta)
+
+        factor = np.zeros((2, domain.total_samples), complex)
+        for i in range(2):
+            factor[i] += self.linear_factor(alphas[i], betas[i], domain)
+        self.factor = factor
+
+        return self.factor
 
     def default_f(self, A, z):
         return ifft(self.factor * fft(A))
@@ -193,11 +327,7 @@ class Linearity(object):
         return ifft(np.exp(h * self.factor) * fft(A))
 
     def default_exp_f_cached(self, A, h):
-        if self.cached_factor is None:
-            print "Caching linear factor"
-            self.cached_factor = np.exp(h * self.factor)
-
-        return ifft(self.cached_factor * fft(A))
+        return ifft(self.exp_factor(h) * fft(A))
 
     def wdm_f(self, As, z):
         return np.asarray([ifft(self.factor[0] * fft(As[0])),
@@ -208,10 +338,7 @@ class Linearity(object):
                            ifft(np.exp(h * self.factor[1]) * fft(As[1]))])
 
     def wdm_exp_f_cached(self, As, h):
-        if self.cached_factor is None:
-            print "Caching linear factor"
-            self.cached_factor = [np.exp(h * self.factor[0]),
-                                  np.exp(h * self.factor[1])]
+        factor = self.exp_factor(h)
 
-        return np.asarray([ifft(self.cached_factor[0] * fft(As[0])),
-                           ifft(self.cached_factor[1] * fft(As[1]))])
+        return np.asarray([ifft(factor[0] * fft(As[0])),
+                           ifft(factor[1] * fft(As[1]))])
@@ -0,0 +1,123 @@
+
+"""
+    Copyright (C) 2012  David Bolt
+
+    This file is part of pyofss.
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import numpy as np
+
+from pyofss.domain import nu_to_omega, lambda_to_omega
+from pyofss.cache import LRUCache
+
+from linearity import convert_alpha_to_linear
+
+
+# Define exceptions
+class LossError(Exception):
+    pass
+
+
+class UnknownTypeError(LossError):
+    pass
+
+
+class LossSpectrum(object):
+    """
+    :param array_like x: Tabulated spectral values
+    :param array_like y: Tabulated attenuation values
+    :param string x_type: Type of x values: "omega", "nu", or "lambda"
+    :param string y_type: Type of y values: "linear" or "dB"
+
+    Units of x: omega -- *rad / ps*; nu -- *THz*; lambda -- *nm*.
+
+    Units of y: linear -- *1 / km*; dB -- *dB / km*.
+
+    A measured attenuation spectrum, such as one including the OH absorption
+    peak and the infrared and ultraviolet absorption edges. May be passed to
+    Linearity (or Fibre) in place of a scalar alpha.
+
+    The table is linearly interpolated onto the spectral grid of a domain
+    (holding end values outside the table) and cached. Linearity adds the
+    result to the linear factor, so a spectral loss costs nothing per step.
+    """
+    x_types = ("omega", "nu", "lambda")
+    y_types = ("linear", "dB")
+
+    def __init__(self, x, y, x_type="lambda", y_type="dB"):
+        if x_type not in self.x_types:
+            raise UnknownTypeError(
+                "x_type must be one of %s" % ", ".join(self.x_types))
+
+        if y_type not in self.y_types:
+            raise UnknownTypeError(
+                "y_type must be one of %s" % ", ".join(self.y_types))
+
+        x = np.asarray(x, dtype=float)
+        y = np.asarray(y, dtype=float)
+
+        if x_type == "nu":
+            omega = nu_to_omega(x)
+        elif x_type == "lambda":
+            omega = lambda_to_omega(x)
+        else:
+            omega = x
+
+        if y_type == "dB":
+            y = convert_alpha_to_linear(y)
+
+        # Interpolation requires increasing x values:
+        order = np.argsort(omega)
+        self.omega = omega[order]
+        self.values = y[order]
+
+        self.cache = LRUCache(4)
+
+    def key(self):
+        """ Return the tabulated values identifying the loss spectrum. """
+        return (self.__class__.__name__, self.omega, self.values)
+
+    @classmethod
+    def from_file(cls, filename, x_type="lambda", y_type="dB", **kwargs):
+        """
+        :param string filename: Text file with x values then y values columns
+        :param string x_type: Type of x values: "omega", "nu", or "lambda"
+        :param string y_type: Type of y values: "linear" or "dB"
+        :return: Loss spectrum
+        :rtype: object
+
+        Remaining keyword arguments are passed to numpy.loadtxt.
+        """
+        data = np.loadtxt(filename, unpack=True, **kwargs)
+
+        return cls(data[0], data[1], x_type, y_type)
+
+    def generate(self, domain):
+        """
+        :param object domain: A domain
+        :return: Linear attenuation on the spectral grid of domain
+        :rtype: double array
+
+        The array is in the same (natural) order as domain.omega.
+        """
+        key = domain.fingerprint()
+        alpha = self.cache.get(key)
+
+        if alpha is None:
+            alpha = np.interp(domain.omega, self.omega, self.values)
+            self.cache[key] = alpha
+
+        return alpha
@@ -0,0 +1,80 @@
+
+"""
+    Copyright (C) 2012  David Bolt
+
+    This file is part of pyofss.
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import numpy as np
+from scipy.constants import hbar
+
+from pyofss.field import ifft, fftshift
+
+
+class QuantumNoise(object):
+    """
+    :param string name: Name of this module
+    :param Uint seed: Seed identifying the random number stream
+    :param Uint run: Run number, selecting an independent stream
+    :param double photons: Number of photons per spectral mode
+    :param Uint channel: Channel sets the field to be modified
+
+    Add quantum noise to a field, as photons (default one) of random phase
+    in each spectral mode of the domain (see Dudley et al., Rev. Mod. Phys.
+    78, 1135 (2006)). A mode at angular frequency omega has energy
+    photons * hbar * omega over the time window.
+
+    Random numbers are drawn from numpy.random.RandomState([seed, run]), so
+    each (seed, run) pair always produces the same noise, and different run
+    numbers give independent streams. Ensemble sets run for each member.
+    """
+    def __init__(self, name="noise", seed=0, run=0, photons=1.0, channel=0):
+        self.name = name
+        self.seed = seed
+        self.run = run
+        self.photons = photons
+        self.channel = channel
+
+        self.field = None
+
+    def __call__(self, domain, field):
+        self.field = field
+
+        noise = self.generate(domain)
+
+        if domain.channels > 1:
+            self.field[self.channel] += noise
+        else:
+            self.field += noise
+
+        return self.field
+
+    def generate(self, domain):
+        """
+        :param object domain: A domain
+        :return: Noise field in the temporal domain. *Unit:* :math:`\sqrt{W}`
+        :rtype: Cvector
+        """
+        random_state = np.random.RandomState([self.seed, self.run])
+        phase = 2.0 * np.pi * random_state.random_sample(domain.total_samples)
+
+        # Mode energy photons * hbar * omega (omega in rad / s) spread over
+        # the window (in s), so amplitude squared is in W:
+        omega = fftshift(domain.omega)
+        amplitude = np.sqrt(self.photons * hbar * omega * 1.0e24 /
+                            domain.window_t)
+
+        return ifft(amplitude * np.exp(1j * phase))
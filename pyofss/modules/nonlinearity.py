@@ -21,8 +21,16 @@
 import numpy as np
 from numpy import pi
 
-from pyofss.field import fft, ifft, fftshift
-from pyofss.domain import Domain
+from pyofss.field import fft, ifft, rfft, irfft, fftshift
+from pyofss.domain import Domain, nu_to_omega, lambda_to_omega
+from pyofss.cache import LRUCache
+
+from kernels import make_kernels
+
+
+# Define exceptions
+class NonlinearityError(Exception):
+    pass
 
 
 def calculate_gamma(nonlinear_index, effective_area,
@@ -59,15 +67,267 @@ def calculate_raman_term(domain, tau_1=12.2e-3, tau_2=32.0e-3):
     return h_R
 
 
+def to_circular(As):
+    """
+    :param array_like As: x and y polarisations, as a (2, N) array
+    :return: Right- and left-handed circular polarisations
+    :rtype: array_like
+    """
+    As = np.asarray(As)
+
+    return np.asarray([As[0] - 1j * As[1], As[0] + 1j * As[1]]) / np.sqrt(2.0)
+
+
+def from_circular(Cs):
+    """
+    :param array_like Cs: Circular polarisations, as a (2, N) array
+    :return: x and y polarisations
+    :rtype: array_like
+    """
+    return np.asarray([Cs[0] + Cs[1], 1j * (Cs[0] - Cs[1])]) / np.sqrt(2.0)
+
+
+class TabulatedRaman(object):
+    """
+    :param array_like t: Tabulated times. *Unit: ps*
+    :param array_like h_R: Tabulated Raman response function
+
+    A Raman response function given as a table, such as a multiple
+    vibrational mode model of silica. May be passed to Nonlinearity (or
+    Fibre) as raman_model, in place of the two-parameter (tau_1, tau_2)
+    model.
+
+    The table is linearly interpolated onto the temporal grid of a domain
+    (zero outside the table) and normalised so that its integral is one.
+    """
+    def __init__(self, t, h_R):
+        t = np.asarray(t, dtype=float)
+        h_R = np.asarray(h_R, dtype=float)
+
+        order = np.argsort(t)
+        self.t = t[order]
+        self.h_R = h_R[order]
+
+    def key(self):
+        """ Return the tabulated values identifying the response. """
+        return (self.__class__.__name__, self.t, self.h_R)
+
+    @classmethod
+    def from_file(cls, filename, **kwargs):
+        """
+        :param string filename: Text file with t and h_R columns
+        :return: Tabulated Raman response
+        :rtype: object
+
+        Keyword arguments are passed to numpy.loadtxt.
+        """
+        data = np.loadtxt(filename, unpack=True, **kwargs)
+
+        return cls(data[0], data[1])
+
+    def generate(self, domain):
+        """
+        :param object domain: A domain
+        :return: Raman response function on the temporal grid of domain
+        :rtype: double array
+        """
+        h_R = np.interp(domain.t, self.t, self.h_R, left=0.0, right=0.0)
+
+        area = np.sum(h_R) * domain.dt
+        if area != 0.0:
+            h_R /= area
+
+        return h_R
+
+
+class GammaSpectrum(object):
+    """
+    :param array_like x: Tabulated spectral values
+    :param array_like y: Tabulated nonlinear parameter or effective area
+    :param string x_type: Type of x values: "omega", "nu", or "lambda"
+    :param string y_type: Type of y values: "gamma" or "A_eff"
+    :param double nonlinear_index: :math:`n_2` (for y_type A_eff).
+                                   *Unit:* :math:`m^2 / W`
+
+    Units of x: omega -- *rad / ps*; nu -- *THz*; lambda -- *nm*.
+
+    Units of y: gamma -- :math:`rad / (W km)`; A_eff -- :math:`\mu m^2`.
+
+    A frequency-dependent nonlinear parameter, :math:`\gamma(\omega)`, for
+    example due to the effective area of a fibre varying over a wide
+    spectrum. May be passed to Nonlinearity (or Fibre) in place of a scalar
+    gamma.
+
+    For y_type A_eff, gamma is calculated at the centre frequency of the
+    domain (see calculate_gamma), so only the variation of effective area
+    is included; the :math:`\omega / \omega_0` dependence remains the
+    self-steepening term. The table is linearly interpolated onto the
+    spectral grid of a domain (holding end values outside the table) and
+    cached.
+    """
+    x_types = ("omega", "nu", "lambda")
+    y_types = ("gamma", "A_eff")
+
+    def __init__(self, x, y, x_type="lambda", y_type="gamma",
+                 nonlinear_index=2.6e-20):
+        if x_type not in self.x_types:
+            raise NonlinearityError(
+                "x_type must be one of %s" % ", ".join(self.x_types))
+
+        if y_type not in self.y_types:
+            raise NonlinearityError(
+                "y_type must be one of %s" % ", ".join(self.y_types))
+
+        x = np.asarray(x, dtype=float)
+        y = np.asarray(y, dtype=float)
+
+        if x_type == "nu":
+            omega = nu_to_omega(x)
+        elif x_type == "lambda":
+            omega = lambda_to_omega(x)
+        else:
+            omega = x
+
+        # Interpolation requires increasing x values:
+        order = np.argsort(omega)
+        self.omega = omega[order]
+        self.values = y[order]
+        self.y_type = y_type
+        self.nonlinear_index = nonlinear_index
+
+        self.cache = LRUCache(4)
+
+    def key(self):
+        """ Return the tabulated values identifying the gamma spectrum. """
+        return (self.__class__.__name__, self.omega, self.values,
+                self.y_type, self.nonlinear_index)
+
+    def generate(self, domain):
+        """
+        :param object domain: A domain
+        :return: Nonlinear parameter on the spectral grid of domain
+        :rtype: double array
+
+        The array is in the same (natural) order as domain.omega.
+        """
+        key = domain.fingerprint()
+        gamma = self.cache.get(key)
+
+        if gamma is None:
+            values = np.interp(domain.omega, self.omega, self.values)
+
+            if self.y_type == "A_eff":
+                gamma = calculate_gamma(self.nonlinear_index, values,
+                                        domain.centre_omega)
+            else:
+                gamma = values
+
+            self.cache[key] = gamma
+
+        return gamma
+
+
+# Raman responses in the spectral domain, keyed by domain fingerprint and
+# Raman parameters. Shared by all nonlinearities, so fibres and sweeps
+# using the same domain calculate each response once:
+raman_cache = LRUCache(16)
+
+
+def raman_spectra(domain, tau_1=12.2e-3, tau_2=32.0e-3, f_R=0.18,
+                  raman_model=None):
+    """
+    :param object domain: A domain
+    :param double tau_1: First adjustable parameter. *Unit: ps*
+    :param double tau_2: Second adjustable parameter. *Unit: ps*
+    :param double f_R: Fractional contribution of Raman response
+    :param object raman_model: Tabulated Raman response, replacing tau_1 and
+                               tau_2 if not None
+    :return: h_R (spectral domain), real and full spectral responses
+    :rtype: tuple
+
+    The real response, (1 - f_R) + f_R rfft(h_R) / N, gives the combined
+    instantaneous and Raman response to the intensity I using real
+    transforms: irfft(real_response * rfft(I), N). The full response is the
+    equivalent for complex transforms, (1 - f_R) + f_R fft(h_R).
+    """
+    key = (domain.fingerprint(), tau_1, tau_2, f_R, raman_model)
+    spectra = raman_cache.get(key)
+
+    if spectra is None:
+        if raman_model is None:
+            h_R_t = calculate_raman_term(domain, tau_1, tau_2)
+        else:
+            h_R_t = raman_model.generate(domain)
+
+        # Require h_R in spectral domain, so take FFT:
+        h_R = fft(h_R_t)
+
+        real_response = (1.0 - f_R) + \
+            f_R * np.fft.rfft(h_R_t) / domain.total_samples
+        response = (1.0 - f_R) + f_R * h_R
+
+        spectra = (h_R, real_response, response)
+        raman_cache[key] = spectra
+
+    return spectra
+
+
 class Nonlinearity(object):
     """
     Nonlinearity is used by fibre to generate a nonlinear factor.
+
+    Domain-dependent arrays (the shifted omega array and the Raman response
+    in the spectral domain) are cached, keyed on the domain fingerprint and
+    the Raman parameters (see raman_spectra). Repeated calls, such as cavity
+    round trips, then skip their construction.
+
+    The Raman response is either the two-parameter model set by tau_1 and
+    tau_2, or a raman_model such as TabulatedRaman. Since the intensity is
+    real, its convolution with the Raman response uses real transforms
+    (rfft and irfft), which require half the work of complex transforms.
+
+    Each nonlinear function uses the minimum number of fft and ifft
+    operations. The number used per evaluation of non and exp_non is stored
+    in non_transforms and exp_non_transforms (see transforms), for comparison
+    with Storage.fft_total.
+
+    gamma is either a scalar or an object with a generate(domain) method
+    returning gamma on the spectral grid (see GammaSpectrum). A
+    frequency-dependent gamma is applied in the spectral domain, together
+    with the self-steepening (shock) factor and any Raman response (if
+    use_all), using spectral_f and spectral_exp_f. These need no more
+    transforms than the self-steepening terms with a scalar gamma. It is
+    only supported for the default (scalar) sim_type.
+
+    For sim_type "vector", the field is a (2, N) array holding the x and y
+    polarisations, and the nonlinear terms of both are calculated together.
+    By default the full coupled equations for a linearly birefringent fibre
+    are used, including the coherent (four-wave mixing) term. The
+    birefringence itself belongs to the linear factor (see Linearity). If
+    manakov is True, the Manakov equation (averaged over rapidly varying
+    birefringence) is used instead, with nonlinearity 8 gamma / 9.
+
+    kernels selects the implementation of the self- and cross-phase
+    modulation terms (without self-steepening or Raman scattering):
+    "numpy" (or None) uses numpy expressions; "fused" uses ufunc chains
+    writing into reused workspace arrays; "numexpr" evaluates each term in
+    a single pass using numexpr, if installed (see pyofss.modules.kernels).
     """
+    # Number of fft and ifft operations used by each nonlinear function. The
+    # general expression f_all requires only two without self-steepening:
+    transforms = {"f": 0, "exp_f": 0, "f_with_ss": 2, "exp_f_with_ss": 2,
+                  "f_with_rs": 2, "exp_f_with_rs": 2,
+                  "f_with_ss_and_rs": 4, "exp_f_with_ss_and_rs": 4,
+                  "f_all": 4, "exp_f_all": 2,
+                  "spectral_f": 2, "spectral_exp_f": 2}
+
     def __init__(self, gamma=None, sim_type=None, self_steepening=False,
                  raman_scattering=False, rs_factor=3e-3, use_all=False,
-                 tau_1=12.2e-3, tau_2=32.0e-3, f_R=0.18):
+                 tau_1=12.2e-3, tau_2=32.0e-3, f_R=0.18,
+                 raman_model=None, kernels=None, manakov=False):
 
         self.gamma = gamma
+        self.manakov = manakov
         self.self_steepening = self_steepening
         self.raman_scattering = raman_scattering
         self.rs_factor = rs_factor
@@ -76,11 +336,20 @@ class Nonlinearity(object):
         self.tau_1 = tau_1
         self.tau_2 = tau_2
         self.f_R = f_R
+        self.raman_model = raman_model
 
         self.generate_nonlinearity = getattr(
             self, "%s_nonlinearity" % sim_type, self.default_nonlinearity)
 
-        if use_all:
+        if hasattr(gamma, "generate") and sim_type is not None:
+            raise NonlinearityError(
+                "frequency-dependent gamma requires the default sim_type")
+
+        if hasattr(gamma, "generate"):
+            print "Using frequency-dependent nonlinearity"
+            self.non = self.spectral_f
+            self.exp_non = self.spectral_exp_f
+        elif use_all:
             print "Using general expression for nonlinearity"
             self.non = getattr(self, "%s_f_all" % sim_type, self.default_f_all)
             self.exp_non = getattr(self, "%s_exp_f_all" % sim_type,
@@ -111,35 +380,110 @@ class Nonlinearity(object):
                 self.exp_non = getattr(self, "%s_exp_f" % sim_type,
                                        self.default_exp_f)
 
+        self.kernels = kernels
+        self.kernel = make_kernels(kernels)
+
+        if self.kernel is not None:
+            # Multi-channel functions all reduce to wdm_f and wdm_exp_f:
+            kernel_functions = {
+                self.default_f: self.kernel_f,
+                self.default_exp_f: self.kernel_exp_f,
+                self.wdm_f: self.kernel_wdm_f,
+                self.wdm_f_with_ss: self.kernel_wdm_f,
+                self.wdm_f_with_rs: self.kernel_wdm_f,
+                self.wdm_f_with_ss_and_rs: self.kernel_wdm_f,
+                self.wdm_exp_f: self.kernel_wdm_exp_f,
+                self.wdm_exp_f_with_ss: self.kernel_wdm_exp_f,
+                self.wdm_exp_f_with_rs: self.kernel_wdm_exp_f,
+                self.wdm_exp_f_with_ss_and_rs: self.kernel_wdm_exp_f}
+            self.non = kernel_functions.get(self.non, self.non)
+            self.exp_non = kernel_functions.get(self.exp_non, self.exp_non)
+
         self.ss_factor = None
-        self.rs_factor = None
         self.h_R = None
         self.omega = None
         self.centre_omega = None
         self.factor = None
+        self.gamma_spectrum = None
+        self.spectral_factor = None
+        self.shock = None
+        self.raman_response = None
+        self.real_raman_response = None
+        self.raman_shock = None
+
+        self.non_transforms = None
+        self.exp_non_transforms = None
+
+        self.cache = LRUCache(4)
 
     def __call__(self, domain):
         self.centre_omega = domain.centre_omega
-        self.omega = fftshift(domain.omega - domain.centre_omega)
 
         if self.self_steepening:
             self.ss_factor = 1.0 / self.centre_omega
         else:
             self.ss_factor = 0.0
 
+        key = domain.fingerprint()
+        self.omega = self.cache.get(key)
+
+        if self.omega is None:
+            self.omega = fftshift(domain.omega - domain.centre_omega)
+            self.cache[key] = self.omega
+
+        self.shock = 1.0 + self.omega * self.ss_factor
+
         if self.use_all:
-            # Require h_R in spectral domain, so take FFT of returned value:
-            self.h_R = fft(calculate_raman_term(
-                domain, self.tau_1, self.tau_2))
+            (self.h_R, self.real_raman_response, self.raman_response) = \
+                raman_spectra(domain, self.tau_1, self.tau_2, self.f_R,
+                              self.raman_model)
+            self.raman_shock = self.shock * self.raman_response
         else:
             self.h_R = 0.0
 
+        if hasattr(self.gamma, "generate"):
+            self.gamma_spectrum = fftshift(self.gamma.generate(domain))
+        else:
+            self.gamma_spectrum = None
+
         self.generate_nonlinearity()
 
+        if self.gamma_spectrum is not None:
+            # Fold gamma(omega) and the shock factor into one multiplier:
+            self.spectral_factor = self.factor * self.shock
+
+        self.count_transforms()
+
+    def count_transforms(self):
+        """ Set the number of transforms used per nonlinear evaluation. """
+        def count(function):
+            """ Look up function by name, without the sim_type prefix. """
+            name = function.__name__
+            if name in self.transforms:
+                return self.transforms[name]
+            if not name.startswith("default_"):
+                # Multi-channel functions use no transforms:
+                return 0
+            return self.transforms[name[len("default_"):]]
+
+        self.non_transforms = count(self.non)
+        self.exp_non_transforms = count(self.exp_non)
+
+        if self.non == self.default_f_all and self.ss_factor == 0.0:
+            self.non_transforms = 2
+
+        if self.non == self.spectral_f and self.use_all:
+            self.non_transforms = 4
+
+        if self.exp_non == self.spectral_exp_f and self.use_all:
+            self.exp_non_transforms = 4
+
     def default_nonlinearity(self):
         """ Set the common factor for default. """
         if self.gamma is None:
             self.factor = 0.0
+        elif self.gamma_spectrum is not None:
+            self.factor = 1j * self.gamma_spectrum
         else:
             self.factor = 1j * self.gamma
 
@@ -153,19 +497,54 @@ class Nonlinearity(object):
     def default_f_all(self, A, z):
         """ Set all nonlinear terms. """
         term_spm = np.abs(A) ** 2
-        convolution = ifft(self.h_R * fft(term_spm))
-        p = fft(A * (1.0 - self.f_R) * term_spm + self.f_R * A * convolution)
 
-        return ifft(self.factor * (1.0 + self.omega * self.ss_factor) * p)
+        # Response (1 - f_R)|A|^2 + f_R (h_R * |A|^2), using one pair of
+        # real transforms:
+        response = irfft(self.real_raman_response * rfft(term_spm),
+                         term_spm.size)
+
+        if self.ss_factor == 0.0:
+            return self.factor * response * A
+
+        return ifft(self.factor * self.shock * fft(response * A))
 
     def default_exp_f_all(self, A, h, B):
         """ Set all terms within an exponential factor. """
         term_spm = np.abs(A) ** 2
-        convolution = ifft(self.h_R * fft(term_spm))
-        p = fft((1.0 - self.f_R) * term_spm + self.f_R * convolution)
 
-        return np.exp(h * ifft(self.factor *
-                      (1.0 + self.omega * self.ss_factor) * p)) * B
+        if self.ss_factor == 0.0:
+            response = irfft(self.real_raman_response * rfft(term_spm),
+                             term_spm.size)
+            return np.exp(h * self.factor * response) * B
+
+        # The spectrum of the response is raman_response * fft(|A|^2), so
+        # the self-steepening factor may be applied before transforming back:
+        return np.exp(h * ifft(self.factor * self.raman_shock *
+                               fft(term_spm))) * B
+
+    def spectral_f(self, A, z):
+        """ Use frequency-dependent gamma (with shock and Raman terms). """
+        term_spm = np.abs(A) ** 2
+
+        if self.use_all:
+            term_spm = irfft(self.real_raman_response * rfft(term_spm),
+                             term_spm.size)
+
+        return ifft(self.spectral_factor * fft(term_spm * A))
+
+    def spectral_exp_f(self, A, h, B):
+        """ Use frequency-dependent gamma in exponential term. """
+        # gamma(omega) applies to the field spectrum, so form the exponent
+        # N(A) / A, which is i gamma |A|^2 for a constant gamma. Where A is
+        # zero (or at the noise floor), the nonlinear phase is negligible,
+        # so leave the exponent zero rather than dividing:
+        term = self.spectral_f(A, None)
+        A_abs = np.abs(A)
+        exponent = np.zeros(term.shape, complex)
+        np.divide(term, A, out=exponent,
+                  where=(A_abs > 1.0e-8 * np.max(A_abs)))
+
+        return np.exp(h * exponent) * B
 
     def default_f_with_ss(self, A, z):
         """ Use self-steepening only. """
@@ -217,22 +596,22 @@ class Nonlinearity(object):
         return np.exp(h * self.factor * np.abs(A) ** 2) * B
 
     def wdm_f_with_ss(self, As, z):
-        self.wdm_f(As, z)
+        return self.wdm_f(As, z)
 
     def wdm_exp_f_with_ss(self, As, h, Bs):
-        self.wdm_exp_f(As, h, Bs)
+        return self.wdm_exp_f(As, h, Bs)
 
     def wdm_f_with_rs(self, As, z):
-        self.wdm_f(As, z)
+        return self.wdm_f(As, z)
 
     def wdm_exp_f_with_rs(self, As, h, Bs):
-        self.wdm_exp_f(As, h, Bs)
+        return self.wdm_exp_f(As, h, Bs)
 
     def wdm_f_with_ss_and_rs(self, As, z):
-        self.wdm_f(As, z)
+        return self.wdm_f(As, z)
 
     def wdm_exp_f_with_ss_and_rs(self, As, h, Bs):
-        self.wdm_exp_f(As, h, Bs)
+        return self.wdm_exp_f(As, h, Bs)
 
     def wdm_f(self, As, z):
         return np.asarray(
@@ -247,3 +626,84 @@ class Nonlinearity(object):
              (np.abs(As[0]) ** 2 + 2.0 * np.abs(As[1]) ** 2)) * Bs[0],
              np.exp(h * self.factor[1] *
              (np.abs(As[1]) ** 2 + 2.0 * np.abs(As[0]) ** 2)) * Bs[1]])
+
+    def kernel_f(self, A, z):
+        """ Self-phase modulation using kernels. """
+        return self.kernel.multiply(self.factor, self.kernel.intensity(A), A)
+
+    def kernel_exp_f(self, A, h, B):
+        """ Self-phase modulation in exponential factor using kernels. """
+        return self.kernel.exp_multiply(h * self.factor,
+                                        self.kernel.intensity(A), B)
+
+    def kernel_wdm_f(self, As, z):
+        """ Self- and cross-phase modulation using kernels. """
+        (S_0, S_1) = self.kernel.cross_intensity(As)
+
+        result = np.empty(np.shape(As), complex)
+        self.kernel.multiply(self.factor[0], S_0, As[0], result[0])
+        self.kernel.multiply(self.factor[1], S_1, As[1], result[1])
+
+        return result
+
+    def kernel_wdm_exp_f(self, As, h, Bs):
+        """ Self- and cross-phase modulation in exponential factor. """
+        (S_0, S_1) = self.kernel.cross_intensity(As)
+
+        result = np.empty(np.shape(Bs), complex)
+        self.kernel.exp_multiply(h * self.factor[0], S_0, Bs[0], result[0])
+        self.kernel.exp_multiply(h * self.factor[1], S_1, Bs[1], result[1])
+
+        return result
+
+    def vector_f_all(self, As, z):
+        return self.vector_f(As, z)
+
+    def vector_exp_f_all(self, As, h, Bs):
+        return self.vector_exp_f(As, h, Bs)
+
+    def vector_f_with_ss(self, As, z):
+        return self.vector_f(As, z)
+
+    def vector_exp_f_with_ss(self, As, h, Bs):
+        return self.vector_exp_f(As, h, Bs)
+
+    def vector_f_with_rs(self, As, z):
+        return self.vector_f(As, z)
+
+    def vector_exp_f_with_rs(self, As, h, Bs):
+        return self.vector_exp_f(As, h, Bs)
+
+    def vector_f_with_ss_and_rs(self, As, z):
+        return self.vector_f(As, z)
+
+    def vector_exp_f_with_ss_and_rs(self, As, h, Bs):
+        return self.vector_exp_f(As, h, Bs)
+
+    def vector_f(self, As, z):
+        """ Coupled nonlinear terms of both polarisations (linear basis). """
+        As = np.asarray(As)
+        I = np.abs(As) ** 2
+
+        if self.manakov:
+            return (8.0 / 9.0) * self.factor * (I[0] + I[1]) * As
+
+        # Reversing rows exchanges the x and y polarisations:
+        return self.factor * ((I + (2.0 / 3.0) * I[::-1]) * As +
+                              np.conj(As) * As[::-1] ** 2 / 3.0)
+
+    def vector_exp_f(self, As, h, Bs):
+        """
+        Coupled nonlinear terms in exponential factor. The birefringent
+        case is diagonal in the circular basis, so is applied there.
+        """
+        As = np.asarray(As)
+
+        if self.manakov:
+            I = np.abs(As) ** 2
+            return np.exp(h * (8.0 / 9.0) * self.factor * (I[0] + I[1])) * Bs
+
+        I = np.abs(to_circular(As)) ** 2
+        phase = h * (2.0 / 3.0) * self.factor * (I + 2.0 * I[::-1])
+
+        return from_circular(np.exp(phase) * to_circular(Bs))
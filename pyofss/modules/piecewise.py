@@ -0,0 +1,67 @@
+
+"""
+    Copyright (C) 2012  David Bolt
+
+    This file is part of pyofss.
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+from bisect import bisect_right
+
+
+# Define exceptions
+class PiecewiseError(Exception):
+    pass
+
+
+class Piecewise(object):
+    """
+    :param array_like boundaries: Increasing z-values separating segments
+    :param array_like values: Parameter value within each segment
+
+    A piecewise-constant parameter profile along a fibre. values contains
+    one more element than boundaries: values[0] applies for z less than
+    boundaries[0], and values[i] for z in [boundaries[i - 1], boundaries[i]).
+
+    Values may be of any type accepted for the parameter, for example a list
+    of beta values. Passing a Piecewise parameter to Fibre makes the stepper
+    end a step on each boundary, with operators cached for each segment.
+    """
+    def __init__(self, boundaries, values):
+        boundaries = list(boundaries)
+        values = list(values)
+
+        if len(values) != len(boundaries) + 1:
+            raise PiecewiseError(
+                "Require one more value than the number of boundaries")
+
+        if any(b_2 <= b_1 for (b_1, b_2) in zip(boundaries[:-1],
+                                                 boundaries[1:])):
+            raise PiecewiseError("Boundaries must be strictly increasing")
+
+        self.boundaries = boundaries
+        self.values = values
+
+    def key(self):
+        """ Return the boundaries and values identifying the profile. """
+        return (self.__class__.__name__, tuple(self.boundaries),
+                tuple(self.values))
+
+    def segment(self, z):
+        """ Return the index of the segment containing z. """
+        return bisect_right(self.boundaries, z)
+
+    def __call__(self, z):
+        return self.values[self.segment(z)]
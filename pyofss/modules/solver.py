@@ -20,6 +20,8 @@
 
 import numpy as np
 
+from kernels import Workspace
+
 
 # Define exceptions
 class SolverError(Exception):
@@ -34,9 +36,17 @@ class Solver(object):
     """
     :param string method: Name of solver method to be used
     :param object f: Derivative function
+    :param bool use_workspace: Hold intermediate stages in reused arrays
 
     Solver consists of both explicit and embedded routines for ODE integration.
 
+    If use_workspace is True, rk4ip, rk4, and midpoint (and so ss_sym_rk4
+    and ss_sym_midpoint, which use them for the nonlinear stage) are
+    replaced by versions holding their stages and partial sums in workspace
+    arrays kept for the life of the solver, updated in place. Only the
+    results of f (and of its transforms) and the returned field are newly
+    allocated. These versions expect a complex field.
+
     .. note::
       For embedded methods:
       Even though the calculated error applies to A_coarse, it has become
@@ -45,28 +55,59 @@ class Solver(object):
       It is for this reason that the embedded methods only return A_fine
       rather than A_coarse, or even both (A_coarse, A_fine). To be strict,
       return A_coarse in the methods.
+
+    erk4ip is an embedded fourth/third-order interaction picture method
+    (Balac and Mahe, Comput. Phys. Commun. 184, 1211 (2013)). Its final
+    nonlinear evaluation, N(A_fine), is the first evaluation of the next
+    step (first same as last). An adaptive step then costs four linear
+    steps (eight transforms) and four nonlinear evaluations, compared with
+    three rk4ip steps for step-doubling. Stored evaluations (fsal) are
+    reused only for the field last passed in or returned (following a
+    rejected or accepted step); reset discards them.
     """
+
     # The following ssfm_solvers have been replaced with ss_solvers:
     ssfm_solvers = ["ssfm", "ssfm_reduced", "ssfm_sym",
                     "ssfm_sym_midpoint", "ssfm_sym_rk4", "ssfm_sym_rkf"]
     explicit_solvers = ["euler", "midpoint", "rk4"]
-    embedded_solvers = ["bs", "rkf", "ck", "dp"]
+    embedded_solvers = ["bs", "rkf", "ck", "dp", "erk4ip"]
     ss_solvers = ["ss_simple", "ss_symmetric", "ss_reduced",
                   "ss_agrawal", "ss_sym_midpoint", "ss_sym_rk4"]
     other_solvers = ["rk4ip", ]
 
+    # Symmetric split-step methods of the form L(h / 2) N(h) L(h / 2). The
+    # trailing linear half-step of one step may be merged with the leading
+    # half-step of the next. (ss_symmetric is excluded since its nonlinear
+    # stage uses the field from before the leading linear half-step.)
+    fusable_solvers = ["ss_reduced", "ss_sym_midpoint", "ss_sym_rk4"]
+
     # For embedded methods, use local error of the lower order method:
     errors = {"euler": 2, "midpoint": 3, "rk4": 5,
               "bs": 2, "rkf": 4, "ck": 4, "dp": 4, "ss_simple": 2,
               "ss_symmetric": 3, "ss_reduced": 2, "ss_agrawal": 3,
-              "ss_sym_midpoint": 3, "ss_sym_rk4": 5, "rk4ip": 5}
+              "ss_sym_midpoint": 3, "ss_sym_rk4": 5, "rk4ip": 5,
+              "erk4ip": 3}
 
-    def __init__(self, method="rk4", f=None):
+    def __init__(self, method="rk4", f=None, use_workspace=False):
         if method.lower() in self.embedded_solvers:
             self.embedded = True
         else:
             self.embedded = False
 
+        self.fusable = method.lower() in self.fusable_solvers
+        self.name = method.lower()
+
+        # Nonlinear evaluations (A, N(A)) saved by erk4ip for the next step:
+        self.fsal = None
+
+        self.workspace = Workspace()
+        self.use_workspace = use_workspace
+        if use_workspace:
+            # Instance attributes take precedence over the static methods:
+            self.rk4ip = self.rk4ip_workspace
+            self.rk4 = self.rk4_workspace
+            self.midpoint = self.midpoint_workspace
+
         # Do not use a default for getattr. Better to raise an exception.
         self.method = getattr(self, method.lower())
 
@@ -81,6 +122,17 @@ class Solver(object):
         """ Return A_fine, calculated by method. """
         return self.method(A, z, h, self.f)
 
+    def reset(self):
+        """ Discard saved evaluations, such as after parameters change. """
+        self.fsal = None
+
+    def nonlinear_stage(self, A, z, h):
+        """
+        Return the result of the nonlinear stage, N(h), of a fusable method.
+        A should already include the leading linear half-step.
+        """
+        return getattr(self, "%s_nonlinear" % self.name)(A, z, h, self.f)
+
     @staticmethod
     def euler(A, z, h, f):
         """ Euler method """
@@ -245,10 +297,15 @@ class Solver(object):
         # return f.nonlinear(A_L, 0.5 * h, A_L)
 
         A_L = f.linear(A, 0.5 * h)
-        A_N = f.nonlinear(A_L, h, A_L)
+        A_N = Solver.ss_reduced_nonlinear(A_L, z, h, f)
 
         return f.linear(A_N, 0.5 * h)
 
+    @staticmethod
+    def ss_reduced_nonlinear(A, z, h, f):
+        """ Nonlinear stage of reduced split-step method """
+        return f.nonlinear(A, h, A)
+
     @staticmethod
     def ss_agrawal(A, z, h, f):
         """ Agrawal (iterative) split-step method """
@@ -270,19 +327,27 @@ class Solver(object):
     def ss_sym_midpoint(self, A, z, h, f):
         """ Symmetric split-step method (midpoint method for nonlinear) """
         A_L = f.linear(A, 0.5 * h)
-        A_N = self.midpoint(A_L, z, h, f.n)
+        A_N = self.ss_sym_midpoint_nonlinear(A_L, z, h, f)
 
         return f.linear(A_N, 0.5 * h)
 
+    def ss_sym_midpoint_nonlinear(self, A, z, h, f):
+        """ Nonlinear stage of ss_sym_midpoint """
+        return self.midpoint(A, z, h, f.n)
+
     def ss_sym_rk4(self, A, z, h, f):
         """
         Symmetric split-step method (classical Runge-Kutta for nonlinear)
         """
         A_L = f.linear(A, 0.5 * h)
-        A_N = self.rk4(A_L, z, h, f.n)
+        A_N = self.ss_sym_rk4_nonlinear(A_L, z, h, f)
 
         return f.linear(A_N, 0.5 * h)
 
+    def ss_sym_rk4_nonlinear(self, A, z, h, f):
+        """ Nonlinear stage of ss_sym_rk4 """
+        return self.rk4(A, z, h, f.n)
+
     @staticmethod
     def rk4ip(A, z, h, f):
         """ Runge-Kutta in the interaction picture method """
@@ -299,3 +364,115 @@ class Solver(object):
 
         # Transform back to normal picture (k3 already is) after the step:
         return (k3 / 6.0) + f.linear(A_I + (k0 + 2.0 * (k1 + k2)) / 6.0, hh)
+
+    def erk4ip(self, A, z, h, f):
+        """
+        Embedded Runge-Kutta in the interaction picture method (local orders:
+        four and three), reusing the last nonlinear evaluation
+        """
+        hh = 0.5 * h
+
+        # Reuse N(A) if A is the field returned by (or passed to) the last
+        # step, as after an accepted (or rejected) step:
+        N_A = None
+        if self.fsal is not None:
+            for (A_saved, N_saved) in self.fsal:
+                if A_saved is A:
+                    N_A = N_saved
+        if N_A is None:
+            N_A = f.n(A, z)
+
+        # Transform A into interaction picture:
+        A_I = f.linear(A, hh)
+
+        k1 = f.linear(h * N_A, hh)
+        k2 = h * f.n(A_I + 0.5 * k1, z + hh)
+        k3 = h * f.n(A_I + 0.5 * k2, z + hh)
+        k4 = h * f.n(f.linear(A_I + k3, hh), z + h)
+
+        beta = f.linear(A_I + k1 / 6.0 + (k2 + k3) / 3.0, hh)
+        A_fine = beta + k4 / 6.0
+
+        N_fine = f.n(A_fine, z + h)
+        self.fsal = ((A, N_A), (A_fine, N_fine))
+
+        A_coarse = beta + k4 / 15.0 + h * N_fine / 10.0
+
+        return A_fine, A_coarse
+
+    def buffers(self, A, *names):
+        """ Return workspace arrays, of the shape of A, called names. """
+        shape = np.shape(A)
+
+        return [self.workspace.get(name, shape, complex) for name in names]
+
+    def midpoint_workspace(self, A, z, h, f):
+        """ Midpoint method, using workspace arrays """
+        (stage, k) = self.buffers(A, "stage", "k")
+
+        np.multiply(f(A, z), 0.5 * h, out=stage)
+        stage += A
+        np.multiply(f(stage, z + 0.5 * h), h, out=k)
+
+        return A + k
+
+    def rk4_workspace(self, A, z, h, f):
+        """ Runge-Kutta fourth-order method, using workspace arrays """
+        (stage, k, total) = self.buffers(A, "stage", "k", "total")
+        hh = 0.5 * h
+
+        np.multiply(f(A, z), h, out=k)
+        total[...] = k
+        np.multiply(k, 0.5, out=stage)
+        stage += A
+
+        np.multiply(f(stage, z + hh), h, out=k)
+        np.multiply(k, 0.5, out=stage)
+        stage += A
+        k *= 2.0
+        total += k
+
+        np.multiply(f(stage, z + hh), h, out=k)
+        np.add(A, k, out=stage)
+        k *= 2.0
+        total += k
+
+        np.multiply(f(stage, z + h), h, out=k)
+        total += k
+        total /= 6.0
+
+        return A + total
+
+    def rk4ip_workspace(self, A, z, h, f):
+        """ Runge-Kutta in the interaction picture, using workspace arrays """
+        (stage, k, total) = self.buffers(A, "stage", "k", "total")
+        hh = 0.5 * h
+
+        # Transform A into interaction picture:
+        A_I = f.linear(A, hh)
+
+        np.multiply(f.n(A, z), h, out=k)
+        total[...] = f.linear(k, hh)
+        np.multiply(total, 0.5, out=stage)
+        stage += A_I
+
+        np.multiply(f.n(stage, z + hh), h, out=k)
+        np.multiply(k, 0.5, out=stage)
+        stage += A_I
+        k *= 2.0
+        total += k
+
+        np.multiply(f.n(stage, z + hh), h, out=k)
+        np.add(A_I, k, out=stage)
+        k *= 2.0
+        total += k
+
+        np.multiply(f.n(f.linear(stage, hh), z + h), h / 6.0, out=k)
+        total /= 6.0
+        total += A_I
+
+        # Transform back to normal picture (k3 already is) after the step:
+        A_out = f.linear(total, hh)
+        A_out += k
+
+        return A_out
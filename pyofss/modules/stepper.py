@@ -25,6 +25,11 @@ from storage import Storage
 from solver import Solver
 
 
+# Define exceptions
+class StepperError(Exception):
+    pass
+
+
 class Stepper(object):
     """
     :param Uint traces: Number of ouput trace to use
@@ -33,6 +38,21 @@ class Stepper(object):
     :param object f: Derivative function to be solved
     :param double length: Length to integrate over
     :param Uint total_steps: Number of steps to use for ODE integration
+    :param array_like stop_conditions: Functions of (z, A) ending integration
+    :param Uint stop_interval: Number of steps between stop condition checks
+    :param double step_ratio: Ratio of geometric ladder for adaptive steps
+    :param array_like boundaries: z-values on which a step must end
+    :param object update: Function of (z, h) called before each step
+    :param bool fuse_half_steps: Merge adjacent linear half-steps if possible
+    :param double nonlinear_tolerance: Nonlinear phase below which steps are
+                                       linear
+    :param object nonlinear_phase: Function of (A, h) estimating the
+                                   nonlinear phase of a step
+    :param bool use_workspace: Use solver methods with reused stage arrays
+    :param string error_control: Error estimate used by the adaptive stepper
+    :param object conservation_error: Function of (A_in, A_out, h) returning
+                                      the relative change in a conserved
+                                      quantity over a step
 
     method:
       * EULER -- Euler method;
@@ -48,21 +68,118 @@ class Stepper(object):
       * SS_AGRAWAL -- Agrawal (iterative) split-step method;
       * SS_SYM_MIDPOINT -- Symmetric split-step method (MIDPOINT for nonlinear)
       * SS_SYM_RK4 -- Symmetric split-step method (RK4 for nonlinear);
-      * RK4IP -- Runge-Kutta in the interaction picture method.
+      * RK4IP -- Runge-Kutta in the interaction picture method;
+      * ERK4IP -- Embedded Runge-Kutta in the interaction picture method.
 
       Each method may use an adaptive stepper by prepending an 'A' to the name.
+      Embedded methods (such as ERK4IP) estimate the error of each step
+      internally; other methods use step-doubling.
 
     traces:
       * 0 -- Store A for each succesful step;
       * 1 -- Store A at final value (length) only;
       * >1 -- Store A for each succesful step then use interpolation to get A
          values for equally spaced z-values, calculated using traces.
+
+    stop_conditions:
+      Each condition is called as condition(z, A) after every stop_interval
+      (successful) steps. If any condition returns True, integration ends
+      early. The z value reached is stored in stop_z (None if integration
+      reached length), and the condition in stopped_by. Traces are then
+      spaced uniformly over [0, stop_z].
+
+    step_ratio:
+      If not None, each step-size chosen by the adaptive stepper is rounded
+      down to h0 * step_ratio**k, for initial step-size h0 and integer k.
+      Repeated step-sizes allow cached linear factors to be reused.
+
+    boundaries:
+      Steps never cross a boundary, such as the join between two fibre
+      segments. The standard stepper adds boundaries to its mesh of z-values;
+      the adaptive stepper shortens any step which would cross a boundary.
+
+    update:
+      Called as update(z, h) before each step from z to z + h, allowing
+      z-dependent parameters of f to be set for that step. Should return
+      False if no parameter changed, in which case the solver keeps any
+      evaluation it reuses between steps (see Solver.reset).
+
+    fuse_half_steps:
+      For the standard stepper with a symmetric split-step method of the form
+      L(h / 2) N(h) L(h / 2) (see Solver.fusable_solvers), the trailing
+      linear half-step of each step is merged with the leading half-step of
+      the next, saving one fft and ifft per step. Half-steps are separated
+      only where the field is required: at stored traces, stop condition
+      checks, and the final step. If traces fall on mesh points, only those
+      points are stored. Ignored if update is used.
+
+    nonlinear_tolerance:
+      If not None, the nonlinear phase of each step is estimated before the
+      step as nonlinear_phase(A, h). Below nonlinear_tolerance, the
+      nonlinear contribution is neglected and the step uses exact linear
+      propagation (f.linear) only. Since the estimate is made for every
+      step, full steps resume once the power recovers (for example within
+      an amplifying segment). The adaptive stepper accepts a linear step
+      without an error estimate, and keeps its step-size. The number of
+      linear steps is stored in linear_steps.
+
+    use_workspace:
+      Passed to Solver. Stage arrays are then allocated once, and reused for
+      every step taken by this stepper.
+
+    error_control:
+      * local -- Estimate the local error of each step using step-doubling,
+        or internally for embedded methods (default);
+      * conservation -- Use the relative change in a conserved quantity,
+        conservation_error(A_in, A_out, h), as the error of each step (see
+        Heidt, J. Lightw. Technol. 27, 3984 (2009)). Each attempt is a single
+        step of the method, with no error estimate from further steps. As
+        for the local error, steps with an error above 2 * local_error are
+        rejected. The step-size is then halved; otherwise it is reduced
+        (increased) by a factor of 2**(1/5) for an error above local_error
+        (below local_error / 2). Suits conservative (or nearly conservative)
+        problems, where the change is a good measure of the local error.
     """
     def __init__(self, traces=1, local_error=1.0e-6, method="RK4",
-                 f=None, length=1.0, total_steps=100):
+                 f=None, length=1.0, total_steps=100,
+                 stop_conditions=None, stop_interval=1, step_ratio=None,
+                 boundaries=None, update=None, fuse_half_steps=False,
+                 nonlinear_tolerance=None, nonlinear_phase=None,
+                 use_workspace=False, error_control="local",
+                 conservation_error=None):
         self.traces = traces
         self.local_error = local_error
 
+        if stop_conditions is None:
+            self.stop_conditions = []
+        else:
+            self.stop_conditions = stop_conditions
+        self.stop_interval = stop_interval
+        self.stop_z = None
+        self.stopped_by = None
+
+        self.step_ratio = step_ratio
+
+        if boundaries is None:
+            self.boundaries = []
+        else:
+            self.boundaries = sorted(boundaries)
+        self.update = update
+        self.fuse_half_steps = fuse_half_steps
+
+        self.nonlinear_tolerance = nonlinear_tolerance
+        self.nonlinear_phase = nonlinear_phase
+        self.linear_steps = 0
+
+        if error_control not in ["local", "conservation"]:
+            raise StepperError(
+                "error_control must be either local or conservation")
+        if error_control == "conservation" and conservation_error is None:
+            raise StepperError(
+                "conservation error control requires conservation_error")
+        self.error_control = error_control
+        self.conservation_error = conservation_error
+
         # Check if adaptive stepsize is required:
         if method.upper().startswith('A'):
             self.adaptive = True
@@ -74,7 +191,7 @@ class Stepper(object):
         #~print "Using {0} method".format( self.method )
 
         # Delegate method and function to solver
-        self.solver = Solver(self.method, f)
+        self.solver = Solver(self.method, f, use_workspace)
         self.step = self.solver
 
         self.length = length
@@ -99,8 +216,16 @@ class Stepper(object):
     def __call__(self, A):
         """ Delegate to appropriate function, adaptive- or standard-stepper """
 
+        self.storage.reset()
         self.storage.reset_fft_counter()
 
+        self.stop_z = None
+        self.stopped_by = None
+        self.linear_steps = 0
+
+        # Evaluations saved from a previous propagation are not valid:
+        self.solver.reset()
+
         if self.adaptive:
             return self.adaptive_stepper(A)
         else:
@@ -113,44 +238,207 @@ class Stepper(object):
         # Initialise:
         self.A_out = A
 
-        # Require an initial step-size:
-        h = self.length / self.total_steps
+        # Construct mesh points for z (including any boundaries):
+        zs = self.mesh()
+        total_steps = len(zs) - 1
 
-        # Construct mesh points for z:
-        zs = np.linspace(0.0, self.length, self.total_steps + 1)
+        # Require step-sizes, which are equal unless there are boundaries:
+        if self.boundaries:
+            hs = np.diff(zs)
+        else:
+            hs = np.ones(total_steps) * (self.length / self.total_steps)
 
         # Construct mesh points for traces:
-        if self.traces != self.total_steps:
+        if self.traces != total_steps:
             trace_zs = np.linspace(0.0, self.length, self.traces + 1)
 
+        # Merge linear half-steps if possible. With fused steps, store only
+        # those steps falling on trace points if they are all mesh points:
+        fused = self.fuse_half_steps and self.solver.fusable and \
+            (self.update is None)
+        store_every = 1
+        if fused and self.traces > 1 and not self.boundaries and \
+                total_steps % self.traces == 0:
+            store_every = total_steps // self.traces
+
+        # Length of linear step not yet applied (if fused):
+        pending = 0.0
+
         # Make sure to store the initial A if more than one trace is required:
         if self.traces != 1:
             self.storage.append(zs[0], self.A_out)
 
         # Start at z = 0.0 and repeat until z = length - h (inclusive),
         # i.e. z[-1]
-        for z in zs[:-1]:
+        for s, z in enumerate(zs[:-1]):
+            h = hs[s]
+
+            if self.update is not None and self.update(z, h) is not False:
+                self.solver.reset()
+
             # Currently at L = z
-            if self.solver.embedded:
+            if fused:
+                A_L = self.solver.f.linear(self.A_out, pending + 0.5 * h)
+                if self.negligible(A_L, h):
+                    # Leave the linear half-step pending, so that linear
+                    # propagation remains exact:
+                    self.A_out = A_L
+                else:
+                    self.A_out = self.solver.nonlinear_stage(A_L, z, h)
+                pending = 0.5 * h
+
+                if not self.field_required(s + 1, total_steps, store_every):
+                    # Field is not yet at L = z + h:
+                    continue
+
+                self.A_out = self.solver.f.linear(self.A_out, pending)
+                pending = 0.0
+            elif self.negligible(self.A_out, h):
+                self.A_out = self.solver.f.linear(self.A_out, h)
+            elif self.solver.embedded:
                 self.A_out, A_other = self.step(self.A_out, z, h)
             else:
                 self.A_out = self.step(self.A_out, z, h)
             # Now at L = z + h
 
             # If multiple traces required, store A_out at each relavant z
-            # value:
-            if self.traces != 1:
+            # value. With stop conditions, store each field formed (fused),
+            # so that traces up to stop_z may be interpolated:
+            if self.traces != 1 and ((s + 1) % store_every == 0 or
+                                     self.stop_conditions):
                 self.storage.append(z + h, self.A_out)
 
+            if self.stop_reached(s + 1, z + h, self.A_out):
+                break
+
         # Store total number of fft and ifft operations that were used:
         self.storage.store_current_fft_count()
 
         # Need to interpolate dense output to grid points set by traces:
-        if self.traces > 1 and (self.traces != self.total_steps):
-            self.storage.interpolate_As_for_z_values(trace_zs)
+        if self.traces > 1 and (self.traces != total_steps) and \
+                (store_every == 1 or self.stop_conditions):
+            self.interpolate_traces(trace_zs)
 
         return self.A_out
 
+    def field_required(self, step, total_steps, store_every):
+        """
+        :param Uint step: Number of steps taken
+        :param Uint total_steps: Total number of steps
+        :param Uint store_every: Number of steps between stored fields
+        :return: Whether the field is required after step
+        :rtype: bool
+        """
+        if step == total_steps:
+            return True
+
+        if self.traces != 1 and step % store_every == 0:
+            return True
+
+        return bool(self.stop_conditions) and (step % self.stop_interval == 0)
+
+    def negligible(self, A, h):
+        """
+        :param array_like A: Field at the start of the step
+        :param double h: Step-size
+        :return: Whether the nonlinear phase of the step is negligible
+        :rtype: bool
+
+        Counts each step found to be negligible (see linear_steps).
+        """
+        if self.nonlinear_tolerance is None or self.nonlinear_phase is None:
+            return False
+
+        if self.nonlinear_phase(A, h) < self.nonlinear_tolerance:
+            self.linear_steps += 1
+            return True
+
+        return False
+
+    def mesh(self):
+        """
+        :return: z-values of the standard stepper, including boundaries
+        :rtype: double array
+
+        Mesh points closer to a boundary than a small fraction of the
+        step-size are replaced by the boundary, avoiding very short steps.
+        """
+        zs = np.linspace(0.0, self.length, self.total_steps + 1)
+
+        boundaries = np.array([b for b in self.boundaries
+                               if 0.0 < b < self.length])
+        if len(boundaries) == 0:
+            return zs
+
+        tolerance = 1.0e-6 * self.length / self.total_steps
+        keep = [np.min(np.abs(boundaries - z)) > tolerance for z in zs]
+
+        return np.union1d(zs[np.array(keep)], boundaries)
+
+    def next_boundary(self, z):
+        """ Return the first boundary (or length) beyond z. """
+        tolerance = 1.0e-12 * self.length
+
+        for boundary in self.boundaries:
+            if z + tolerance < boundary < self.length:
+                return boundary
+
+        return self.length
+
+    def stop_reached(self, step, z, A):
+        """
+        :param Uint step: Number of (successful) steps taken
+        :param double z: Current distance
+        :param array_like A: Current field
+        :return: Whether any stop condition has been met
+        :rtype: bool
+
+        Check stop conditions every stop_interval steps, recording the first
+        condition met along with the current distance.
+        """
+        if not self.stop_conditions or (step % self.stop_interval != 0):
+            return False
+
+        for condition in self.stop_conditions:
+            if condition(z, A):
+                self.stop_z = z
+                self.stopped_by = condition
+                return True
+
+        return False
+
+    def interpolate_traces(self, zs):
+        """
+        :param array_like zs: z-values for traces, if integration completed
+
+        Interpolate stored fields to traces. If integration was stopped early,
+        use the same number of traces spaced uniformly up to stop_z instead.
+        """
+        if self.stop_z is not None:
+            zs = np.linspace(0.0, self.stop_z, self.traces + 1)
+
+            # Spline interpolation requires at least four stored points:
+            if len(self.storage.z) < 4:
+                return
+
+        self.storage.interpolate_As_for_z_values(zs)
+
+    def quantise_step(self, h, h_initial):
+        """
+        :param double h: Step-size
+        :param double h_initial: Initial step-size, used as the ladder origin
+        :return: Step-size rounded down to the geometric ladder
+        :rtype: double
+        """
+        if self.step_ratio is None:
+            return h
+
+        # Allow for rounding error, so that a step-size already on the ladder
+        # is returned unchanged:
+        k = np.floor(np.log(h / h_initial) / np.log(self.step_ratio) + 1.0e-9)
+
+        return h_initial * np.power(self.step_ratio, k)
+
     @staticmethod
     def relative_local_error(A_fine, A_coarse):
         """ Calculate an estimate of the relative local error """
@@ -163,6 +451,22 @@ class Stepper(object):
         else:
             return linalg.norm(A_fine - A_coarse)
 
+    def conservation_step(self, h, delta):
+        """
+        :param double h: Step-size used
+        :param double delta: Relative change in the conserved quantity
+        :return: Step-size for the next attempt
+        :rtype: double
+        """
+        if delta > 2.0 * self.local_error:
+            return 0.5 * h
+        elif delta > self.local_error:
+            return h / np.power(2.0, 0.2)
+        elif delta < 0.5 * self.local_error:
+            return h * np.power(2.0, 0.2)
+        else:
+            return h
+
     def adaptive_stepper(self, A):
         """ Take multiple steps, with variable length, until target reached """
 
@@ -177,6 +481,7 @@ class Stepper(object):
             h = self.length / self.traces
         else:
             h = self.length / self.total_steps
+        h_initial = h
 
         # Constants used for approximation of solution using local
         # extrapolation:
@@ -184,6 +489,8 @@ class Stepper(object):
         f_alpha = f_eta / (f_eta - 1.0)
         f_beta = 1.0 / (f_eta - 1.0)
 
+        conservation = (self.error_control == "conservation")
+
         # Calculate z-values at which to save traces.
         if self.traces > 1:
             # zs contains z-values for each trace, as well as the initial
@@ -196,18 +503,35 @@ class Stepper(object):
 
         # Limit the number of steps in case of slowly converging runs:
         for s in range(1, self.steps_max):
-            # If step-size takes z our of range [0.0, length], then correct it:
-            if (z + h) > self.length:
-                h = self.length - z
+            # If step-size takes z past a boundary, or out of range
+            # [0.0, length], then correct it:
+            z_next = self.next_boundary(z)
+            h_proposed = h
+            if (z + h) > z_next:
+                h = z_next - z
 
             # Take an adaptive step:
             for ta in range(0, self.total_attempts):
+                if self.update is not None and self.update(z, h) is not False:
+                    self.solver.reset()
+
                 h_half = 0.5 * h
                 z_half = z + h_half
 
                 # Calculate A_fine and A_coarse internally if using an
-                # embedded method. Otherwise use method of step-doubling:
-                if self.solver.embedded:
+                # embedded method. Otherwise use method of step-doubling.
+                # A linear step is exact, so needs no error estimate:
+                linear = self.negligible(self.A_out, h)
+                if linear:
+                    A_fine = A_coarse = self.solver.f.linear(self.A_out, h)
+                elif conservation:
+                    # A single step, with the error found from the change
+                    # in a conserved quantity (below):
+                    A_fine = self.step(self.A_out, z, h)
+                    if self.solver.embedded:
+                        A_fine = A_fine[0]
+                    A_coarse = A_fine
+                elif self.solver.embedded:
                     A_fine, A_coarse = self.step(self.A_out, z, h)
                 else:
                     # Calculate fine solution using two steps of size h_half:
@@ -217,13 +541,22 @@ class Stepper(object):
                     A_coarse = self.step(self.A_out, z, h)
 
                 # Calculate an estimate of relative local error:
-                delta = self.relative_local_error(A_fine, A_coarse)
+                if conservation and not linear:
+                    delta = self.conservation_error(self.A_out, A_fine, h)
+                else:
+                    delta = self.relative_local_error(A_fine, A_coarse)
 
                 # Store current stepsize:
                 h_temp = h
 
                 # Adjust stepsize for next step:
-                if delta > 0.0:
+                if linear:
+                    # Keep the step-size of nonlinear steps, ready for when
+                    # they resume:
+                    h = h_temp
+                elif conservation:
+                    h = self.conservation_step(h_temp, delta)
+                elif delta > 0.0:
                     error_ratio = (self.local_error / delta)
                     factor = \
                         self.safety * np.power(error_ratio, 1.0 / self.eta)
@@ -234,13 +567,23 @@ class Stepper(object):
                     # increase:
                     h = h_temp * self.max_factor
 
+                h = self.quantise_step(h, h_initial)
+
                 if delta < 2.0 * self.local_error:
                     # Successful step, so increment z h_temp (which is the
                     # stepsize that was used for this step):
-                    z += h_temp
+                    if h_temp == z_next - z:
+                        # Land exactly on the boundary:
+                        z = z_next
+                        # Shortening the step to reach a boundary should
+                        # not reduce the next step-size:
+                        h = max(h, h_proposed)
+                    else:
+                        z += h_temp
 
-                    if self.solver.embedded:
-                        # Accept the higher order method:
+                    if self.solver.embedded or conservation or linear:
+                        # Accept the higher order method (or the single
+                        # step taken):
                         self.A_out = A_fine
                     else:
                         # Use local extrapolation to form a higher order
@@ -263,14 +606,15 @@ class Stepper(object):
             else:
                 raise Exception("Failed to set suitable step-size")
 
-            # If the desired z has been reached, then finish:
-            if z >= self.length:
+            # If the desired z has been reached (or a stop condition has been
+            # met), then finish:
+            if z >= self.length or self.stop_reached(s, z, self.A_out):
                 # Store total number of fft and ifft operations that were used:
                 self.storage.store_current_fft_count()
 
                 # Interpolate dense output to uniformly-spaced z values:
                 if self.traces > 1:
-                    self.storage.interpolate_As_for_z_values(zs)
+                    self.interpolate_traces(zs)
 
                 return self.A_out
 
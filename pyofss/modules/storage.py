@@ -84,7 +84,18 @@ class Storage(object):
         # List of tuples of the form (z, h); one tuple per successful step:
         self.step_sizes = []
 
-        # Accumulate number of fft and ifft operations used for a stepper run:
+        # Accumulate number of fft and ifft operations used for a stepper run
+        # (counted globally, so not valid if steppers run concurrently):
+        self.fft_total = 0
+
+    def reset(self):
+        """
+        Discard fields and step-sizes stored by a previous propagation, so
+        that a module may be run again (t and nu are kept).
+        """
+        self.As = []
+        self.z = []
+        self.step_sizes = []
         self.fft_total = 0
 
     @staticmethod
@@ -0,0 +1,228 @@
+
+"""
+    Copyright (C) 2012  David Bolt
+
+    This file is part of pyofss.
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import sys
+import Queue
+from multiprocessing.pool import ThreadPool
+
+import numpy as np
+
+from domain import Domain
+
+
+# Define exceptions
+class NetworkError(Exception):
+    pass
+
+
+class UnknownNodeError(NetworkError):
+    pass
+
+
+def copy_field(field):
+    """
+    :param object field: A field, or a list of fields for multiple channels
+    :return: Copy of the field
+    :rtype: Object
+
+    Copy a field so that a module modifying its input in place cannot affect
+    other consumers of the same field.
+    """
+    if isinstance(field, list):
+        return [np.array(channel_field) for channel_field in field]
+    else:
+        return np.array(field)
+
+
+class Network(object):
+    """
+    :param object domain: A domain to be used with contained modules
+
+    A network is a directed acyclic graph of modules. Each module may have
+    several inputs and outputs: a module with inputs is called with a domain
+    followed by one field per input; a module returning a tuple has one
+    output port per element. Modules without inputs (sources) are called with
+    an empty field, in the same way as the first module of a System.
+
+    Each module runs once, so work shared by several branches is not
+    repeated. Independent branches may be run concurrently on a pool of
+    threads. The result of each module is stored in a dictionary, with
+    module name as key.
+
+    .. note::
+      Each module instance holds state, so a module must not be added to
+      more than one network node.
+
+    .. note::
+      Transforms are counted by a single counter in pyofss.field, which each
+      stepper resets. With more than one worker, fibres running at the same
+      time reset and add to the same count, so the fft_total of their
+      storage is not valid.
+    """
+    def __init__(self, domain=Domain()):
+        self.domain = domain
+        self.fields = None
+        self.modules = None
+        self.inputs = None
+        self.order = None
+        self.clear(remove_modules=True)
+
+    def clear(self, remove_modules=False):
+        """
+        Clear contents of all fields.
+        Clear (remove) all modules if requested.
+        """
+        self.fields = {}
+
+        if(remove_modules):
+            self.modules = {}
+            self.inputs = {}
+            self.order = []
+
+    def add(self, module, inputs=None):
+        """
+        :param object module: Module to add. Its name identifies the node
+        :param array_like inputs: List of (name, port) tuples, or names
+
+        Add a module, connected to outputs of modules already in the network.
+        A name on its own refers to the entire output of that module. Since
+        inputs must already exist, the network can never contain a cycle.
+        """
+        if module.name in self.modules:
+            raise NetworkError(
+                "Network already contains a module named %s" % module.name)
+
+        connections = []
+        for connection in (inputs or []):
+            if isinstance(connection, tuple):
+                (name, port) = connection
+            else:
+                (name, port) = (connection, None)
+
+            if name not in self.modules:
+                raise UnknownNodeError(
+                    "Tried to connect to non-existing module %s" % name)
+
+            connections.append((name, port))
+
+        self.modules[module.name] = module
+        self.inputs[module.name] = connections
+        self.order.append(module.name)
+
+    def __getitem__(self, module_name):
+        return self.modules.get(module_name)
+
+    def empty_field(self):
+        """ Generate an empty field, as used by System. """
+        if(self.domain.channels > 1):
+            return [np.zeros([self.domain.total_samples], complex)
+                    for channel in range(self.domain.channels)]
+        else:
+            return np.zeros([self.domain.total_samples], complex)
+
+    def output(self, name, port=None):
+        """
+        :param string name: Name of a module which has been run
+        :param Uint port: Output port, or None for the entire output
+        :return: Field at the output port
+        :rtype: Object
+        """
+        if port is None:
+            return self.fields[name]
+        else:
+            return self.fields[name][port]
+
+    def run_module(self, name):
+        """
+        :param string name: Name of the module to run
+        :return: Name, output, and exception information (None on success)
+        :rtype: Tuple
+
+        Call a single module using copies of its input fields.
+        """
+        try:
+            connections = self.inputs[name]
+            if connections:
+                fields = [copy_field(self.output(*connection))
+                          for connection in connections]
+            else:
+                fields = [self.empty_field()]
+
+            return (name, self.modules[name](self.domain, *fields), None)
+        except Exception:
+            return (name, None, sys.exc_info())
+
+    def run(self, workers=1):
+        """
+        :param Uint workers: Number of threads used to run independent modules
+
+        Run each module once its inputs are available. With more than one
+        worker, modules whose inputs are ready are run concurrently. Shared
+        caches (LRUCache) are locked, but transform counts (fft_total) are
+        not valid with more than one worker.
+        """
+        self.fields = {}
+
+        waiting = dict((name, set(connection[0] for connection in
+                                  self.inputs[name]))
+                       for name in self.order)
+        dependents = dict((name, []) for name in self.order)
+        for name in self.order:
+            for source in waiting[name]:
+                dependents[source].append(name)
+
+        if workers > 1:
+            pool = ThreadPool(workers)
+            finished = Queue.Queue()
+
+            def submit(name):
+                pool.apply_async(self.run_module, (name,),
+                                 callback=finished.put)
+        else:
+            pool = None
+            finished = []
+
+            def submit(name):
+                finished.append(self.run_module(name))
+
+        try:
+            ready = [name for name in self.order if not waiting[name]]
+            for name in ready:
+                submit(name)
+
+            for count in range(len(self.order)):
+                if pool is None:
+                    (name, result, error) = finished.pop(0)
+                else:
+                    (name, result, error) = finished.get()
+
+                if error is not None:
+                    raise error[0], error[1], error[2]
+
+                self.fields[name] = result
+
+                for dependent in dependents[name]:
+                    waiting[dependent].discard(name)
+                    if not waiting[dependent]:
+                        submit(dependent)
+        finally:
+            if pool is not None:
+                pool.terminate()
+                pool.join()
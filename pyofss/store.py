@@ -0,0 +1,330 @@
+
+"""
+    Copyright (C) 2012  David Bolt
+
+    This file is part of pyofss.
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import os
+import json
+import time
+import hashlib
+import sqlite3
+import numbers
+
+import numpy as np
+
+from distributed import run_system
+
+
+# Define exceptions
+class StoreError(Exception):
+    pass
+
+
+class DescriptionError(StoreError):
+    pass
+
+
+def canonical(item):
+    """
+    :param object item: Part of a system description
+    :return: Equivalent structure of strings, numbers, lists and dicts
+    :rtype: object
+
+    Convert a description into a form which may be written as JSON, such that
+    equal descriptions always produce identical output. Classes are replaced
+    by their full name, arrays by a digest of their contents, and other
+    objects by their class name and key. The key method of such an object
+    returns only the inputs determining its behaviour (not caches). Other
+    objects, including functions, cannot be described, so raise
+    DescriptionError.
+    """
+    if isinstance(item, dict):
+        return dict((str(key), canonical(value))
+                    for (key, value) in item.items())
+    elif isinstance(item, (list, tuple)):
+        return [canonical(value) for value in item]
+    elif isinstance(item, np.ndarray):
+        return {"array": hashlib.sha1(np.ascontiguousarray(item)).hexdigest(),
+                "shape": list(item.shape), "dtype": str(item.dtype)}
+    elif isinstance(item, type):
+        return "%s.%s" % (item.__module__, item.__name__)
+    elif isinstance(item, np.generic):
+        return canonical(item.item())
+    elif item is None or isinstance(item, (bool, basestring)):
+        return item
+    elif isinstance(item, numbers.Real):
+        # Equal integer and float values describe the same run:
+        return repr(float(item))
+    elif isinstance(item, complex):
+        return [repr(item.real), repr(item.imag)]
+    elif callable(getattr(item, "key", None)):
+        return {"class": canonical(type(item)), "key": canonical(item.key())}
+    else:
+        raise DescriptionError(
+            "Cannot describe %r: pass a value, or an object with a key "
+            "method" % (item,))
+
+
+def description_key(description):
+    """
+    :param dict description: Description of a system (see build_system)
+    :return: Hexadecimal digest identifying the description
+    :rtype: string
+    """
+    text = json.dumps(canonical(description), sort_keys=True)
+
+    return hashlib.sha1(text).hexdigest()
+
+
+def flatten_parameters(description):
+    """
+    :param dict description: Description of a system (see build_system)
+    :return: List of (name, value) tuples for each numerical parameter
+    :rtype: array_like
+
+    Names take the form "domain.bit_width" or "fibre.gamma", using the module
+    name (or lowercase class name if unnamed). Elements of sequences are
+    numbered, for example "fibre.beta.2".
+    """
+    parameters = []
+
+    def add(prefix, value):
+        if isinstance(value, bool) or value is None:
+            return
+        elif isinstance(value, (numbers.Real, np.generic)):
+            parameters.append((prefix, float(value)))
+        elif isinstance(value, (list, tuple, np.ndarray)) and \
+                np.ndim(value) == 1:
+            for (index, element) in enumerate(value):
+                add("%s.%d" % (prefix, index), element)
+
+    for (name, value) in description.get("domain", {}).items():
+        add("domain.%s" % name, value)
+
+    for (module_class, module_parameters) in description["modules"]:
+        module_name = module_parameters.get("name",
+                                            module_class.__name__.lower())
+        for (name, value) in module_parameters.items():
+            add("%s.%s" % (module_name, name), value)
+
+    return parameters
+
+
+class ResultStore(object):
+    """
+    :param string directory: Directory holding the index and array files
+
+    A result store holds the output of simulation runs, keyed by a digest of
+    the full system description. An SQLite index records when each run was
+    stored and last used, along with its numerical parameters; field arrays
+    are saved to one npz file per run.
+
+    Since runs are keyed by their description, an identical run is never
+    computed twice. Descriptions must consist of values and objects with a
+    key method (see canonical); functions, such as a profile given as a
+    lambda, raise DescriptionError.
+    """
+    def __init__(self, directory):
+        self.directory = directory
+        self.array_directory = os.path.join(directory, "arrays")
+
+        if not os.path.isdir(self.array_directory):
+            os.makedirs(self.array_directory)
+
+        self.connection = sqlite3.connect(os.path.join(directory,
+                                                       "index.sqlite"))
+        with self.connection:
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS runs (key TEXT PRIMARY KEY, "
+                "description TEXT, created REAL, accessed REAL, "
+                "size INTEGER)")
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS parameters (key TEXT, "
+                "name TEXT, value REAL)")
+            self.connection.execute(
+                "CREATE INDEX IF NOT EXISTS parameter_values "
+                "ON parameters (name, value)")
+
+    def filename(self, key):
+        """ Return the array filename used for key. """
+        return os.path.join(self.array_directory, "%s.npz" % key)
+
+    def __contains__(self, description):
+        key = description_key(description)
+        row = self.connection.execute(
+            "SELECT key FROM runs WHERE key = ?", (key,)).fetchone()
+
+        return row is not None
+
+    def run(self, description):
+        """
+        :param dict description: Description of a system (see build_system)
+        :return: Final field, and fields at each module exit
+        :rtype: dict
+
+        Return the stored result for description, running the system and
+        storing its result only if it has not been run before.
+        """
+        result = self.get(description)
+
+        if result is None:
+            result = run_system(description)
+            self.put(description, result)
+
+        return result
+
+    def put(self, description, result):
+        """
+        :param dict description: Description of a system (see build_system)
+        :param dict result: Result containing field and fields entries
+        :return: Key for the stored run
+        :rtype: string
+        """
+        key = description_key(description)
+
+        arrays = {"field": np.asarray(result["field"])}
+        for (name, field) in result.get("fields", {}).items():
+            arrays["fields:%s" % name] = np.asarray(field)
+
+        filename = self.filename(key)
+        np.savez(filename, **arrays)
+
+        now = time.time()
+        with self.connection:
+            self.connection.execute("DELETE FROM parameters WHERE key = ?",
+                                    (key,))
+            self.connection.execute(
+                "INSERT OR REPLACE INTO runs VALUES (?, ?, ?, ?, ?)",
+                (key, json.dumps(canonical(description), sort_keys=True),
+                 now, now, os.path.getsize(filename)))
+            self.connection.executemany(
+                "INSERT INTO parameters VALUES (?, ?, ?)",
+                [(key, name, value)
+                 for (name, value) in flatten_parameters(description)])
+
+        return key
+
+    def get(self, description):
+        """
+        :param dict description: Description of a system (see build_system)
+        :return: Stored result, or None if not stored
+        :rtype: dict
+        """
+        return self.load(description_key(description))
+
+    def load(self, key):
+        """
+        :param string key: Key of a stored run
+        :return: Stored result, or None if not stored
+        :rtype: dict
+        """
+        row = self.connection.execute(
+            "SELECT key FROM runs WHERE key = ?", (key,)).fetchone()
+
+        if row is None or not os.path.exists(self.filename(key)):
+            return None
+
+        with self.connection:
+            self.connection.execute(
+                "UPDATE runs SET accessed = ? WHERE key = ?",
+                (time.time(), key))
+
+        npz_data = np.load(self.filename(key))
+        result = {"field": npz_data["field"], "fields": {}}
+        for name in npz_data.files:
+            if name.startswith("fields:"):
+                result["fields"][name[len("fields:"):]] = npz_data[name]
+        npz_data.close()
+
+        return result
+
+    def query(self, **ranges):
+        """
+        :param ranges: Parameter name mapped to (minimum, maximum) values
+        :return: Keys of stored runs with all parameters within range
+        :rtype: array_like
+
+        Parameter names contain dots, so pass them using a dictionary, for
+        example store.query(**{"fibre.gamma": (1.0, 2.0)}). Ranges include
+        their end points; None leaves that end unbounded.
+        """
+        sql = ["SELECT key FROM runs"]
+        values = []
+
+        for (name, (minimum, maximum)) in sorted(ranges.items()):
+            clause = ["SELECT key FROM parameters WHERE name = ?"]
+            values.append(name)
+            if minimum is not None:
+                clause.append("value >= ?")
+                values.append(minimum)
+            if maximum is not None:
+                clause.append("value <= ?")
+                values.append(maximum)
+
+            sql.append("INTERSECT")
+            sql.append(" AND ".join(clause))
+
+        rows = self.connection.execute(" ".join(sql), values).fetchall()
+
+        return sorted(row[0] for row in rows)
+
+    def remove(self, key):
+        """ Remove a stored run. """
+        with self.connection:
+            self.connection.execute("DELETE FROM runs WHERE key = ?", (key,))
+            self.connection.execute("DELETE FROM parameters WHERE key = ?",
+                                    (key,))
+
+        if os.path.exists(self.filename(key)):
+            os.remove(self.filename(key))
+
+    def evict(self, max_age=None, max_size=None):
+        """
+        :param double max_age: Remove runs not used for longer. *Unit: s*
+        :param Uint max_size: Remove least recently used runs until the total
+                              size of array files is at most max_size bytes
+        :return: Keys of removed runs
+        :rtype: array_like
+        """
+        removed = []
+
+        if max_age is not None:
+            rows = self.connection.execute(
+                "SELECT key FROM runs WHERE accessed < ?",
+                (time.time() - max_age,)).fetchall()
+            removed.extend(row[0] for row in rows)
+
+        if max_size is not None:
+            rows = self.connection.execute(
+                "SELECT key, size FROM runs ORDER BY accessed DESC, "
+                "created DESC").fetchall()
+
+            total_size = 0
+            for (key, size) in rows:
+                total_size += size
+                if total_size > max_size and key not in removed:
+                    removed.append(key)
+
+        for key in removed:
+            self.remove(key)
+
+        return removed
+
+    def close(self):
+        """ Close the index. """
+        self.connection.close()
@@ -21,6 +21,33 @@
 import numpy as np
 
 from domain import Domain
+from modules.linear_block import fuse_linear_modules
+
+
+def build_system(description, domain=None):
+    """
+    :param dict description: Description of the system
+    :param object domain: Domain to use, instead of constructing one
+    :return: A system
+    :rtype: object
+
+    Construct a system from a description, which is a dictionary containing:
+      **domain**:
+         Dictionary of keyword arguments used to construct the Domain
+      **modules**:
+         List of (class, keyword arguments) tuples, one per module
+
+    Unlike a System, a description may be pickled and compared, so it can be
+    sent to other processes or used to identify a simulation.
+    """
+    if domain is None:
+        domain = Domain(**description.get("domain", {}))
+
+    system = System(domain)
+    for (module_class, parameters) in description["modules"]:
+        system.add(module_class(**parameters))
+
+    return system
 
 
 class System(object):
@@ -36,6 +63,8 @@ class System(object):
         self.field = None
         self.fields = None
         self.modules = None
+        self.stages = None
+        self.stopped_by = None
         self.clear(remove_modules=True)
 
     def clear(self, remove_modules=False):
@@ -53,10 +82,29 @@ class System(object):
 
         if(remove_modules):
             self.modules = []
+            self.stages = None
 
     def add(self, module):
         """ Append a module to the system. """
         self.modules.append(module)
+        self.stages = None
+
+    def compile(self):
+        """
+        Fuse each run of consecutive purely linear modules (such as filters,
+        amplifiers, and fibres with zero nonlinearity) into a single
+        LinearBlock, which costs one fft and ifft rather than one pair per
+        module. The modules list is left unchanged; the fused sequence is used
+        by run until a module is added or replaced. Each LinearBlock keys its
+        cached transfer function on the parameters of its modules, so a
+        module changed after compile (such as system["filter"].width_nu)
+        is still applied correctly.
+
+        .. note::
+          The field at the exit of a LinearBlock is stored using the name of
+          its last module. Fields between fused modules are not stored.
+        """
+        self.stages = fuse_linear_modules(self.domain, self.modules)
 
     def __getitem__(self, module_name):
         for index, module in enumerate(self.modules):
@@ -67,6 +115,7 @@ class System(object):
         for index, module in enumerate(self.modules):
             if(module.name == module_name):
                 self.modules[index] = new_module
+                self.stages = None
                 return
 
         raise Exception("Tried to modify non-existing module in system")
@@ -75,7 +124,24 @@ class System(object):
         """
         Propagate field through each module, with the resulting field at the
         exit of each module stored in a dictionary, with module name as key.
+        If compile has been called, use the fused sequence of modules.
+
+        If a stop condition ends propagation within a module (such as a
+        fibre), the run ends after that module, and its name is stored in
+        stopped_by.
         """
-        for module in self.modules:
+        if self.stages is None:
+            modules = self.modules
+        else:
+            modules = self.stages
+
+        self.stopped_by = None
+
+        for module in modules:
             self.field = module(self.domain, self.field)
             self.fields[module.name] = self.field
+
+            stepper = getattr(module, "stepper", None)
+            if stepper is not None and stepper.stop_z is not None:
+                self.stopped_by = module.name
+                break
@@ -0,0 +1,82 @@
+
+"""
+    Copyright (C) 2012  David Bolt
+
+    This file is part of pyofss.
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+from pyofss.domain import Domain
+from pyofss.modules.compensator import DispersionCompensator
+from pyofss.modules.compensator import UnsupportedFibreError
+from pyofss.modules.fibre import Fibre
+from pyofss.modules.gaussian import Gaussian
+from pyofss.modules.piecewise import Piecewise
+
+import numpy as np
+
+import unittest2
+
+
+class CheckFunctions(unittest2.TestCase):
+    """ Test class methods. """
+    def setUp(self):
+        self.domain = Domain(bit_width=50.0, samples_per_bit=256)
+        self.A_in = Gaussian(peak_power=1.0, width=1.0)(
+            self.domain, np.zeros(256, complex))
+
+    def test_compensate_fibres(self):
+        """ Should restore the field after dispersive fibres """
+        fibres = [Fibre("fibre_0", length=2.0, beta=[0.0, 0.0, -1.0, 0.1]),
+                  Fibre("fibre_1", length=1.0,
+                        beta=Piecewise([0.5], [[0.0, 0.0, 2.0],
+                                               [0.0, 0.0, -3.0]]))]
+        compensator = DispersionCompensator(fibres=fibres)
+
+        A = self.A_in
+        for module in fibres + [compensator]:
+            A = module(self.domain, A)
+
+        self.assertTrue(np.allclose(A, self.A_in))
+
+    def test_phase(self):
+        """ Should match an equivalent linear fibre """
+        fibre = Fibre(length=1.0, beta=[0.0, 0.0, 0.5])
+        compensator = DispersionCompensator(beta=[0.0, 0.0, 0.5])
+
+        self.assertTrue(np.allclose(compensator(self.domain, self.A_in),
+                                    fibre(self.domain, self.A_in)))
+
+    def test_cache(self):
+        """ Should reuse transfer function unless fibres change """
+        fibre = Fibre(length=1.0, beta=[0.0, 0.0, 0.5])
+        compensator = DispersionCompensator(fibres=[fibre])
+
+        transfer = compensator.linear_transfer(self.domain)
+        self.assertIs(compensator.linear_transfer(self.domain), transfer)
+
+        fibre.length = 2.0
+        self.assertIsNot(compensator.linear_transfer(self.domain), transfer)
+
+    def test_continuous_profile(self):
+        """ Should fail for dispersion varying continuously with z """
+        fibre = Fibre(length=1.0, beta=lambda z: [0.0, 0.0, z])
+        compensator = DispersionCompensator(fibres=[fibre])
+
+        self.assertRaises(UnsupportedFibreError, compensator.linear_transfer,
+                          self.domain)
+
+if __name__ == "__main__":
+    unittest2.main()
@@ -0,0 +1,202 @@
+
+"""
+    Copyright (C) 2012  David Bolt
+
+    This file is part of pyofss.
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import os
+import tempfile
+
+from pyofss.domain import Domain
+from pyofss.modules.dispersion import TabulatedDispersion, UnknownTypeError
+from pyofss.modules.dispersion import Sellmeier, model_cache
+from pyofss.modules.dispersion import DispersionError
+from pyofss.modules.linearity import Linearity
+from pyofss.modules.linearity import convert_dispersion_to_physical
+
+import numpy as np
+from scipy.misc import factorial
+
+import unittest2
+
+
+class BadParameters(unittest2.TestCase):
+    """ Test response to bad parameters. """
+    def test_wrong_type(self):
+        """ Should fail if x_type or y_type is unknown """
+        self.assertRaises(UnknownTypeError, TabulatedDispersion,
+                          [1.0, 2.0], [1.0, 2.0], "frequency")
+        self.assertRaises(UnknownTypeError, TabulatedDispersion,
+                          [1.0, 2.0], [1.0, 2.0], "omega", "beta_3")
+
+
+class CheckHorner(unittest2.TestCase):
+    """ Test evaluation of a list of beta values. """
+    def test_polynomial(self):
+        """ Should match direct evaluation of the Taylor series """
+        domain = Domain()
+        beta = [0.1, 0.2, -20.0, 0.5, 0.01]
+        Domega = domain.omega - domain.centre_omega
+
+        expected = 0.0
+        for n, b in enumerate(beta):
+            expected += b * np.power(Domega, n) / factorial(n)
+
+        terms = Linearity.dispersion_terms(beta, domain, domain.centre_omega,
+                                           Domega)
+        self.assertTrue(np.allclose(terms, expected))
+
+
+class CheckTabulated(unittest2.TestCase):
+    """ Test interpolation of tabulated dispersion. """
+    def setUp(self):
+        self.domain = Domain(bit_width=20.0, samples_per_bit=256)
+        self.omega = np.linspace(self.domain.omega[0] - 10.0,
+                                 self.domain.omega[-1] + 10.0, 64)
+
+    def check_against_beta(self, dispersion, beta):
+        """ Compare linear factors using tabulated and polynomial beta. """
+        tabulated = Linearity(beta=dispersion)
+        polynomial = Linearity(beta=beta)
+
+        self.assertTrue(np.allclose(tabulated(self.domain),
+                                    polynomial(self.domain), atol=1.0e-6))
+
+    def test_beta(self):
+        """ Should remove beta_0 and beta_1 from tabulated beta """
+        Domega = self.omega - self.domain.centre_omega
+        beta = 3.0 + 2.0 * Domega - 10.0 * Domega ** 2
+        dispersion = TabulatedDispersion(self.omega, beta, "omega", "beta")
+
+        self.check_against_beta(dispersion, [0.0, 0.0, -20.0])
+
+    def test_beta_2(self):
+        """ Should integrate constant beta_2 to a quadratic """
+        dispersion = TabulatedDispersion(self.omega, -20.0 * np.ones(64),
+                                         "omega", "beta_2")
+
+        self.check_against_beta(dispersion, [0.0, 0.0, -20.0])
+
+    def test_D(self):
+        """ Should convert D to beta_2 """
+        Lambda = self.domain.centre_lambda
+        beta_2 = convert_dispersion_to_physical(D=17.0, Lambda=Lambda)[0]
+
+        # Use a narrow table so that beta_2 is effectively constant:
+        Lambdas = Lambda + np.linspace(-0.01, 0.01, 16)
+        dispersion = TabulatedDispersion(Lambdas, 17.0 * np.ones(16),
+                                         "lambda", "D")
+        self.assertTrue(np.allclose(dispersion.values, beta_2, rtol=1.0e-4))
+
+    def test_cache(self):
+        """ Should interpolate once per domain """
+        dispersion = TabulatedDispersion(self.omega, -20.0 * np.ones(64),
+                                         "omega", "beta_2")
+        terms = dispersion.generate(self.domain)
+        self.assertIs(dispersion.generate(self.domain), terms)
+
+    def test_from_file(self):
+        """ Should load a table from file """
+        (handle, filename) = tempfile.mkstemp(".txt")
+        os.close(handle)
+        try:
+            np.savetxt(filename, np.transpose([self.omega,
+                                               -20.0 * np.ones(64)]))
+            dispersion = TabulatedDispersion.from_file(filename, "omega",
+                                                       "beta_2")
+        finally:
+            os.remove(filename)
+
+        self.check_against_beta(dispersion, [0.0, 0.0, -20.0])
+
+
+class CheckSellmeier(unittest2.TestCase):
+    """ Test the Sellmeier material model. """
+    def setUp(self):
+        self.domain = Domain(bit_width=20.0, samples_per_bit=1024)
+
+    def test_fused_silica(self):
+        """ Should give the material dispersion of fused silica at 1550 nm """
+        model = Sellmeier()
+        terms = model.generate(self.domain)
+
+        # Remove beta_0 and beta_1, leaving second order at the centre:
+        centre = self.domain.total_samples // 2
+        domega = self.domain.domega
+        beta_2 = (terms[centre + 1] - 2.0 * terms[centre] +
+                  terms[centre - 1]) / domega ** 2
+
+        self.assertAlmostEqual(terms[centre], 0.0, places=3)
+        self.assertTrue(-29.0 < beta_2 < -27.0)
+
+    def test_waveguide(self):
+        """ Constant index change should only affect beta_0 and beta_1 """
+        terms = Sellmeier().generate(self.domain)
+        terms_waveguide = Sellmeier(waveguide=0.01).generate(self.domain)
+
+        self.assertTrue(np.allclose(terms, terms_waveguide, atol=1.0e-3))
+
+    def test_group_delay(self):
+        """ Group delay at the centre frequency should be removed exactly """
+        model = Sellmeier()
+        centre_omega = self.domain.centre_omega
+
+        # Central difference of n with a small step:
+        delta = 1.0e-5 * centre_omega
+        dn_domega = (model.refractive_index(centre_omega + delta) -
+                     model.refractive_index(centre_omega - delta)) / \
+            (2.0 * delta)
+        n_group = model.refractive_index(centre_omega) + \
+            centre_omega * dn_domega
+
+        self.assertAlmostEqual(model.group_index(centre_omega), n_group, 10)
+
+    def test_wide_grid(self):
+        """ Should hold beta outside the valid band of a wide grid """
+        from pyofss.modules.fibre import Fibre
+        from pyofss.modules.gaussian import Gaussian
+
+        domain = Domain(bit_width=10.0, samples_per_bit=2 ** 12)
+        model = Sellmeier()
+        terms = model.generate(domain)
+        self.assertTrue(np.all(np.isfinite(terms)))
+
+        # Below the infrared resonance (and for omega <= 0), beta is held:
+        (first, last) = model.valid_band(domain.omega, domain.centre_omega)
+        self.assertGreater(first, 0)
+        self.assertTrue(np.all(terms[:first] == terms[first]))
+        self.assertTrue(domain.nu[first] > 30.0)
+
+        A_in = Gaussian(peak_power=1.0, width=1.0)(
+            domain, np.zeros(domain.total_samples, complex))
+        A_out = Fibre(beta=model, gamma=0.0, length=0.001)(domain, A_in)
+        self.assertTrue(np.all(np.isfinite(A_out)))
+
+        self.assertRaises(DispersionError, model.generate, domain,
+                          2.0 * np.pi * 32.0)
+
+    def test_cache(self):
+        """ Should share generated arrays between equal models """
+        model_cache.clear()
+        terms = Sellmeier().generate(self.domain)
+
+        self.assertIs(Sellmeier().generate(self.domain), terms)
+        self.assertEqual(len(model_cache), 1)
+
+
+if __name__ == "__main__":
+    unittest2.main()
@@ -0,0 +1,108 @@
+
+"""
+    Copyright (C) 2012  David Bolt
+
+    This file is part of pyofss.
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import os
+import tempfile
+
+from pyofss.distributed import Coordinator, JobFailedError
+from pyofss.distributed import cached_domain, run_system, system_cache
+from pyofss.modules.gaussian import Gaussian
+from pyofss.modules.fibre import Fibre
+
+from numpy.testing.utils import assert_array_almost_equal
+
+import unittest2
+
+
+def exit_once(marker):
+    """ Kill the worker on the first attempt only. """
+    if not os.path.exists(marker):
+        open(marker, "w").close()
+        os._exit(1)
+    return "retried"
+
+
+def raise_error():
+    """ Job which fails. """
+    raise ValueError("Expected failure")
+
+
+class CheckFunctions(unittest2.TestCase):
+    """ Test coordinator and workers on localhost. """
+    def setUp(self):
+        self.description = {
+            "domain": {"bit_width": 50.0, "samples_per_bit": 256},
+            "modules": [(Gaussian, {"peak_power": 1.0, "width": 1.0}),
+                        (Fibre, {"beta": [0.0, 0.0, -1.0], "gamma": 1.0,
+                                 "total_steps": 10})]}
+
+        self.coordinator = Coordinator(timeout=1.0, retries=1)
+        self.coordinator.start()
+
+    def tearDown(self):
+        self.coordinator.shutdown()
+
+    def test_cached_domain(self):
+        """ Should reuse a domain with identical parameters """
+        domain = cached_domain({"bit_width": 50.0})
+        self.assertIs(cached_domain({"bit_width": 50.0}), domain)
+        self.assertIsNot(cached_domain({"bit_width": 60.0}), domain)
+
+    def test_system_cache(self):
+        """ Should rerun a system built for an identical description """
+        system_cache.clear()
+        expected = run_system(self.description)["field"]
+        self.assertEqual(len(system_cache), 1)
+
+        linearity = system_cache.values.values()[0]["fibre"].linearity
+        hits = linearity.cache.hits
+
+        assert_array_almost_equal(run_system(self.description)["field"],
+                                  expected)
+        self.assertEqual(len(system_cache), 1)
+        self.assertGreater(linearity.cache.hits, hits)
+
+        # A description containing a function is built for each call:
+        self.description["modules"][1][1]["alpha"] = lambda z: 0.0
+        assert_array_almost_equal(run_system(self.description)["field"],
+                                  expected)
+        self.assertEqual(len(system_cache), 1)
+
+    def test_jobs(self):
+        """ Should run systems, retry lost jobs, and report failures """
+        marker = os.path.join(tempfile.mkdtemp(), "marker")
+
+        system_ids = [self.coordinator.submit_system(self.description)
+                      for i in range(3)]
+        retry_id = self.coordinator.submit(exit_once, marker)
+        error_id = self.coordinator.submit(raise_error)
+
+        self.coordinator.spawn_workers(2, heartbeat=0.1)
+        results = dict(self.coordinator.results(poll=0.1))
+
+        expected = run_system(self.description)["field"]
+        for job_id in system_ids:
+            assert_array_almost_equal(results[job_id]["field"], expected)
+
+        self.assertEqual(results[retry_id], "retried")
+        self.assertIsInstance(results[error_id], JobFailedError)
+
+if __name__ == "__main__":
+    unittest2.main()
@@ -0,0 +1,109 @@
+
+"""
+    Copyright (C) 2012  David Bolt
+
+    This file is part of pyofss.
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+from pyofss.domain import Domain
+from pyofss.system import System
+from pyofss.ensemble import Ensemble, EnsembleError
+from pyofss.field import spectral_power
+from pyofss.modules.noise import QuantumNoise
+from pyofss.modules.sech import Sech
+from pyofss.modules.fibre import Fibre
+
+from scipy.constants import hbar
+import numpy as np
+
+import unittest2
+
+
+class CheckQuantumNoise(unittest2.TestCase):
+    """ Test quantum noise source. """
+    def setUp(self):
+        self.domain = Domain(bit_width=50.0, samples_per_bit=256)
+
+    def test_photons(self):
+        """ Should add one photon per mode """
+        noise = QuantumNoise().generate(self.domain)
+
+        # Energy (converted from pJ to J) relative to hbar omega summed over
+        # modes (omega converted from rad / ps to rad / s):
+        energy = 1.0e-12 * np.sum(np.abs(noise) ** 2) * self.domain.dt
+        self.assertAlmostEqual(
+            energy / np.sum(hbar * 1.0e12 * self.domain.omega), 1.0)
+
+    def test_streams(self):
+        """ Should reproduce each stream, with independent runs """
+        fields = [QuantumNoise(run=run).generate(self.domain)
+                  for run in [0, 0, 1]]
+
+        self.assertTrue(np.array_equal(fields[0], fields[1]))
+        self.assertFalse(np.allclose(fields[0], fields[2]))
+
+
+class CheckEnsemble(unittest2.TestCase):
+    """ Test streaming ensemble statistics. """
+    def setUp(self):
+        self.system = System(Domain(bit_width=50.0, samples_per_bit=256))
+        self.system.add(Sech(peak_power=1.0, width=1.0))
+        self.system.add(QuantumNoise())
+        self.system.add(Fibre(length=0.1, beta=[0.0, 0.0, -1.0], gamma=1.0,
+                              total_steps=10))
+
+    def test_statistics(self):
+        """ Should match statistics calculated from stored spectra """
+        ensemble = Ensemble(self.system, runs=4)
+        ensemble.run()
+
+        spectra = []
+        for run in range(4):
+            self.system["noise"].run = run
+            self.system.clear()
+            self.system.run()
+            spectra.append(spectral_power(self.system.field))
+
+        self.assertEqual(ensemble.total, 4)
+        self.assertTrue(np.allclose(ensemble.mean_spectrum(),
+                                    np.mean(spectra, axis=0)))
+
+        # Quantum noise is small, so a soliton remains coherent:
+        P = ensemble.mean_spectrum()
+        g_12 = ensemble.coherence()
+        self.assertTrue(np.allclose(g_12[P > 1.0e-3 * P.max()], 1.0,
+                                    atol=1.0e-2))
+        self.assertTrue(np.all(g_12 <= 1.0 + 1.0e-12))
+
+    def test_noise_only(self):
+        """ Independent noise should have low coherence """
+        self.system["fibre"].nonlinearity.gamma = 0.0
+        self.system.modules.pop(0)
+
+        ensemble = Ensemble(self.system, runs=20)
+        ensemble.run()
+
+        self.assertLess(np.mean(ensemble.coherence()), 0.5)
+
+    def test_too_few(self):
+        """ Should require two runs for coherence """
+        ensemble = Ensemble(self.system, runs=1)
+        ensemble.run()
+        self.assertRaises(EnsembleError, ensemble.coherence)
+
+
+if __name__ == "__main__":
+    unittest2.main()
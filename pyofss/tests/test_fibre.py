@@ -20,6 +20,8 @@
 
 from pyofss.modules.fibre import Fibre
 
+import numpy as np
+
 #from numpy.testing.utils import assert_almost_equal # uses decimal places
 
 import unittest
@@ -58,7 +60,389 @@ class CheckInputAndOutput(unittest.TestCase):
 
 class CheckFunctions(unittest.TestCase):
     """ Test class methods. """
-    pass
+    def test_stop_condition(self):
+        """ Compressing second-order soliton should stop system run """
+        from pyofss.domain import Domain
+        from pyofss.system import System
+        from pyofss.modules.sech import Sech
+        from pyofss.modules.filter import Filter
+        from pyofss.modules.condition import PeakPower
+
+        system = System(Domain(bit_width=50.0, samples_per_bit=512))
+        system.add(Sech(peak_power=4.0, width=1.0))
+        system.add(Fibre(length=0.5 * np.pi, beta=[0.0, 0.0, -1.0],
+                         gamma=1.0, total_steps=200,
+                         stop_conditions=[PeakPower(10.0)]))
+        system.add(Filter())
+        system.run()
+
+        stop_z = system["fibre"].stepper.stop_z
+        self.assertEqual(system.stopped_by, "fibre")
+        self.assertTrue(0.0 < stop_z < 0.25 * np.pi)
+        self.assertNotIn("filter", system.fields)
+
+    def test_piecewise(self):
+        """ Piecewise dispersion should match a chain of fibre modules """
+        from pyofss.domain import Domain
+        from pyofss.system import System
+        from pyofss.modules.sech import Sech
+        from pyofss.modules.piecewise import Piecewise
+
+        domain = Domain(bit_width=50.0, samples_per_bit=512)
+        betas = [[0.0, 0.0, -1.0], [0.0, 0.0, 1.0]]
+
+        chain = System(domain)
+        chain.add(Sech(peak_power=1.0, width=1.0))
+        chain.add(Fibre("fibre_0", length=0.3, beta=betas[0], gamma=1.0,
+                        total_steps=30))
+        chain.add(Fibre("fibre_1", length=0.7, beta=betas[1], gamma=1.0,
+                        total_steps=70))
+        chain.run()
+
+        for method in ["RK4IP", "ARK4IP"]:
+            system = System(domain)
+            system.add(Sech(peak_power=1.0, width=1.0))
+            system.add(Fibre(length=1.0, beta=Piecewise([0.3], betas),
+                             gamma=1.0, total_steps=95, method=method))
+            system.run()
+
+            self.assertTrue(np.allclose(system.field, chain.field,
+                                        atol=1.0e-5))
+
+        # Each segment should reuse its cached linear factor:
+        self.assertEqual(len(system["fibre"].linearity.factors), 2)
+
+    def test_propagate_linear(self):
+        """ Linear fibre should propagate exactly, with broadcast traces """
+        from pyofss.domain import Domain
+        from pyofss.modules.gaussian import Gaussian
+        from pyofss.modules.stepper import Stepper
+
+        domain = Domain(bit_width=50.0, samples_per_bit=256)
+        A_in = Gaussian(peak_power=1.0, width=1.0)(domain,
+                                                  np.zeros(256, complex))
+
+        fibre = Fibre(length=2.0, beta=[0.0, 0.0, 1.0], alpha=0.1, gamma=0.0,
+                      traces=4)
+        A_out = fibre(domain, A_in)
+
+        # Compare with stepper (using the fibre functions):
+        stepper = Stepper(method="RK4IP", f=fibre.function, length=2.0)
+        A_stepper = stepper(A_in)
+
+        self.assertTrue(np.allclose(A_out, A_stepper))
+        self.assertEqual(len(fibre.stepper.storage.As), 5)
+        self.assertTrue(np.allclose(fibre.stepper.storage.As[0], A_in))
+        self.assertEqual(fibre.stepper.storage.fft_total, 2)
+
+    def test_exp_factor_cache(self):
+        """ Adaptive methods should cache exp factors only with step_ratio """
+        from pyofss.domain import Domain
+        from pyofss.modules.sech import Sech
+
+        domain = Domain(bit_width=50.0, samples_per_bit=256)
+        A_in = Sech(peak_power=1.0, width=1.0)(domain,
+                                                np.zeros(256, complex))
+
+        for (method, step_ratio, cached) in [("RK4IP", None, True),
+                                             ("ARK4IP", None, False),
+                                             ("ARK4IP", 2.0, True)]:
+            fibre = Fibre(length=1.0, beta=[0.0, 0.0, -1.0], gamma=1.0,
+                          method=method, step_ratio=step_ratio)
+            fibre(domain, A_in)
+
+            self.assertEqual(len(fibre.linearity.cache) > 0, cached)
+
+    def test_fuse_half_steps(self):
+        """ Fused half-steps should match unfused steps with fewer ffts """
+        from pyofss.domain import Domain
+        from pyofss.modules.sech import Sech
+
+        domain = Domain(bit_width=50.0, samples_per_bit=256)
+        A_in = Sech(peak_power=1.0, width=1.0)(domain,
+                                                np.zeros(256, complex))
+
+        for method in ["ss_reduced", "ss_sym_midpoint", "ss_sym_rk4"]:
+            fibres = [Fibre(length=1.0, beta=[0.0, 0.0, -1.0], gamma=1.0,
+                            total_steps=50, traces=5, method=method,
+                            fuse_half_steps=fuse) for fuse in [False, True]]
+            A_outs = [fibre(domain, A_in) for fibre in fibres]
+            storages = [fibre.stepper.storage for fibre in fibres]
+
+            self.assertTrue(np.allclose(A_outs[0], A_outs[1]))
+            self.assertEqual(len(storages[1].As), 6)
+            self.assertTrue(np.allclose(storages[0].As, storages[1].As))
+            self.assertLess(storages[1].fft_total, storages[0].fft_total)
+
+    def test_fuse_half_steps_stop(self):
+        """ Fused half-steps should store traces up to a stop condition """
+        from pyofss.domain import Domain
+        from pyofss.modules.sech import Sech
+        from pyofss.modules.condition import PeakPower
+
+        domain = Domain(bit_width=50.0, samples_per_bit=256)
+        A_in = Sech(peak_power=4.0, width=1.0)(domain,
+                                                np.zeros(256, complex))
+
+        fibres = [Fibre(length=0.5 * np.pi, beta=[0.0, 0.0, -1.0],
+                        gamma=1.0, total_steps=100, traces=5,
+                        method="ss_sym_rk4", stop_interval=7,
+                        stop_conditions=[PeakPower(10.0)],
+                        fuse_half_steps=fuse) for fuse in [False, True]]
+        A_outs = [fibre(domain, A_in) for fibre in fibres]
+        steppers = [fibre.stepper for fibre in fibres]
+
+        self.assertIsNotNone(steppers[0].stop_z)
+        self.assertEqual(steppers[1].stop_z, steppers[0].stop_z)
+        self.assertTrue(np.allclose(A_outs[0], A_outs[1]))
+
+        # Traces spaced uniformly over [0, stop_z]:
+        for stepper in steppers:
+            self.assertEqual(len(stepper.storage.As), 6)
+            self.assertAlmostEqual(stepper.storage.z[-1], stepper.stop_z)
+        self.assertTrue(np.allclose(steppers[0].storage.As,
+                                    steppers[1].storage.As, atol=1.0e-2))
+
+    def test_vector(self):
+        """ Vector fibre should reduce to scalar propagation """
+        from pyofss.domain import Domain
+        from pyofss.modules.sech import Sech
+
+        domain = Domain(bit_width=50.0, samples_per_bit=256)
+        A = Sech(peak_power=1.0, width=1.0)(domain, np.zeros(256, complex))
+        parameters = {"length": 1.0, "beta": [0.0, 0.0, -1.0],
+                      "total_steps": 50}
+
+        # Single polarisation (no coupling):
+        A_scalar = Fibre(gamma=1.0, **parameters)(domain, A)
+        As_out = Fibre(gamma=1.0, sim_type="vector", **parameters)(
+            domain, [A, np.zeros(256, complex)])
+
+        self.assertEqual(As_out.shape, (2, 256))
+        self.assertTrue(np.allclose(As_out[0], A_scalar))
+        self.assertTrue(np.allclose(As_out[1], 0.0))
+
+        # Manakov equation is independent of the polarisation state:
+        A_scalar = Fibre(gamma=8.0 / 9.0, **parameters)(domain, A)
+        As_out = Fibre(gamma=1.0, sim_type="vector", manakov=True,
+                       **parameters)(domain, [A / np.sqrt(2.0),
+                                              A / np.sqrt(2.0)])
+
+        self.assertTrue(np.allclose(As_out[0], A_scalar / np.sqrt(2.0)))
+        self.assertTrue(np.allclose(As_out[1], A_scalar / np.sqrt(2.0)))
+
+    def test_vector_birefringence(self):
+        """ Differential group delay should separate polarisations """
+        from pyofss.domain import Domain
+        from pyofss.modules.gaussian import Gaussian
+
+        domain = Domain(bit_width=50.0, samples_per_bit=256)
+        A = Gaussian(peak_power=1.0, width=1.0)(domain,
+                                                np.zeros(256, complex))
+
+        fibre = Fibre(length=1.0, beta=([0.0, 2.0], [0.0, -2.0]),
+                      gamma=0.0, sim_type="vector")
+        As_out = fibre(domain, [A, A])
+
+        self.assertEqual(fibre.linearity.factor.shape, (2, 256))
+        # Peaks are delayed by +/- beta_1 L:
+        t_peaks = [domain.t[np.argmax(np.abs(A_out))] for A_out in As_out]
+        self.assertAlmostEqual(t_peaks[0] - t_peaks[1], 4.0, places=0)
+
+    def test_nonlinear_tolerance(self):
+        """ Low-power steps should be linear, until power recovers """
+        from pyofss.domain import Domain
+        from pyofss.modules.sech import Sech
+        from pyofss.modules.piecewise import Piecewise
+
+        domain = Domain(bit_width=50.0, samples_per_bit=256)
+        A_in = Sech(peak_power=1.0, width=1.0)(domain,
+                                                np.zeros(256, complex))
+
+        # Loss over the first half, then distributed gain:
+        alpha = Piecewise([5.0], [1.0, -1.0])
+
+        # Adaptive steps are longer, so have a larger nonlinear phase:
+        for (method, tolerance) in [("rk4ip", 1.0e-3), ("ss_sym_rk4", 1.0e-3),
+                                    ("ark4ip", 3.0e-3)]:
+            fibres = [Fibre(length=10.0, alpha=alpha, beta=[0.0, 0.0, -1.0],
+                            gamma=1.0, total_steps=100, method=method,
+                            fuse_half_steps=True, nonlinear_tolerance=tol)
+                      for tol in [None, tolerance]]
+            A_outs = [fibre(domain, A_in) for fibre in fibres]
+            storages = [fibre.stepper.storage for fibre in fibres]
+
+            self.assertTrue(np.allclose(A_outs[0], A_outs[1], atol=1.0e-2))
+            self.assertLess(storages[1].fft_total, storages[0].fft_total)
+            self.assertEqual(fibres[0].stepper.linear_steps, 0)
+            self.assertGreater(fibres[1].stepper.linear_steps, 0)
+
+        # Power recovers, so the final steps are not linear:
+        stepper = fibres[1].stepper
+        self.assertLess(stepper.linear_steps, len(stepper.storage.step_sizes))
+
+    def test_workspace(self):
+        """ Workspace methods should match, reusing their arrays """
+        from pyofss.domain import Domain
+        from pyofss.modules.sech import Sech
+
+        domain = Domain(bit_width=50.0, samples_per_bit=256)
+        A_in = Sech(peak_power=1.0, width=1.0)(domain,
+                                                np.zeros(256, complex))
+
+        for method in ["rk4ip", "ss_sym_rk4", "ss_sym_midpoint", "ark4ip"]:
+            fibres = [Fibre(length=1.0, beta=[0.0, 0.0, -1.0], gamma=1.0,
+                            total_steps=20, method=method,
+                            use_workspace=workspace)
+                      for workspace in [False, True]]
+            A_outs = [fibre(domain, A_in) for fibre in fibres]
+
+            self.assertTrue(np.allclose(A_outs[0], A_outs[1]))
+
+            workspace = fibres[1].stepper.solver.workspace
+            buffers = dict(workspace.buffers)
+            fibres[1](domain, A_in)
+            self.assertEqual(len(workspace), 3 if method != "ss_sym_midpoint"
+                             else 2)
+            for (key, buffer) in workspace.buffers.items():
+                self.assertIs(buffer, buffers[key])
+
+    def test_erk4ip(self):
+        """ Embedded method should reuse evaluations, with fewer ffts """
+        from pyofss.domain import Domain
+        from pyofss.modules.sech import Sech
+
+        domain = Domain(bit_width=50.0, samples_per_bit=256)
+        A_in = Sech(peak_power=4.0, width=1.0)(domain,
+                                                np.zeros(256, complex))
+        parameters = {"length": 0.5 * np.pi, "beta": [0.0, 0.0, -1.0],
+                      "gamma": 1.0}
+
+        A_reference = Fibre(method="rk4ip", total_steps=2000,
+                            **parameters)(domain, A_in)
+
+        fibres = [Fibre(method=method, **parameters)
+                  for method in ["ark4ip", "aerk4ip"]]
+
+        # Count nonlinear evaluations:
+        calls = []
+        non = fibres[1].nonlinearity.non
+        fibres[1].nonlinearity.non = lambda A, z: calls.append(z) or non(A, z)
+
+        for fibre in fibres:
+            self.assertTrue(np.allclose(fibre(domain, A_in), A_reference,
+                                        atol=1.0e-4))
+
+        storages = [fibre.stepper.storage for fibre in fibres]
+        self.assertLess(storages[1].fft_total, 0.5 * storages[0].fft_total)
+
+        # Four linear steps (eight transforms) and four nonlinear evaluations
+        # per attempt, plus a single evaluation for the first step:
+        attempts = storages[1].fft_total // 8
+        self.assertEqual(len(calls), 4 * attempts + 1)
+
+    def test_erk4ip_profile(self):
+        """ Embedded method should only discard evaluations at boundaries """
+        from pyofss.domain import Domain
+        from pyofss.modules.sech import Sech
+        from pyofss.modules.piecewise import Piecewise
+
+        domain = Domain(bit_width=50.0, samples_per_bit=256)
+        A_in = Sech(peak_power=4.0, width=1.0)(domain,
+                                                np.zeros(256, complex))
+        beta = Piecewise([0.3], [[0.0, 0.0, -1.0], [0.0, 0.0, -0.5]])
+
+        fibre = Fibre(length=0.5 * np.pi, beta=beta, gamma=1.0,
+                      method="aerk4ip")
+
+        calls = []
+        non = fibre.nonlinearity.non
+        fibre.nonlinearity.non = lambda A, z: calls.append(z) or non(A, z)
+        fibre(domain, A_in)
+
+        # As above, plus a single evaluation after the boundary:
+        attempts = fibre.stepper.storage.fft_total // 8
+        self.assertEqual(len(calls), 4 * attempts + 2)
+
+    def test_conservation(self):
+        """ Photon number control should need one transform per step """
+        from pyofss.domain import Domain
+        from pyofss.modules.sech import Sech
+
+        domain = Domain(bit_width=50.0, samples_per_bit=256)
+        A_in = Sech(peak_power=4.0, width=1.0)(domain,
+                                                np.zeros(256, complex))
+        parameters = {"length": 0.5 * np.pi, "beta": [0.0, 0.0, -1.0],
+                      "gamma": 1.0, "alpha": 0.1}
+
+        A_reference = Fibre(method="rk4ip", total_steps=2000,
+                            **parameters)(domain, A_in)
+
+        fibre = Fibre(method="ark4ip", local_error=1.0e-9,
+                      error_control="conservation", **parameters)
+        A_out = fibre(domain, A_in)
+        self.assertTrue(np.allclose(A_out, A_reference, atol=1.0e-3))
+
+        # Eight transforms for each rk4ip step, and one for photon number:
+        storage = fibre.stepper.storage
+        self.assertEqual(storage.fft_total % 9, 1)
+
+        # Photon number of an exact linear step (with loss) is unchanged:
+        A_linear = fibre.linear(A_in, 0.1)
+        self.assertAlmostEqual(fibre.photon_error(A_in, A_linear, 0.1), 0.0)
+
+    def test_gamma_spectrum(self):
+        """ Split-step and RK4IP should converge with gamma(omega) """
+        from pyofss.domain import Domain
+        from pyofss.modules.sech import Sech
+        from pyofss.modules.nonlinearity import GammaSpectrum
+
+        domain = Domain(bit_width=20.0, samples_per_bit=256)
+        A_in = Sech(peak_power=4.0, width=1.0)(domain,
+                                                np.zeros(256, complex))
+        gamma = GammaSpectrum([domain.nu[0], domain.nu[-1]], [0.5, 1.5],
+                              x_type="nu")
+        parameters = {"length": 0.5, "beta": [0.0, 0.0, -1.0],
+                      "gamma": gamma}
+
+        A_reference = Fibre(method="rk4ip", total_steps=1000,
+                            **parameters)(domain, A_in)
+
+        def error(method, total_steps):
+            A_out = Fibre(method=method, total_steps=total_steps,
+                          **parameters)(domain, A_in)
+            return np.max(np.abs(A_out - A_reference))
+
+        # Errors should fall with step-size, rather than settle at a
+        # difference due to the exponential term:
+        self.assertLess(error("ss_reduced", 800),
+                        0.1 * error("ss_reduced", 50))
+        self.assertLess(error("ss_sym_rk4", 800), 1.0e-5)
+
+    def test_gamma_spectrum_zeros(self):
+        """ Flat gamma(omega) should match gamma for a zero-tailed pulse """
+        from pyofss.domain import Domain
+        from pyofss.modules.gaussian import Gaussian
+        from pyofss.modules.nonlinearity import GammaSpectrum
+
+        domain = Domain(bit_width=100.0, samples_per_bit=256)
+        A_in = Gaussian(peak_power=4.0, width=1.0)(domain,
+                                                    np.zeros(256, complex))
+        self.assertTrue(np.any(A_in == 0.0))
+
+        flat = GammaSpectrum([1000.0, 2000.0], [1.0, 1.0])
+        parameters = {"length": 0.5, "beta": [0.0, 0.0, -1.0],
+                      "total_steps": 100}
+
+        for method in ["ss_simple", "ss_symmetric"]:
+            A_spectral = Fibre(method=method, gamma=flat,
+                               **parameters)(domain, A_in)
+            A_scalar = Fibre(method=method, gamma=1.0,
+                             **parameters)(domain, A_in)
+
+            self.assertTrue(np.all(np.isfinite(A_spectral)))
+            self.assertTrue(np.allclose(A_spectral, A_scalar))
+
 
 if __name__ == "__main__":
     unittest.main()
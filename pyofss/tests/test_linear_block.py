@@ -0,0 +1,130 @@
+
+"""
+    Copyright (C) 2012  David Bolt
+
+    This file is part of pyofss.
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+from pyofss.domain import Domain
+from pyofss.system import System
+from pyofss.modules.gaussian import Gaussian
+from pyofss.modules.fibre import Fibre
+from pyofss.modules.filter import Filter
+from pyofss.modules.amplifier import Amplifier
+from pyofss.modules.linear_block import LinearBlock, LinearBlockError
+from pyofss.modules.linear_block import NotLinearError, fuse_linear_modules
+
+import numpy as np
+from numpy.testing.utils import assert_array_almost_equal
+
+import unittest2
+
+
+class DefaultParameters(unittest2.TestCase):
+    """ Test default parameters. """
+    def test_name(self):
+        """ Should use name of last module if no name given """
+        block = LinearBlock([Filter(), Amplifier(gain=3.0)])
+        self.assertEqual(block.name, "amplifier")
+
+    def test_no_modules(self):
+        """ Should fail if no modules are given """
+        self.assertRaises(LinearBlockError, LinearBlock, [])
+
+    def test_bad_repeats(self):
+        """ Should fail unless repeats is a positive integer """
+        self.assertRaises(LinearBlockError, LinearBlock, [Filter()], None, 0)
+        self.assertRaises(LinearBlockError, LinearBlock, [Filter()], None, 1.5)
+
+
+class CheckFunctions(unittest2.TestCase):
+    """ Test fusion of linear modules. """
+    def setUp(self):
+        self.domain = Domain(bit_width=50.0, samples_per_bit=256)
+
+    def test_fuse(self):
+        """ Should fuse consecutive linear modules only """
+        modules = [Gaussian(), Fibre(beta=[0.0, 0.0, 1.0]), Filter(),
+                   Amplifier(gain=3.0), Fibre("nl", gamma=1.0),
+                   Filter("last")]
+        fused = fuse_linear_modules(self.domain, modules)
+
+        self.assertEqual(len(fused), 4)
+        self.assertIsInstance(fused[1], LinearBlock)
+        self.assertEqual(len(fused[1].modules), 3)
+        self.assertIs(fused[2], modules[4])
+        self.assertIs(fused[3], modules[5])
+
+    def test_nonlinear(self):
+        """ Should fail to apply a block containing a nonlinear fibre """
+        block = LinearBlock([Filter(), Fibre(gamma=1.0)])
+        self.assertIsNone(block.linear_transfer(self.domain))
+        self.assertRaises(NotLinearError, block, self.domain, None)
+
+    def test_compile(self):
+        """ Compiled system should match the uncompiled system """
+        def make_system():
+            system = System(self.domain)
+            system.add(Gaussian(peak_power=1.0, width=1.0))
+            system.add(Fibre("link", length=2.0, alpha=0.1,
+                             beta=[0.0, 0.0, -1.0, 0.1]))
+            system.add(Amplifier(gain=0.868588963807))
+            system.add(Filter(width_nu=1.0, m=2))
+            return system
+
+        reference = make_system()
+        reference.run()
+
+        system = make_system()
+        system.compile()
+        system.run()
+
+        self.assertEqual(len(system.stages), 2)
+        self.assertIn("filter", system.fields)
+        assert_array_almost_equal(system.field, reference.field)
+
+        # Changing a module after compile should change the result:
+        for changed in [reference, system]:
+            changed["filter"].width_nu = 0.05
+            changed["link"].length = 1.0
+            changed.clear()
+            changed.run()
+        assert_array_almost_equal(system.field, reference.field)
+
+        system.add(Filter("extra"))
+        self.assertIsNone(system.stages)
+
+    def test_repeats(self):
+        """ Repeated block should match propagation through each span """
+        span = [Fibre(length=0.5, alpha=0.2, beta=[0.0, 0.0, -1.0, 0.1]),
+                Amplifier(gain=0.434294481904), Filter(width_nu=2.0)]
+        A_in = Gaussian(peak_power=1.0, width=1.0)(
+            self.domain, np.zeros(self.domain.total_samples, complex))
+
+        A_reference = A_in
+        for n in range(8):
+            for module in span:
+                A_reference = module(self.domain, A_reference)
+
+        block = LinearBlock(span, "spans", repeats=8)
+        assert_array_almost_equal(block(self.domain, A_in), A_reference)
+
+        transfer = block.linear_transfer(self.domain)
+        self.assertIs(block.linear_transfer(self.domain), transfer)
+
+
+if __name__ == "__main__":
+    unittest2.main()
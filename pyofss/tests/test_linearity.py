@@ -18,8 +18,11 @@
     along with this program.  If not, see <http://www.gnu.org/licenses/>.
 """
 
+from pyofss.domain import Domain
 from pyofss.modules.linearity import Linearity
 
+import numpy as np
+
 import unittest2
 
 
@@ -35,5 +38,39 @@ class DefaultParameters(unittest2.TestCase):
                          linearity.default_linearity)
         self.assertEqual(linearity.exp_lin, linearity.default_exp_f)
 
+
+class CheckCache(unittest2.TestCase):
+    """ Test caching of exponential factors. """
+    def test_step_sizes(self):
+        """ Should cache one exponential factor per step-size """
+        domain = Domain(samples_per_bit=64)
+        linearity = Linearity(beta=[0.0, 0.0, 1.0], use_cache=True,
+                              cache_size=2)
+        linearity(domain)
+        A = np.ones(domain.total_samples, complex)
+
+        for h in [0.1, 0.2, 0.1, 0.3]:
+            A_cached = linearity.exp_lin(A, h)
+            self.assertTrue(np.allclose(A_cached,
+                                        linearity.default_exp_f(A, h)))
+
+        self.assertEqual(len(linearity.cache), 2)
+        self.assertEqual(linearity.cache.hits, 1)
+        self.assertEqual(linearity.cache.misses, 3)
+
+    def test_domain(self):
+        """ Should not reuse exponential factors for a different domain """
+        linearity = Linearity(beta=[0.0, 0.0, 1.0], use_cache=True)
+
+        for samples_per_bit in [64, 128]:
+            domain = Domain(samples_per_bit=samples_per_bit)
+            linearity(domain)
+            A = np.ones(domain.total_samples, complex)
+            A_cached = linearity.exp_lin(A, 0.1)
+            self.assertEqual(A_cached.shape, A.shape)
+
+        self.assertEqual(linearity.cache.hits, 0)
+
+
 if __name__ == "__main__":
     unittest2.main()
@@ -0,0 +1,79 @@
+
+"""
+    Copyright (C) 2012  David Bolt
+
+    This file is part of pyofss.
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+from pyofss.domain import Domain
+from pyofss.field import spectral_power
+from pyofss.modules.loss import LossSpectrum, UnknownTypeError
+from pyofss.modules.linearity import Linearity, convert_alpha_to_linear
+from pyofss.modules.fibre import Fibre
+
+import numpy as np
+
+import unittest2
+
+
+class BadParameters(unittest2.TestCase):
+    """ Test response to bad parameters. """
+    def test_wrong_type(self):
+        """ Should fail if x_type or y_type is unknown """
+        self.assertRaises(UnknownTypeError, LossSpectrum,
+                          [1.0, 2.0], [1.0, 2.0], "wavelength")
+        self.assertRaises(UnknownTypeError, LossSpectrum,
+                          [1.0, 2.0], [1.0, 2.0], "lambda", "percent")
+
+
+class CheckFunctions(unittest2.TestCase):
+    """ Test class methods. """
+    def setUp(self):
+        self.domain = Domain(bit_width=20.0, samples_per_bit=256)
+
+    def test_flat(self):
+        """ Flat loss spectrum should match scalar alpha """
+        loss = LossSpectrum([1400.0, 1700.0], [0.2, 0.2])
+        alpha = convert_alpha_to_linear(0.2)
+
+        self.assertTrue(np.allclose(
+            Linearity(alpha=loss, beta=[0.0, 0.0, 1.0])(self.domain),
+            Linearity(alpha=alpha, beta=[0.0, 0.0, 1.0])(self.domain)))
+
+    def test_cache(self):
+        """ Should interpolate once per domain """
+        loss = LossSpectrum([1400.0, 1700.0], [0.2, 0.4])
+        alpha = loss.generate(self.domain)
+
+        self.assertIs(loss.generate(self.domain), alpha)
+        self.assertTrue(np.all(np.diff(alpha) <= 0.0))
+
+    def test_spectral_attenuation(self):
+        """ Each frequency should decay according to its own loss """
+        nu = self.domain.nu
+        loss = LossSpectrum(nu, np.linspace(0.0, 1.0, nu.size),
+                            "nu", "linear")
+
+        A_in = np.zeros(self.domain.total_samples, complex)
+        A_in[0] = 1.0
+        fibre = Fibre(length=2.0, alpha=loss, gamma=0.0)
+        A_out = fibre(self.domain, A_in)
+
+        ratio = spectral_power(A_out) / spectral_power(A_in)
+        self.assertTrue(np.allclose(ratio, np.exp(-2.0 * loss.values)))
+
+if __name__ == "__main__":
+    unittest2.main()
@@ -0,0 +1,129 @@
+
+"""
+    Copyright (C) 2012  David Bolt
+
+    This file is part of pyofss.
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+from pyofss.domain import Domain
+from pyofss.system import System
+from pyofss.network import Network, NetworkError, UnknownNodeError
+from pyofss.modules.gaussian import Gaussian
+from pyofss.modules.fibre import Fibre
+from pyofss.modules.coupler import Splitter, Combiner, Coupler
+from pyofss.modules.coupler import OutOfRangeError
+
+from numpy.testing.utils import assert_array_almost_equal
+import numpy as np
+
+import unittest2
+
+
+class Counter(object):
+    """ Module which counts the number of times it is called. """
+    def __init__(self, name="counter"):
+        self.name = name
+        self.calls = 0
+
+    def __call__(self, domain, field):
+        self.calls += 1
+        return field
+
+
+class BadParameters(unittest2.TestCase):
+    """ Test response to bad parameters. """
+    def test_connections(self):
+        """ Should fail on unknown inputs and duplicate names """
+        network = Network()
+        network.add(Gaussian())
+        self.assertRaises(UnknownNodeError, network.add, Fibre(),
+                          ["missing"])
+        self.assertRaises(NetworkError, network.add, Gaussian())
+
+    def test_coupler(self):
+        """ Should fail when ratios are out of range """
+        self.assertRaises(OutOfRangeError, Splitter, ratios=(0.7, 0.7))
+        self.assertRaises(OutOfRangeError, Coupler, kappa=1.1)
+
+
+class CheckFunctions(unittest2.TestCase):
+    """ Test running a network. """
+    def setUp(self):
+        self.domain = Domain(bit_width=50.0, samples_per_bit=256)
+
+        self.counter = Counter()
+        network = Network(self.domain)
+        network.add(Gaussian(peak_power=1.0, width=1.0))
+        network.add(self.counter, ["gaussian"])
+        network.add(Splitter(ratios=(0.25, 0.75)), ["counter"])
+        network.add(Fibre("upper", beta=[0.0, 0.0, 1.0], gamma=1.0,
+                          total_steps=20), [("splitter", 0)])
+        network.add(Fibre("lower", beta=[0.0, 0.0, 1.0], gamma=1.0,
+                          total_steps=20), [("splitter", 1)])
+        network.add(Coupler(), ["upper", "lower"])
+        network.add(Combiner(), [("coupler", 0), ("coupler", 1)])
+        self.network = network
+
+    def test_branches(self):
+        """ Each branch should match an equivalent serial system """
+        self.network.run()
+        self.assertEqual(self.counter.calls, 1)
+
+        system = System(self.domain)
+        system.add(Gaussian(peak_power=0.25, width=1.0))
+        system.add(Fibre("upper", beta=[0.0, 0.0, 1.0], gamma=1.0,
+                         total_steps=20))
+        system.run()
+
+        assert_array_almost_equal(self.network.fields["upper"], system.field)
+
+    def test_workers(self):
+        """ Concurrent run should match a sequential run """
+        self.network.run()
+        expected = self.network.fields["combiner"]
+
+        self.network.run(workers=2)
+        assert_array_almost_equal(self.network.fields["combiner"], expected)
+
+        # Lossless coupler and combiner of both ports conserves energy:
+        energy_in = np.sum(np.abs(self.network.fields["gaussian"]) ** 2)
+        energy_out = np.sum(np.abs(self.network.output("coupler", 0)) ** 2 +
+                            np.abs(self.network.output("coupler", 1)) ** 2)
+        self.assertAlmostEqual(energy_out / energy_in, 1.0, 6)
+
+    def test_shared_cache(self):
+        """ Cache shared by several threads should remain consistent """
+        from multiprocessing.pool import ThreadPool
+        from pyofss.cache import LRUCache
+
+        cache = LRUCache(8)
+
+        def use_cache(thread):
+            for i in range(2000):
+                key = (thread + i) % 16
+                if cache.get(key) is None:
+                    cache[key] = i
+
+        pool = ThreadPool(4)
+        pool.map(use_cache, range(4))
+        pool.close()
+        pool.join()
+
+        self.assertEqual(len(cache), 8)
+        self.assertEqual(cache.hits + cache.misses, 8000)
+
+if __name__ == "__main__":
+    unittest2.main()
@@ -17,3 +17,267 @@
     You should have received a copy of the GNU General Public License
     along with this program.  If not, see <http://www.gnu.org/licenses/>.
 """
+
+from pyofss import field
+from pyofss.field import fft, ifft
+from pyofss.domain import Domain
+from pyofss.modules.nonlinearity import Nonlinearity, TabulatedRaman
+from pyofss.modules.nonlinearity import GammaSpectrum, NonlinearityError
+from pyofss.modules.kernels import UnknownKernelError, numexpr
+
+import numpy as np
+
+import unittest2
+
+
+class CheckCache(unittest2.TestCase):
+    """ Test caching of domain-dependent arrays. """
+    def test_repeated_calls(self):
+        """ Should reuse arrays for the same domain and parameters """
+        domain = Domain(bit_width=1.0, samples_per_bit=256)
+        nonlinearity = Nonlinearity(gamma=1.0, use_all=True)
+
+        nonlinearity(domain)
+        (omega, h_R) = (nonlinearity.omega, nonlinearity.h_R)
+        nonlinearity(domain)
+
+        self.assertIs(nonlinearity.omega, omega)
+        self.assertIs(nonlinearity.h_R, h_R)
+
+        # A change of parameter requires a new Raman response:
+        nonlinearity.tau_1 = 15.0e-3
+        nonlinearity(domain)
+        self.assertFalse(np.allclose(nonlinearity.h_R, h_R))
+
+        # Changing gamma only affects the (cheap) common factor:
+        nonlinearity.gamma = 2.0
+        nonlinearity(domain)
+        self.assertEqual(nonlinearity.factor, 2.0j)
+        self.assertEqual(len(nonlinearity.cache), 1)
+
+
+class CheckTransforms(unittest2.TestCase):
+    """ Test the general nonlinear expression and its transform count. """
+    def setUp(self):
+        self.domain = Domain(bit_width=1.0, samples_per_bit=256)
+        t = self.domain.t - 0.5
+        self.A = np.exp(-(t / 0.1) ** 2) * np.exp(1j * t)
+
+    def reference(self, nonlinearity, A, h):
+        """ Calculate f_all and exp_f_all using separate transforms. """
+        term_spm = np.abs(A) ** 2
+        convolution = ifft(nonlinearity.h_R * fft(term_spm))
+        shock = 1.0 + nonlinearity.omega * nonlinearity.ss_factor
+        f_R = nonlinearity.f_R
+
+        p = fft(A * (1.0 - f_R) * term_spm + f_R * A * convolution)
+        f_all = ifft(nonlinearity.factor * shock * p)
+
+        p = fft((1.0 - f_R) * term_spm + f_R * convolution)
+        exp_f_all = np.exp(h * ifft(nonlinearity.factor * shock * p)) * A
+
+        return f_all, exp_f_all
+
+    def test_f_all(self):
+        """ Should match separate transforms, using fewer transforms """
+        for (self_steepening, non_transforms) in [(False, 2), (True, 4)]:
+            nonlinearity = Nonlinearity(gamma=1.0, use_all=True,
+                                        self_steepening=self_steepening)
+            nonlinearity(self.domain)
+
+            (f_all, exp_f_all) = self.reference(nonlinearity, self.A, 0.1)
+
+            field.fft_counter = 0
+            self.assertTrue(np.allclose(nonlinearity.non(self.A, 0.0), f_all))
+            self.assertEqual(field.fft_counter, non_transforms)
+            self.assertEqual(nonlinearity.non_transforms, non_transforms)
+
+            field.fft_counter = 0
+            self.assertTrue(np.allclose(
+                nonlinearity.exp_non(self.A, 0.1, self.A), exp_f_all))
+            self.assertEqual(field.fft_counter, 2)
+            self.assertEqual(nonlinearity.exp_non_transforms, 2)
+
+
+class CheckRaman(unittest2.TestCase):
+    """ Test Raman responses. """
+    def setUp(self):
+        self.domain = Domain(bit_width=1.0, samples_per_bit=1024)
+
+    def test_shared(self):
+        """ Should share Raman spectra between nonlinearities """
+        nonlinearities = [Nonlinearity(gamma=1.0, use_all=True)
+                          for n in range(2)]
+        for nonlinearity in nonlinearities:
+            nonlinearity(self.domain)
+
+        self.assertIs(nonlinearities[0].real_raman_response,
+                      nonlinearities[1].real_raman_response)
+
+    def test_tabulated(self):
+        """ Tabulated (unnormalised) model should match analytic model """
+        t = np.linspace(0.0, 1.0, 4096)
+        h_R = np.exp(-t / 32.0e-3) * np.sin(t / 12.2e-3)
+
+        analytic = Nonlinearity(gamma=1.0, use_all=True)
+        tabulated = Nonlinearity(gamma=1.0, use_all=True,
+                                 raman_model=TabulatedRaman(t, h_R))
+        analytic(self.domain)
+        tabulated(self.domain)
+
+        A = np.exp(-((self.domain.t - 0.5) / 0.05) ** 2) + 0j
+        self.assertTrue(np.allclose(analytic.non(A, 0.0),
+                                    tabulated.non(A, 0.0), atol=1.0e-3))
+
+
+class CheckKernels(unittest2.TestCase):
+    """ Test fused elementwise kernels. """
+    def setUp(self):
+        self.domain = Domain(bit_width=1.0, samples_per_bit=256)
+        t = self.domain.t - 0.5
+        self.A = np.exp(-(t / 0.1) ** 2) * np.exp(1j * t)
+        self.As = np.asarray([self.A, 0.5 * self.A[::-1]])
+
+    def compare(self, kernels, check):
+        """ Compare default and wdm functions with numpy expressions. """
+        for (sim_type, gamma, A) in [(None, 2.0, self.A),
+                                     ("wdm", (2.0, 3.0), self.As)]:
+            reference = Nonlinearity(gamma, sim_type)
+            fused = Nonlinearity(gamma, sim_type, kernels=kernels)
+            reference(self.domain)
+            fused(self.domain)
+
+            check(fused.non(A, 0.0), reference.non(A, 0.0))
+            check(fused.exp_non(A, 0.1, A), reference.exp_non(A, 0.1, A))
+
+    def test_fused(self):
+        """ Should match numpy expressions exactly, reusing workspace """
+        self.compare("fused",
+                     lambda x, y: self.assertTrue(np.array_equal(x, y)))
+
+        nonlinearity = Nonlinearity(1.0, kernels="fused")
+        nonlinearity(self.domain)
+        first = nonlinearity.non(self.A, 0.0)
+        buffers = len(nonlinearity.kernel.workspace)
+        second = nonlinearity.non(self.A, 0.0)
+
+        self.assertEqual(len(nonlinearity.kernel.workspace), buffers)
+        # Returned arrays are not workspace arrays, so may be kept:
+        self.assertIsNot(first, second)
+
+    @unittest2.skipIf(numexpr is None, "requires numexpr")
+    def test_numexpr(self):
+        """ Should match numpy expressions to rounding error """
+        self.compare("numexpr",
+                     lambda x, y: self.assertTrue(np.allclose(x, y)))
+
+    def test_unknown(self):
+        """ Should raise an exception for an unknown kernel type """
+        self.assertRaises(UnknownKernelError, Nonlinearity, 1.0,
+                          kernels="unknown")
+
+
+class CheckVector(unittest2.TestCase):
+    """ Test coupled nonlinear terms of two polarisations. """
+    def setUp(self):
+        domain = Domain(bit_width=1.0, samples_per_bit=256)
+        t = domain.t - 0.5
+        self.As = np.asarray([np.exp(-(t / 0.1) ** 2),
+                              0.5j * np.exp(-(t / 0.2) ** 2) * np.exp(1j * t)])
+        self.domain = domain
+
+    def test_exponential(self):
+        """ Exponential factor should agree with coupled terms """
+        h = 1.0e-6
+        for manakov in [False, True]:
+            nonlinearity = Nonlinearity(2.0, "vector", manakov=manakov)
+            nonlinearity(self.domain)
+
+            derivative = (nonlinearity.exp_non(self.As, h, self.As) -
+                          self.As) / h
+            self.assertTrue(np.allclose(derivative,
+                                        nonlinearity.non(self.As, 0.0),
+                                        atol=1.0e-4))
+
+    def test_power(self):
+        """ Should conserve the total power of each sample """
+        nonlinearity = Nonlinearity(2.0, "vector")
+        nonlinearity(self.domain)
+
+        Bs = nonlinearity.exp_non(self.As, 0.5, self.As)
+        self.assertTrue(np.allclose(np.sum(np.abs(Bs) ** 2, axis=0),
+                                    np.sum(np.abs(self.As) ** 2, axis=0)))
+
+
+class CheckGammaSpectrum(unittest2.TestCase):
+    """ Test frequency-dependent nonlinearity. """
+    def setUp(self):
+        self.domain = Domain(bit_width=1.0, samples_per_bit=256)
+        t = self.domain.t - 0.5
+        self.A = np.exp(-(t / 0.1) ** 2) * np.exp(1j * t)
+        self.flat = GammaSpectrum([1000.0, 2000.0], [2.0, 2.0])
+
+    def test_constant(self):
+        """ Constant gamma(omega) should match scalar gamma """
+        for (options, transforms) in [({}, 2),
+                                      ({"self_steepening": True}, 2),
+                                      ({"use_all": True}, 4)]:
+            scalar = Nonlinearity(2.0, **options)
+            spectral = Nonlinearity(self.flat, **options)
+            scalar(self.domain)
+            spectral(self.domain)
+
+            expected = scalar.non(self.A, 0.0)
+            field.fft_counter = 0
+            self.assertTrue(np.allclose(spectral.non(self.A, 0.0), expected))
+            self.assertEqual(field.fft_counter, transforms)
+            self.assertEqual(spectral.non_transforms, transforms)
+
+            expected = scalar.exp_non(self.A, 0.1, self.A)
+            field.fft_counter = 0
+            self.assertTrue(np.allclose(spectral.exp_non(self.A, 0.1, self.A),
+                                        expected))
+            self.assertEqual(field.fft_counter, transforms)
+            self.assertEqual(spectral.exp_non_transforms, transforms)
+
+    def test_zero_tails(self):
+        """ Exponential term should remain finite where the field is zero """
+        A = np.where(np.abs(self.domain.t - 0.5) < 0.3, self.A, 0.0)
+        B = 0.5 * A
+
+        scalar = Nonlinearity(2.0)
+        spectral = Nonlinearity(self.flat)
+        scalar(self.domain)
+        spectral(self.domain)
+
+        A_spectral = spectral.exp_non(A, 0.1, B)
+        self.assertTrue(np.all(np.isfinite(A_spectral)))
+        self.assertTrue(np.allclose(A_spectral, scalar.exp_non(A, 0.1, B)))
+
+    def test_effective_area(self):
+        """ Should calculate gamma from effective area """
+        gamma = GammaSpectrum([1000.0, 2000.0], [80.0, 80.0],
+                              y_type="A_eff")
+        nonlinearity = Nonlinearity(gamma)
+        nonlinearity(self.domain)
+
+        # Approximately 1.3 rad / (W km) for standard fibre:
+        self.assertTrue(np.allclose(nonlinearity.gamma_spectrum, 1.3157,
+                                    atol=1.0e-3))
+
+    def test_bad_type(self):
+        """ Should raise an exception for unknown types """
+        self.assertRaises(NonlinearityError, GammaSpectrum, [1.0], [1.0],
+                          x_type="unknown")
+        self.assertRaises(NonlinearityError, GammaSpectrum, [1.0], [1.0],
+                          y_type="unknown")
+
+    def test_sim_type(self):
+        """ Should raise an exception for a non-default sim_type """
+        for sim_type in ["vector", "wdm"]:
+            self.assertRaises(NonlinearityError, Nonlinearity, self.flat,
+                              sim_type)
+
+
+if __name__ == "__main__":
+    unittest2.main()
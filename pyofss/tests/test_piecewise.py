@@ -0,0 +1,95 @@
+
+"""
+    Copyright (C) 2012  David Bolt
+
+    This file is part of pyofss.
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+from pyofss.modules.piecewise import Piecewise, PiecewiseError
+from pyofss.modules.stepper import Stepper
+
+import numpy as np
+
+import unittest2
+
+
+class BadParameters(unittest2.TestCase):
+    """ Test response to bad parameters. """
+    def test_wrong_length(self):
+        """ Should fail unless there is one more value than boundaries """
+        self.assertRaises(PiecewiseError, Piecewise, [1.0], [1.0])
+
+    def test_not_increasing(self):
+        """ Should fail if boundaries are not increasing """
+        self.assertRaises(PiecewiseError, Piecewise, [2.0, 1.0],
+                          [1.0, 2.0, 3.0])
+
+
+class CheckFunctions(unittest2.TestCase):
+    """ Test class methods. """
+    def test_call(self):
+        """ Should return the value of the segment containing z """
+        profile = Piecewise([1.0, 2.0], ["a", "b", "c"])
+
+        self.assertEqual(profile(0.0), "a")
+        self.assertEqual(profile(1.0), "b")
+        self.assertEqual(profile(1.5), "b")
+        self.assertEqual(profile(5.0), "c")
+
+
+class CheckBoundaries(unittest2.TestCase):
+    """ Test that steppers end steps on boundaries. """
+    def setUp(self):
+        self.profile = Piecewise([0.25, 0.6], [-1.0, 2.0, -0.5])
+        self.starts = []
+
+    def function(self, A, z):
+        """ Function with piecewise-constant rate. """
+        return self.rate * A
+
+    def update(self, z, h):
+        """ Set the rate for the step. """
+        self.starts.append(z)
+        self.rate = self.profile(z + 0.5 * h)
+
+    def exact(self):
+        """ Exact solution at z = 1.0, for A(0) = 1.0 """
+        return np.exp(-1.0 * 0.25 + 2.0 * 0.35 - 0.5 * 0.4)
+
+    def test_standard_stepper(self):
+        """ Should add boundaries to the mesh """
+        stepper = Stepper(f=self.function, total_steps=50,
+                          boundaries=self.profile.boundaries,
+                          update=self.update)
+        A_out = stepper(1.0)
+
+        self.assertIn(0.25, self.starts)
+        self.assertIn(0.6, self.starts)
+        self.assertAlmostEqual(A_out, self.exact(), places=6)
+
+    def test_adaptive_stepper(self):
+        """ Should shorten steps which cross a boundary """
+        stepper = Stepper(f=self.function, method="ARK4", total_steps=10,
+                          boundaries=self.profile.boundaries,
+                          update=self.update)
+        A_out = stepper(1.0)
+
+        self.assertIn(0.25, self.starts)
+        self.assertIn(0.6, self.starts)
+        self.assertAlmostEqual(A_out, self.exact(), places=5)
+
+if __name__ == "__main__":
+    unittest2.main()
@@ -53,7 +53,8 @@ class DefaultParameters(unittest2.TestCase):
     def test_attributes(self):
         """ Should list ODE integration methods """
         self.assertEqual(Solver.explicit_solvers, ["euler", "midpoint", "rk4"])
-        self.assertEqual(Solver.embedded_solvers, ["bs", "rkf", "ck", "dp"])
+        self.assertEqual(Solver.embedded_solvers,
+                         ["bs", "rkf", "ck", "dp", "erk4ip"])
         self.assertEqual(Solver.ss_solvers,
                          ["ss_simple", "ss_symmetric", "ss_reduced",
                           "ss_agrawal", "ss_sym_midpoint", "ss_sym_rk4"])
@@ -283,5 +284,34 @@ class CheckMethods(unittest2.TestCase):
 
         assert_almost_equal(max(np.abs(A_out) ** 2), self.P_analytical, 5)
 
+    def test_workspace(self):
+        """ Workspace methods should match standard methods. """
+        A_in = self.A_in.astype(complex)
+        self.parameters["total_steps"] = 100
+        for method in ["RK4IP", "SS_SYM_RK4", "SS_SYM_MIDPOINT"]:
+            self.parameters["method"] = method
+            A_out = Stepper(**self.parameters)(A_in)
+            A_workspace = Stepper(use_workspace=True,
+                                  **self.parameters)(A_in)
+
+            self.assertTrue(np.allclose(A_workspace, A_out))
+
+
+class CheckWorkspace(unittest2.TestCase):
+    """ Test explicit methods using workspace arrays. """
+    def test_explicit(self):
+        """ Should match standard methods for a complex ODE """
+        f = lambda A, z: 3.0 * np.exp(-4.0 * z) - (2.0 + 1.0j) * A
+        A = np.ones(4, complex)
+
+        for method in ["midpoint", "rk4"]:
+            standard = Solver(method, f)
+            workspace = Solver(method, f, use_workspace=True)
+
+            self.assertTrue(np.allclose(workspace(A, 0.1, 0.05),
+                                        standard(A, 0.1, 0.05)))
+            self.assertEqual(A[0], 1.0)
+
+
 if __name__ == "__main__":
     unittest2.main()
@@ -18,7 +18,9 @@
     along with this program.  If not, see <http://www.gnu.org/licenses/>.
 """
 
-from pyofss.modules.stepper import Stepper
+from pyofss.modules.stepper import Stepper, StepperError
+
+import numpy as np
 
 import unittest2
 
@@ -67,5 +69,122 @@ class CheckFunctions(unittest2.TestCase):
         """ Stepper should integrate function using adaptive step-size """
         pass
 
+
+class CheckStopConditions(unittest2.TestCase):
+    """ Test early termination of stepper. """
+    @staticmethod
+    def growth(A, z):
+        """ Exponential growth, A(z) = exp(z). """
+        return A
+
+    @staticmethod
+    def threshold(z, A):
+        """ Stop once A has doubled. """
+        return np.min(A) >= 2.0
+
+    def test_standard_stepper(self):
+        """ Should stop at first step beyond log(2) """
+        stepper = Stepper(f=self.growth, length=5.0, total_steps=500,
+                          stop_conditions=[self.threshold])
+        A_out = stepper(1.0)
+
+        self.assertAlmostEqual(stepper.stop_z, 0.7, 10)
+        self.assertIs(stepper.stopped_by, self.threshold)
+        self.assertAlmostEqual(A_out, np.exp(0.7), 6)
+
+    def test_stop_interval(self):
+        """ Should only check conditions every stop_interval steps """
+        stepper = Stepper(f=self.growth, length=5.0, total_steps=500,
+                          stop_conditions=[self.threshold], stop_interval=4)
+        stepper(1.0)
+
+        self.assertAlmostEqual(stepper.stop_z, 0.72, 10)
+
+    def test_adaptive_stepper(self):
+        """ Should stop adaptive stepper and space traces up to stop_z """
+        stepper = Stepper(f=self.growth, length=5.0, method="ARK4",
+                          traces=10, stop_conditions=[self.threshold])
+        A_out = stepper(np.ones(8))
+
+        self.assertTrue(np.log(2.0) <= stepper.stop_z < 5.0)
+        self.assertTrue(np.min(A_out) >= 2.0)
+        self.assertAlmostEqual(stepper.storage.z[-1], stepper.stop_z)
+
+    def test_no_stop(self):
+        """ Should integrate to length if no condition is met """
+        stepper = Stepper(f=self.growth, length=0.5, total_steps=50,
+                          stop_conditions=[self.threshold])
+        stepper(1.0)
+
+        self.assertIsNone(stepper.stop_z)
+
+
+class CheckStepRatio(unittest2.TestCase):
+    """ Test quantisation of adaptive step-sizes. """
+    @staticmethod
+    def decay(A, z):
+        """ Simple function. """
+        return -A
+
+    def test_ladder(self):
+        """ Should only use step-sizes on the geometric ladder """
+        stepper = Stepper(f=self.decay, method="ARK4", length=1.0,
+                          total_steps=10, step_ratio=2.0)
+        A_out = stepper(1.0)
+
+        self.assertAlmostEqual(A_out, np.exp(-1.0), places=5)
+
+        # Final step may be shortened to reach length:
+        for (z, h) in stepper.storage.step_sizes[:-1]:
+            k = np.log(h / 0.1) / np.log(2.0)
+            self.assertAlmostEqual(k, np.round(k))
+
+    def test_idempotent(self):
+        """ Should leave a step-size on the ladder unchanged """
+        stepper = Stepper(f=self.decay, method="ARK4", step_ratio=1.5)
+
+        for k in range(-6, 7):
+            h = 0.1 * 1.5 ** k
+            self.assertEqual(stepper.quantise_step(h, 0.1), h)
+            self.assertEqual(stepper.quantise_step(
+                stepper.quantise_step(0.99 * h, 0.1), 0.1),
+                stepper.quantise_step(0.99 * h, 0.1))
+
+
+class CheckConservation(unittest2.TestCase):
+    """ Test step-size control using a conserved quantity. """
+    @staticmethod
+    def rotate(A, z):
+        """ Function conserving |A|. """
+        return 1j * A
+
+    @staticmethod
+    def change(A_in, A_out, h):
+        """ Relative change in |A|^2. """
+        return np.abs(np.abs(A_out) ** 2 - np.abs(A_in) ** 2) / \
+            np.abs(A_in) ** 2
+
+    def test_bad_parameters(self):
+        """ Should fail for unknown error control, or without a function """
+        self.assertRaises(StepperError, Stepper, f=self.rotate,
+                          error_control="global")
+        self.assertRaises(StepperError, Stepper, f=self.rotate,
+                          error_control="conservation")
+
+    def test_adaptive_stepper(self):
+        """ Should take single steps, adapting to the conserved quantity """
+        stepper = Stepper(f=self.rotate, method="ARK4", length=10.0,
+                          total_steps=10, local_error=1.0e-8,
+                          error_control="conservation",
+                          conservation_error=self.change)
+        A_out = stepper(1.0 + 0.0j)
+
+        self.assertAlmostEqual(np.abs(A_out - np.exp(10.0j)), 0.0, places=4)
+
+        # Step-sizes should settle at the accepted error:
+        hs = [h for (z, h) in stepper.storage.step_sizes[:-1]]
+        self.assertLess(max(hs) / min(hs), 2.0)
+
+
 if __name__ == "__main__":
     unittest2.main()
@@ -0,0 +1,152 @@
+
+"""
+    Copyright (C) 2012  David Bolt
+
+    This file is part of pyofss.
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import shutil
+import tempfile
+
+from pyofss import field
+from pyofss.store import ResultStore, DescriptionError, description_key
+from pyofss.modules.gaussian import Gaussian
+from pyofss.modules.fibre import Fibre
+
+from numpy.testing.utils import assert_array_equal
+
+import unittest2
+
+
+def describe(gamma, beta_2=-1.0):
+    """ Description of a simple system. """
+    return {"domain": {"bit_width": 50.0, "samples_per_bit": 256},
+            "modules": [(Gaussian, {"peak_power": 1.0, "width": 1.0}),
+                        (Fibre, {"beta": [0.0, 0.0, beta_2],
+                                 "gamma": gamma, "total_steps": 10})]}
+
+
+class CheckFunctions(unittest2.TestCase):
+    """ Test storing and retrieving runs. """
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.store = ResultStore(self.directory)
+
+    def tearDown(self):
+        self.store.close()
+        shutil.rmtree(self.directory)
+
+    def test_key(self):
+        """ Equal descriptions should share a key """
+        self.assertEqual(description_key(describe(1)),
+                         description_key(describe(1.0)))
+        self.assertNotEqual(description_key(describe(1.0)),
+                            description_key(describe(2.0)))
+
+    def test_functions(self):
+        """ Should not describe functions, which have no key """
+        description = describe(1.0)
+        description["modules"][1][1]["alpha"] = lambda z: 0.1
+
+        self.assertRaises(DescriptionError, description_key, description)
+        self.assertRaises(DescriptionError, self.store.run, description)
+
+    def test_parameter_objects(self):
+        """ Key should depend only on the inputs of parameter objects """
+        from pyofss.domain import Domain
+        from pyofss.modules.loss import LossSpectrum
+        from pyofss.modules.dispersion import Sellmeier
+
+        loss = LossSpectrum([1400.0, 1700.0], [0.3, 0.2])
+        description = describe(1.0)
+        description["modules"][1][1]["alpha"] = loss
+        key = description_key(description)
+
+        # Using the object fills its cache, which should not change the key:
+        loss.generate(Domain())
+        self.assertEqual(description_key(description), key)
+
+        description["modules"][1][1]["alpha"] = LossSpectrum(
+            [1400.0, 1700.0], [0.3, 0.2])
+        self.assertEqual(description_key(description), key)
+
+        description["modules"][1][1]["alpha"] = LossSpectrum(
+            [1400.0, 1700.0], [0.3, 0.25])
+        self.assertNotEqual(description_key(description), key)
+
+        description["modules"][1][1]["beta"] = Sellmeier()
+        key = description_key(description)
+        description["modules"][1][1]["beta"] = Sellmeier()
+        self.assertEqual(description_key(description), key)
+
+        description["modules"][1][1]["beta"] = Sellmeier(
+            waveguide=lambda Lambda: 0.001)
+        self.assertRaises(DescriptionError, description_key, description)
+
+    def test_run(self):
+        """ Should only compute a run once """
+        description = describe(1.0)
+        self.assertNotIn(description, self.store)
+
+        result = self.store.run(description)
+        self.assertIn(description, self.store)
+
+        field.fft_counter = 0
+        stored = self.store.run(description)
+        self.assertEqual(field.fft_counter, 0)
+
+        assert_array_equal(stored["field"], result["field"])
+        assert_array_equal(stored["fields"]["gaussian"],
+                           result["fields"]["gaussian"])
+
+        # Reopening the store should find the same run:
+        self.store.close()
+        self.store = ResultStore(self.directory)
+        self.assertIn(description, self.store)
+
+    def test_query(self):
+        """ Should select runs by parameter range """
+        keys = dict((gamma, self.store.put(describe(gamma),
+                                           {"field": [0.0], "fields": {}}))
+                    for gamma in [0.5, 1.0, 1.5, 2.0])
+
+        self.assertEqual(self.store.query(**{"fibre.gamma": (0.8, 1.5)}),
+                         sorted([keys[1.0], keys[1.5]]))
+        self.assertEqual(self.store.query(**{"fibre.gamma": (None, 0.5),
+                                             "fibre.beta.2": (-1.0, -1.0)}),
+                         [keys[0.5]])
+        self.assertEqual(len(self.store.query()), 4)
+
+    def test_evict(self):
+        """ Should evict least recently used runs """
+        keys = [self.store.put(describe(gamma),
+                               {"field": [0.0], "fields": {}})
+                for gamma in [0.5, 1.0, 1.5]]
+        self.store.load(keys[0])
+
+        self.assertEqual(self.store.evict(max_age=3600.0), [])
+
+        size = self.store.connection.execute(
+            "SELECT size FROM runs").fetchone()[0]
+        removed = self.store.evict(max_size=2 * size)
+        self.assertEqual(len(removed), 1)
+        self.assertNotIn(keys[0], removed)
+        self.assertEqual(len(self.store.query()), 2)
+
+        self.assertEqual(len(self.store.evict(max_age=-1.0)), 2)
+
+if __name__ == "__main__":
+    unittest2.main()